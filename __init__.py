@@ -12,6 +12,7 @@ from homeassistant.const import (
     CONF_METHOD,
     CONF_NAME,
     CONF_PORT,
+    CONF_SCAN_INTERVAL,
     CONF_TIMEOUT,
     CONF_TYPE,
     CONF_HOST,
@@ -20,7 +21,12 @@ import homeassistant.helpers.config_validation as cv
 
 from .const import (
     NEPTUN_DOMAIN as DOMAIN,
+    ATTR_BAUDRATES,
+    ATTR_COUNTERS,
     ATTR_HUB,
+    ATTR_PORT,
+    ATTR_SCAN,
+    ATTR_UNITS,
     ATTR_VALVE,
     ATTR_VALUE,
     CONF_HUBS,
@@ -33,7 +39,26 @@ from .const import (
     CONF_USER,
     CONF_PASSWORD,
     CONF_VALVES,
+    CONF_WIRELESS_SENSORS,
+    CONF_METERS,
+    CONF_CLOSE_ON_ALARM,
+    CONF_UNIT,
+    CONF_KEEPALIVE,
+    CONF_FAST_SCAN_INTERVAL,
+    CONF_TOPIC_PREFIX,
+    CONF_BUFFER_SIZE,
+    CONF_COMMAND_QUEUE_SIZE,
+    DEFAULT_KEEPALIVE,
+    DEFAULT_TOPIC_PREFIX,
+    DEFAULT_MQTT_BUFFER_SIZE,
+    DEFAULT_COMMAND_QUEUE_SIZE,
+    NEPTUN_UNIT,
+    METER_SLOTS,
+    NETWORK_TYPES,
+    WIRELESS_SLOTS,
 )
+from .coordinator import DEFAULT_FAST_SCAN_INTERVAL, DEFAULT_SCAN_INTERVAL
+from .discovery import DISCOVERY_BAUDRATES
 from .neptun import async_neptun_setup
 
 # def number(value: Any) -> int | float:
@@ -55,20 +80,55 @@ from .neptun import async_neptun_setup
 #         raise vol.Invalid(f"invalid number {value}") from err
 
 
+SERIAL_CONNECTION_SCHEMA = vol.Schema(
+    {
+        vol.Required(CONF_TYPE): "serial",
+        vol.Optional(CONF_METHOD, default="rtu"): vol.Any("rtu", "ascii"),
+        vol.Optional(CONF_BAUDRATE, default=9600): cv.positive_int,
+        vol.Optional(CONF_BYTESIZE, default=8): vol.Any(5, 6, 7, 8),
+        vol.Required(CONF_PORT): cv.string,
+        vol.Optional(CONF_PARITY, default="N"): vol.Any("E", "O", "N"),
+        vol.Optional(CONF_STOPBITS, default=1): vol.Any(1, 2),
+        vol.Optional(CONF_TIMEOUT, default=1): cv.positive_int,
+    }
+)
+
+NETWORK_CONNECTION_SCHEMA = vol.Schema(
+    {
+        vol.Required(CONF_TYPE): vol.In(NETWORK_TYPES),
+        vol.Required(CONF_HOST): cv.string,
+        vol.Optional(CONF_PORT, default=502): cv.port,
+        vol.Optional(CONF_TIMEOUT, default=1): cv.positive_int,
+        vol.Optional(CONF_KEEPALIVE, default=DEFAULT_KEEPALIVE): cv.positive_int,
+    }
+)
+
 HUB_SCHEMA = vol.Schema(
     {
         vol.Required(CONF_NAME): cv.string,
-        vol.Required(CONF_CONNECTION): {
-            vol.Required(CONF_TYPE): "serial",
-            vol.Optional(CONF_METHOD, default="rtu"): vol.Any("rtu", "ascii"),
-            vol.Optional(CONF_BAUDRATE, default=9600): cv.positive_int,
-            vol.Optional(CONF_BYTESIZE, default=8): vol.Any(5, 6, 7, 8),
-            vol.Required(CONF_PORT): cv.string,
-            vol.Optional(CONF_PARITY, default="N"): vol.Any("E", "O", "N"),
-            vol.Optional(CONF_STOPBITS, default=1): vol.Any(1, 2),
-            vol.Optional(CONF_TIMEOUT, default=1): cv.positive_int,
-        },
+        vol.Required(CONF_CONNECTION): vol.Any(
+            SERIAL_CONNECTION_SCHEMA, NETWORK_CONNECTION_SCHEMA
+        ),
+        vol.Optional(CONF_UNIT, default=NEPTUN_UNIT): vol.All(
+            vol.Coerce(int), vol.Range(min=1, max=247)
+        ),
+        vol.Optional(CONF_SCAN_INTERVAL, default=DEFAULT_SCAN_INTERVAL): vol.All(
+            cv.time_period, cv.positive_timedelta
+        ),
+        vol.Optional(
+            CONF_FAST_SCAN_INTERVAL, default=DEFAULT_FAST_SCAN_INTERVAL
+        ): vol.All(cv.time_period, cv.positive_timedelta),
         vol.Optional(CONF_VALVES): vol.All(cv.ensure_list, [cv.string]),
+        vol.Optional(CONF_WIRELESS_SENSORS): vol.All(
+            cv.ensure_list, [cv.string], vol.Length(max=WIRELESS_SLOTS)
+        ),
+        vol.Optional(CONF_METERS): vol.All(
+            cv.ensure_list, [cv.string], vol.Length(max=METER_SLOTS)
+        ),
+        # valves, numbered from 1, closed as soon as an alarm is detected
+        vol.Optional(CONF_CLOSE_ON_ALARM): vol.All(
+            cv.ensure_list, [vol.All(vol.Coerce(int), vol.Range(min=1, max=2))]
+        ),
     }
 )
 
@@ -78,6 +138,13 @@ MQTT_SCHEMA = vol.Schema(
         vol.Required(CONF_PORT): cv.port,
         vol.Required(CONF_USER): cv.string,
         vol.Required(CONF_PASSWORD): cv.string,
+        vol.Optional(CONF_TOPIC_PREFIX, default=DEFAULT_TOPIC_PREFIX): cv.string,
+        vol.Optional(
+            CONF_BUFFER_SIZE, default=DEFAULT_MQTT_BUFFER_SIZE
+        ): cv.positive_int,
+        vol.Optional(
+            CONF_COMMAND_QUEUE_SIZE, default=DEFAULT_COMMAND_QUEUE_SIZE
+        ): cv.positive_int,
     }
 )
 
@@ -116,6 +183,32 @@ SERVICE_SET_ATTR_SCHEMA = vol.Schema(
     }
 )
 
+SERVICE_SET_METERS_SCHEMA = vol.Schema(
+    {
+        vol.Required(ATTR_HUB): cv.string,
+        vol.Required(ATTR_COUNTERS): {
+            vol.All(vol.Coerce(int), vol.Range(min=1, max=METER_SLOTS)): vol.All(
+                vol.Coerce(int), vol.Range(min=0, max=0xFFFFFFFF)
+            )
+        },
+    }
+)
+
+SERVICE_DISCOVER_SCHEMA = vol.Schema(
+    {
+        vol.Required(ATTR_PORT): cv.string,
+        vol.Optional(ATTR_BAUDRATES, default=list(DISCOVERY_BAUDRATES)): vol.All(
+            cv.ensure_list, [cv.positive_int], vol.Length(min=1)
+        ),
+        vol.Optional(ATTR_UNITS): vol.All(
+            cv.ensure_list,
+            [vol.All(vol.Coerce(int), vol.Range(min=1, max=247))],
+            vol.Length(min=1),
+        ),
+        vol.Optional(ATTR_SCAN, default=True): cv.boolean,
+    }
+)
+
 
 async def async_setup(hass, config):
     """Set up Neptun component."""
@@ -125,4 +218,6 @@ async def async_setup(hass, config):
         SERVICE_ONE_VALVE_SCHEMA,
         SERVICE_ALL_VALVES_SCHEMA,
         SERVICE_SET_ATTR_SCHEMA,
+        SERVICE_SET_METERS_SCHEMA,
+        SERVICE_DISCOVER_SCHEMA,
     )
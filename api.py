@@ -0,0 +1,67 @@
+"""HTTP API of the Neptun integration."""
+from __future__ import annotations
+
+from http import HTTPStatus
+
+from aiohttp import web
+
+from homeassistant.components.http import HomeAssistantView
+from homeassistant.const import CONTENT_TYPE_TEXT_PLAIN
+
+from metrics import render_prometheus
+
+
+class NeptunMetricsView(HomeAssistantView):
+    """Serve the transport metrics of all buses in the Prometheus format."""
+
+    url = "/api/neptun/metrics"
+    name = "api:neptun:metrics"
+
+    def __init__(self, buses):
+        """Initialize the view."""
+        self._buses = buses
+
+    async def get(self, request: web.Request) -> web.Response:
+        """Return the metrics text dump."""
+        body = render_prometheus([bus.metrics for bus in self._buses])
+        return web.Response(body=body, content_type=CONTENT_TYPE_TEXT_PLAIN)
+
+
+class NeptunRegisterLogView(HomeAssistantView):
+    """Serve the raw register change log of a hub as a JSON download.
+
+    ``start`` and ``end`` query parameters, in seconds since the epoch,
+    limit the changes returned.
+    """
+
+    url = "/api/neptun/registers/{hub}"
+    name = "api:neptun:registers"
+
+    def __init__(self, coordinators):
+        """Initialize the view."""
+        self._coordinators = coordinators
+
+    async def get(self, request: web.Request, hub: str) -> web.Response:
+        """Return the current registers and the logged changes of a hub."""
+        coordinator = self._coordinators.get(hub)
+        if coordinator is None:
+            return self.json_message("Unknown hub", HTTPStatus.NOT_FOUND)
+        try:
+            start, end = (
+                float(request.query[name]) if name in request.query else None
+                for name in ("start", "end")
+            )
+        except ValueError:
+            return self.json_message("Invalid time range", HTTPStatus.BAD_REQUEST)
+        response = self.json(
+            {
+                "hub": hub,
+                "unit": coordinator.hub.unit,
+                "registers": coordinator.data,
+                "changes": coordinator.log.export(start, end),
+            }
+        )
+        response.headers["Content-Disposition"] = (
+            'attachment; filename="neptun-{}-registers.json"'.format(hub)
+        )
+        return response
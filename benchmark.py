@@ -0,0 +1,416 @@
+"""Performance benchmark of the Neptun integration against simulated modules.
+
+Every run starts simulated gateways (``simulator.py``) serving the
+requested number of hubs and measures:
+
+* hub I/O: status block reads per second through ``NeptunHub``;
+* Home Assistant: p50/p99 latency of a switch service call until the write
+  is confirmed, p50/p99 latency from a module alarm to the binary sensor
+  state, executor threads used and event loop busy time per poll cycle.
+
+    python benchmark.py --hubs 1 10 100 300 --output results.json
+    python benchmark.py --hubs 10 --compare results.json
+
+Results are saved as JSON so runs of different versions can be compared.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from const import NEPTUN_DOMAIN, REGISTER_STATUS
+from bus import NeptunBus
+from neptun import NeptunHub
+from registers import FIELD_ALARM, FIELD_VALVES, RegisterMap, STATUS
+from simulator import SimulatedModule, Simulator
+
+_LOGGER = logging.getLogger(__name__)
+
+BASE_PORT = 15020
+# unit ids served by one simulated gateway
+UNITS_PER_GATEWAY = 200
+EXECUTOR_THREAD_PREFIX = "NeptunBenchWorker"
+ALARM_MASK = STATUS.mask(FIELD_ALARM)
+
+
+class LoopMonitor:
+    """Accumulates the time the event loop spends running callbacks."""
+
+    def __init__(self):
+        """Initialize the monitor."""
+        self.busy = 0.0
+        self._run = None
+
+    def __enter__(self):
+        monitor = self
+        self._run = run = asyncio.events.Handle._run
+
+        def timed_run(handle):
+            start = time.perf_counter()
+            try:
+                return run(handle)
+            finally:
+                monitor.busy += time.perf_counter() - start
+
+        asyncio.events.Handle._run = timed_run
+        return self
+
+    def __exit__(self, *exc_info):
+        asyncio.events.Handle._run = self._run
+
+
+def percentile(values, percent) -> float | None:
+    """Return a percentile of the values, by the nearest rank."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, round(percent / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+def _ms(seconds) -> float | None:
+    return None if seconds is None else round(seconds * 1000, 3)
+
+
+async def async_start_gateways(hub_count, args):
+    """Start simulated gateways, return them with the hub connection configs."""
+    simulators = []
+    hubs = []
+    for first in range(0, hub_count, UNITS_PER_GATEWAY):
+        port = BASE_PORT + len(simulators)
+        units = range(1, min(UNITS_PER_GATEWAY, hub_count - first) + 1)
+        simulator = Simulator(
+            [
+                SimulatedModule(unit, valve_time=args.valve_time)
+                for unit in units
+            ],
+            latency=args.latency,
+            drop_rate=args.drop,
+        )
+        server = await simulator.async_serve_tcp(port=port)
+        simulators.append((simulator, server))
+        for unit in units:
+            hubs.append(
+                {
+                    "name": "hub_{}_{}".format(port, unit),
+                    "unit": unit,
+                    "connection": {
+                        "type": "tcp",
+                        "host": "127.0.0.1",
+                        "port": port,
+                        "timeout": 1,
+                    },
+                }
+            )
+    return simulators, hubs
+
+
+async def async_stop_gateways(simulators):
+    for _, server in simulators:
+        server.close()
+        await server.wait_closed()
+
+
+async def async_bench_hub_io(hub_count, args) -> dict:
+    """Read the status block of every hub as fast as the buses allow."""
+    simulators, hub_configs = await async_start_gateways(hub_count, args)
+    buses = {}
+    hubs = []
+    for conf_hub in hub_configs:
+        conn = conf_hub["connection"]
+        bus = buses.setdefault(NeptunBus.key(conn), NeptunBus(conn))
+        hubs.append(NeptunHub(conf_hub, bus))
+    for hub in hubs:
+        await hub.async_setup()
+    register_count = RegisterMap().register_count
+    transactions = 0
+    failures = 0
+    deadline = time.monotonic() + args.duration
+
+    async def poll(hub):
+        nonlocal transactions, failures
+        while time.monotonic() < deadline:
+            result = await hub.async_read_holding_registers(
+                REGISTER_STATUS, register_count
+            )
+            transactions += 1
+            failures += result is None
+
+    start = time.monotonic()
+    await asyncio.gather(*(poll(hub) for hub in hubs))
+    elapsed = time.monotonic() - start
+    for hub in hubs:
+        await hub.async_close()
+    await async_stop_gateways(simulators)
+    return {
+        "transactions": transactions,
+        "failures": failures,
+        "transactions_per_second": round(transactions / elapsed, 1),
+    }
+
+
+async def async_create_hass(config_dir):
+    """Create a minimal Home Assistant instance with the integration."""
+    from homeassistant import config_entries, core
+    from homeassistant.helpers import (
+        area_registry,
+        device_registry,
+        entity,
+        entity_registry,
+        issue_registry,
+        restore_state,
+    )
+
+    hass = core.HomeAssistant()
+    hass.config.config_dir = config_dir
+    hass.config.skip_pip = True
+    hass.config.set_time_zone("UTC")
+    hass.config_entries = config_entries.ConfigEntries(hass, {})
+    await hass.config_entries.async_initialize()
+    await area_registry.async_load(hass)
+    await device_registry.async_load(hass)
+    await entity_registry.async_load(hass)
+    await issue_registry.async_load(hass)
+    await restore_state.async_load(hass)
+    entity.async_setup(hass)
+    hass.state = core.CoreState.running
+    return hass
+
+
+async def async_wait_state(hass, entity_id, state, timeout):
+    """Wait until an entity reaches a state, returns False on timeout."""
+    if hass.states.is_state(entity_id, state):
+        return True
+    reached = asyncio.Event()
+
+    def state_changed(event):
+        new_state = event.data["new_state"]
+        if event.data["entity_id"] == entity_id and new_state.state == state:
+            reached.set()
+
+    unsub = hass.bus.async_listen("state_changed", state_changed)
+    try:
+        await asyncio.wait_for(reached.wait(), timeout)
+        return True
+    except asyncio.TimeoutError:
+        return False
+    finally:
+        unsub()
+
+
+async def async_bench_home_assistant(hub_count, args) -> dict:
+    """Measure the integration inside Home Assistant."""
+    from homeassistant.setup import async_setup_component
+
+    simulators, hub_configs = await async_start_gateways(hub_count, args)
+    modules = [
+        module for simulator, _ in simulators for module in simulator.modules.values()
+    ]
+    for conf_hub in hub_configs:
+        conf_hub["valves"] = ["{}_valve".format(conf_hub["name"])]
+        conf_hub["scan_interval"] = args.scan_interval
+        conf_hub["fast_scan_interval"] = args.fast_scan_interval
+    config_dir = tempfile.mkdtemp(prefix="neptun-bench-")
+    os.makedirs(os.path.join(config_dir, "custom_components"))
+    os.symlink(
+        os.path.dirname(os.path.abspath(__file__)),
+        os.path.join(config_dir, "custom_components", NEPTUN_DOMAIN),
+    )
+    hass = await async_create_hass(config_dir)
+    # a fresh executor, its threads are the ones used by this run
+    executor = ThreadPoolExecutor(
+        thread_name_prefix="{}_{}".format(EXECUTOR_THREAD_PREFIX, hub_count)
+    )
+    hass.loop.set_default_executor(executor)
+    await async_setup_component(
+        hass, NEPTUN_DOMAIN, {NEPTUN_DOMAIN: {"hubs": hub_configs}}
+    )
+    await hass.async_block_till_done()
+    names = [conf_hub["name"] for conf_hub in hub_configs]
+    samples = names[: args.samples]
+
+    # service call to confirmed write, alternating open and close
+    command_latencies = []
+    valve_mask = STATUS.mask(FIELD_VALVES[0])
+    for round_ in range(args.commands):
+        name = samples[round_ % len(samples)]
+        turn_on = (round_ // len(samples)) % 2 == 0
+        hub = hass.data[NEPTUN_DOMAIN][name].hub
+        start = time.perf_counter()
+        await hass.services.async_call(
+            "switch",
+            "turn_on" if turn_on else "turn_off",
+            {"entity_id": "switch.{}_valve".format(name)},
+            blocking=True,
+        )
+        # the service returns once the write is queued, the acknowledged
+        # write updates the status mirror of the hub
+        while bool(hub.status & valve_mask) != turn_on:
+            if time.perf_counter() - start > args.alarm_timeout:
+                break
+            await asyncio.sleep(0.001)
+        else:
+            command_latencies.append(time.perf_counter() - start)
+    await hass.async_block_till_done()
+
+    # module alarm to binary sensor state
+    alarm_latencies = []
+    missed_alarms = 0
+    for name, module in zip(samples, modules):
+        entity_id = "binary_sensor.neptun_{}".format(name)
+        for raised, state in ((True, "on"), (False, "off")):
+            if raised:
+                module.raise_alarm()
+            else:
+                module.registers[REGISTER_STATUS] &= ~ALARM_MASK
+            start = time.perf_counter()
+            if await async_wait_state(hass, entity_id, state, args.alarm_timeout):
+                alarm_latencies.append(time.perf_counter() - start)
+            else:
+                missed_alarms += 1
+
+    # event loop time per poll cycle while idle
+    reads_before = sum(module.reads for module in modules)
+    with LoopMonitor() as monitor:
+        await asyncio.sleep(args.duration)
+    polls = sum(module.reads for module in modules) - reads_before
+
+    executor_threads = [
+        thread
+        for thread in threading.enumerate()
+        if thread.name.startswith(executor._thread_name_prefix + "_")
+    ]
+    await hass.async_stop()
+    await async_stop_gateways(simulators)
+    return {
+        "command_latency_p50_ms": _ms(percentile(command_latencies, 50)),
+        "command_latency_p99_ms": _ms(percentile(command_latencies, 99)),
+        "alarm_latency_p50_ms": _ms(percentile(alarm_latencies, 50)),
+        "alarm_latency_p99_ms": _ms(percentile(alarm_latencies, 99)),
+        "missed_alarms": missed_alarms,
+        "executor_threads": len(executor_threads),
+        "polls": polls,
+        "loop_ms_per_poll": _ms(monitor.busy / polls) if polls else None,
+    }
+
+
+def _git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _version():
+    manifest = os.path.join(os.path.dirname(os.path.abspath(__file__)), "manifest.json")
+    with open(manifest) as stream:
+        return json.load(stream)["version"]
+
+
+async def async_run(args) -> dict:
+    """Run the benchmark for every hub count."""
+    runs = []
+    for hub_count in args.hubs:
+        _LOGGER.info("Benchmarking {} hubs...".format(hub_count))
+        run = {"hubs": hub_count}
+        run.update(await async_bench_hub_io(hub_count, args))
+        if not args.skip_hass:
+            run.update(await async_bench_home_assistant(hub_count, args))
+        _LOGGER.info("{}".format(run))
+        runs.append(run)
+    return {
+        "version": _version(),
+        "revision": _git_revision(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "settings": {
+            "duration": args.duration,
+            "latency": args.latency,
+            "drop_rate": args.drop,
+            "valve_time": args.valve_time,
+            "scan_interval": args.scan_interval,
+            "fast_scan_interval": args.fast_scan_interval,
+            "commands": args.commands,
+            "samples": args.samples,
+        },
+        "runs": runs,
+    }
+
+
+def compare(results, baseline):
+    """Print the relative change of every metric against a baseline run."""
+    previous = {run["hubs"]: run for run in baseline["runs"]}
+    print(
+        "Compared with {} ({})".format(baseline["version"], baseline.get("revision"))
+    )
+    for run in results["runs"]:
+        old = previous.get(run["hubs"])
+        if old is None:
+            continue
+        print("{} hubs:".format(run["hubs"]))
+        for metric, value in run.items():
+            before = old.get(metric)
+            if metric == "hubs" or not isinstance(value, (int, float)):
+                continue
+            if not isinstance(before, (int, float)) or before == 0:
+                print("  {:<28} {}".format(metric, value))
+                continue
+            print(
+                "  {:<28} {:>12} {:>+8.1f}%".format(
+                    metric, value, 100 * (value - before) / before
+                )
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--hubs", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds")
+    parser.add_argument("--drop", type=float, default=0.0, help="drop rate")
+    parser.add_argument("--valve-time", type=float, default=0.0, help="seconds")
+    parser.add_argument("--scan-interval", type=float, default=10.0)
+    parser.add_argument("--fast-scan-interval", type=float, default=1.0)
+    parser.add_argument("--commands", type=int, default=50)
+    parser.add_argument("--samples", type=int, default=10, help="hubs sampled")
+    parser.add_argument("--alarm-timeout", type=float, default=30.0)
+    parser.add_argument("--skip-hass", action="store_true")
+    parser.add_argument("--output", help="write the results to a JSON file")
+    parser.add_argument("--compare", help="JSON results of a previous run")
+    args = parser.parse_args()
+    if max(args.hubs) > UNITS_PER_GATEWAY * 100:
+        parser.error("too many hubs")
+    logging.basicConfig(level=logging.INFO)
+    logging.getLogger("homeassistant").setLevel(logging.WARNING)
+    logging.getLogger("neptun").setLevel(logging.WARNING)
+
+    results = asyncio.run(async_run(args))
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as stream:
+            json.dump(results, stream, indent=2)
+    if args.compare:
+        with open(args.compare) as stream:
+            compare(results, json.load(stream))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,40 +1,39 @@
 """Support for Neptun Input sensors."""
 from __future__ import annotations
 
-from datetime import timedelta
-import datetime
 import logging
 from typing import Any, Mapping
-from pymodbus.exceptions import ModbusException
 
 import voluptuous as vol
 
 from homeassistant.components.binary_sensor import (
+    BinarySensorDeviceClass,
     BinarySensorEntity,
 )
 from homeassistant.const import (
     CONF_NAME,
 )
-from homeassistant.core import DOMAIN, HomeAssistant
+from homeassistant.core import DOMAIN, HomeAssistant, callback
 from homeassistant.helpers import config_validation as cv
-from homeassistant.helpers.event import async_track_time_interval
 from homeassistant.helpers.typing import ConfigType, DiscoveryInfoType
 
 from .const import (
+    ATTR_BATTERY_LOW,
+    CONF_WIRELESS_SENSORS,
     NEPTUN_DOMAIN,
     REGISTER_STATUS,
-    ATTR_KEYBOARD_LOCKED,
-    MASK_KEYBOARD_LOCKED,
-    ATTR_PESSIMISTIC_WIRELESS_SENSOR,
-    MASK_PESSIMISTIC_WIRELESS_SENSOR,
-    ATTR_VALVE_TWO_GROUPS,
-    MASK_VALVE_TWO_GROUPS,
-    ATTR_WIRELESS_PAIRING,
-    MASK_WIRELESS_PAIRING,
-    ATTR_FLOOR_WASHING,
-    MASK_FLOOR_WASHING,
+    REGISTER_WIRELESS_COUNT,
+)
+from .coordinator import NeptunCoordinator
+from .entity import NeptunEntity
+from .registers import (
+    CONFIG_ATTRIBUTES,
+    FIELD_ALARM,
+    FIELD_LEAK,
+    FIELD_LOST,
+    FIELD_VALUE,
+    wireless_sensor_register,
 )
-from .neptun import NeptunHub
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -48,11 +47,16 @@ async def async_setup_platform(
     """Set up the Neptun binary sensors."""
     sensors = []
 
-    hub: NeptunHub = hass.data[NEPTUN_DOMAIN][discovery_info[CONF_NAME]]
+    coordinator: NeptunCoordinator = hass.data[NEPTUN_DOMAIN][discovery_info[CONF_NAME]]
     _LOGGER.debug("*** Initializing common hub state...")
 
-    sensor = NeptunHubSensor(hub)
+    sensor = NeptunHubSensor(coordinator)
     sensors.append(sensor)
+    wireless = discovery_info.get(CONF_WIRELESS_SENSORS, [])
+    for slot, sensorName in enumerate(wireless):
+        sensor = NeptunWirelessLeakSensor(coordinator, sensorName, slot)
+        sensors.append(sensor)
+        _LOGGER.debug("*** Wireless sensor discovered: {}".format(sensor.name))
     # for valveIndex, valveName in enumerate(discovery_info[CONF_VALVES]):
     #     sensor = NeptunHubSensor(hub, valveName, valveIndex)
     #     sensors.append(sensor)
@@ -61,30 +65,24 @@ async def async_setup_platform(
     async_add_entities(sensors)
 
 
-class NeptunHubSensor(BinarySensorEntity):
+class NeptunHubSensor(NeptunEntity, BinarySensorEntity):
     """Neptun hub binary sensor."""
 
-    def __init__(self, hub):
+    def __init__(self, coordinator: NeptunCoordinator):
         """Initialize the Neptun hub binary sensor."""
-        self._hub = hub
-        self._name = NEPTUN_DOMAIN + "." + hub.name
-        self._attributes = {
-            ATTR_KEYBOARD_LOCKED: False,
-            ATTR_PESSIMISTIC_WIRELESS_SENSOR: False,
-            ATTR_VALVE_TWO_GROUPS: False,
-            ATTR_WIRELESS_PAIRING: False,
-            ATTR_FLOOR_WASHING: False,
-        }
+        self._coordinator = coordinator
+        self._name = NEPTUN_DOMAIN + "." + coordinator.name
+        self._attributes = {attr: False for attr in CONFIG_ATTRIBUTES}
         self._value = None
         self._available = True
-        self._scan_interval = timedelta(seconds=10)
-        self._alarm_mask = 0b00000110
 
     async def async_added_to_hass(self):
         """Handle entity which will be added."""
-        async_track_time_interval(
-            self.hass, self.async_update_by_timer, self._scan_interval
+        self.async_on_remove(
+            self._coordinator.async_add_listener(self._handle_coordinator_update)
         )
+        if self._coordinator.data is not None:
+            self._handle_coordinator_update()
 
     @property
     def name(self):
@@ -119,49 +117,101 @@ class NeptunHubSensor(BinarySensorEntity):
     def extra_state_attributes(self) -> Mapping[str, Any] | None:
         return self._attributes
 
-    def decode_attributes(self, command):
-        """Decodes all Neptun status attributes from the status register value"""
-        self._attributes[ATTR_KEYBOARD_LOCKED] = (
-            command & MASK_KEYBOARD_LOCKED
-        ) == MASK_KEYBOARD_LOCKED
-        self._attributes[ATTR_PESSIMISTIC_WIRELESS_SENSOR] = (
-            command & MASK_PESSIMISTIC_WIRELESS_SENSOR
-        ) == MASK_PESSIMISTIC_WIRELESS_SENSOR
-        self._attributes[ATTR_VALVE_TWO_GROUPS] = (
-            command & MASK_VALVE_TWO_GROUPS
-        ) == MASK_VALVE_TWO_GROUPS
-        self._attributes[ATTR_WIRELESS_PAIRING] = (
-            command & MASK_WIRELESS_PAIRING
-        ) == MASK_WIRELESS_PAIRING
-        self._attributes[ATTR_FLOOR_WASHING] = (
-            command & MASK_FLOOR_WASHING
-        ) == MASK_FLOOR_WASHING
-
-    async def async_update_by_timer(self, now: datetime | None = None) -> None:
-        await self.async_update()
+    def decode_attributes(self, status):
+        """Copies all Neptun status attributes from the decoded status register"""
+        for attr in CONFIG_ATTRIBUTES:
+            self._attributes[attr] = status[attr]
 
     async def async_update(self):
         """Update the state of the sensor."""
+        await self._coordinator.async_request_refresh()
+
+    @callback
+    def _handle_coordinator_update(self) -> None:
+        """Update the sensor state from the hub snapshot."""
         _LOGGER.debug(">>> Updating sensor: {}".format(self.name))
-        result = await self.hass.async_add_executor_job(
-            lambda: self._hub.read_holding_registers(REGISTER_STATUS)
-        )
-        if result is ModbusException:
+        if not self._coordinator.last_update_success:
             self._available = False
-            _LOGGER.error(
-                "Neptun sensor update: Cannot read holding registers: {}".format(result)
-            )
+            _LOGGER.debug("*** No fresh hub snapshot for {}".format(self.name))
         else:
-            _LOGGER.debug("*** Received registers: {}".format(result))
-            # decoder = BinaryPayloadDecoder.fromRegisters(
-            #     current.registers, byteorder=Endian.Big
-            # )
-            # self._currentValue = decoder.decode_16bit_uint()
-            _currentValue = result.registers[0]
-            self.decode_attributes(_currentValue)
-            self._value = (_currentValue & self._alarm_mask) != 0
+            status = self._coordinator.decoded(REGISTER_STATUS)
+            self.decode_attributes(status)
+            self._value = status[FIELD_ALARM]
             self._available = True
-            _LOGGER.debug("*** Current register value: {}".format(_currentValue))
+            _LOGGER.debug(
+                "*** Current register value: {}".format(self._coordinator.status)
+            )
             _LOGGER.debug("*** Current sensor value: {}".format(self._value))
-        self.async_schedule_update_ha_state()
+        self.async_write_changed_state()
         _LOGGER.debug("<<< Sensor {} updated".format(self.name))
+
+
+class NeptunWirelessLeakSensor(NeptunEntity, BinarySensorEntity):
+    """Leak state of a wireless sensor paired with a Neptun hub."""
+
+    def __init__(self, coordinator: NeptunCoordinator, sensorName: str, slot: int):
+        """Initialize the wireless leak sensor."""
+        self._coordinator = coordinator
+        self._name = sensorName
+        self._slot = slot
+        self._register = wireless_sensor_register(slot)
+        self._value = None
+        self._available = False
+        self._attributes = {ATTR_BATTERY_LOW: False}
+
+    async def async_added_to_hass(self):
+        """Handle entity which will be added."""
+        # only pushed when this slot's word or the sensor count changes
+        self.async_on_remove(
+            self._coordinator.async_add_listener(
+                self._handle_coordinator_update,
+                (REGISTER_WIRELESS_COUNT, self._register),
+            )
+        )
+        if self._coordinator.data is not None:
+            self._handle_coordinator_update()
+
+    @property
+    def name(self):
+        """Return the name of the sensor."""
+        return self._name
+
+    @property
+    def is_on(self):
+        """Return True if the sensor detects a leak."""
+        return self._value
+
+    @property
+    def device_class(self) -> str | None:
+        """Return the device class of the sensor."""
+        return BinarySensorDeviceClass.MOISTURE
+
+    @property
+    def should_poll(self):
+        """Return False, the hub coordinator pushes the state."""
+        return False
+
+    @property
+    def available(self) -> bool:
+        """Return True if the sensor is paired and reachable."""
+        return self._available
+
+    @property
+    def extra_state_attributes(self) -> Mapping[str, Any] | None:
+        return self._attributes
+
+    @callback
+    def _handle_coordinator_update(self) -> None:
+        """Decode the slot's status word from the hub snapshot."""
+        if not self._coordinator.last_update_success:
+            self._available = False
+        else:
+            count = self._coordinator.decoded(REGISTER_WIRELESS_COUNT)[FIELD_VALUE]
+            sensor = self._coordinator.decoded(self._register)
+            self._available = self._slot < count and not sensor[FIELD_LOST]
+            self._value = sensor[FIELD_LEAK]
+            self._attributes[ATTR_BATTERY_LOW] = sensor[ATTR_BATTERY_LOW]
+            _LOGGER.debug(
+                "*** Wireless sensor {} state: {}".format(self.name, dict(sensor))
+            )
+        self.async_write_changed_state()
@@ -0,0 +1,387 @@
+"""MQTT bridge publishing Neptun hub state and accepting commands."""
+from __future__ import annotations
+
+import asyncio
+from collections import OrderedDict
+import logging
+import threading
+import time
+
+import paho.mqtt.client as mqtt
+import voluptuous as vol
+
+from homeassistant.const import CONF_HOST, CONF_PORT, STATE_OFF, STATE_ON
+from homeassistant.core import callback
+import homeassistant.helpers.config_validation as cv
+
+from const import (
+    CONF_BUFFER_SIZE,
+    CONF_COMMAND_QUEUE_SIZE,
+    CONF_PASSWORD,
+    CONF_TOPIC_PREFIX,
+    CONF_USER,
+    DEFAULT_COMMAND_QUEUE_SIZE,
+    DEFAULT_MQTT_BUFFER_SIZE,
+    DEFAULT_TOPIC_PREFIX,
+    REGISTER_STATUS,
+    STATUS_MIRROR_MAX_AGE,
+)
+from registers import CONFIG_ATTRIBUTES, FIELD_ALARM, FIELD_VALVES, STATUS
+
+_LOGGER = logging.getLogger(__name__)
+
+PAYLOAD_ONLINE = "online"
+PAYLOAD_OFFLINE = "offline"
+
+
+class CommandQueue:
+    """Bounded queue of hub commands that collapses superseded ones.
+
+    A command replaces any pending command for the same target (a valve,
+    all valves of a hub, a config attribute) and keeps its place in the
+    queue, so repeated messages cost at most one write per target.
+    """
+
+    def __init__(self, maxsize):
+        """Initialize the queue."""
+        self._maxsize = maxsize
+        self._items: OrderedDict[tuple, tuple] = OrderedDict()
+        self._event = asyncio.Event()
+        self.collapsed = 0
+        self.rejected = 0
+        self.executed = 0
+        self.last_latency = None
+        self.max_latency = 0.0
+        self._latency_sum = 0.0
+
+    def __len__(self):
+        """Return the queue depth."""
+        return len(self._items)
+
+    @property
+    def mean_latency(self) -> float | None:
+        """Return the mean command-to-write latency in seconds."""
+        if not self.executed:
+            return None
+        return self._latency_sum / self.executed
+
+    def put(self, hub_name, target, value, received):
+        """Queue a command, must be called from the event loop."""
+        key = (hub_name,) + target
+        if target == ("valves",):
+            # opening or closing all valves supersedes single valve commands,
+            # so it never finds the queue full of the commands it replaces
+            for pending in [
+                k for k in self._items if k[0] == hub_name and k[1] == "valve"
+            ]:
+                del self._items[pending]
+                self.collapsed += 1
+        if key in self._items:
+            _, _, received = self._items[key]
+            self.collapsed += 1
+        elif len(self._items) >= self._maxsize:
+            self.rejected += 1
+            _LOGGER.warning(
+                "MQTT command queue is full, dropping {} for {}".format(
+                    target, hub_name
+                )
+            )
+            return
+        self._items[key] = (target, value, received)
+        self._event.set()
+
+    async def get(self):
+        """Wait for the oldest pending command."""
+        while not self._items:
+            self._event.clear()
+            await self._event.wait()
+        key, (target, value, received) = self._items.popitem(last=False)
+        return key[0], target, value, received
+
+    def record(self, received):
+        """Record the latency of a command that has been written."""
+        latency = time.monotonic() - received
+        self.executed += 1
+        self.last_latency = latency
+        self.max_latency = max(self.max_latency, latency)
+        self._latency_sum += latency
+
+
+def _on_off(value) -> str:
+    return STATE_ON if value else STATE_OFF
+
+
+def decode_hub_state(coordinator) -> dict[str, str]:
+    """Decode a hub snapshot into topic suffixes and their payloads."""
+    if not coordinator.last_update_success:
+        return {"available": PAYLOAD_OFFLINE}
+    status = coordinator.decoded(REGISTER_STATUS)
+    state = {
+        "available": PAYLOAD_ONLINE,
+        "alarm": _on_off(status[FIELD_ALARM]),
+    }
+    for valve, field in enumerate(FIELD_VALVES, 1):
+        state["valve/{}".format(valve)] = _on_off(status[field])
+    for attr in CONFIG_ATTRIBUTES:
+        state["config/{}".format(attr)] = _on_off(status[attr])
+    return state
+
+
+class MqttClient:
+    """Publishes decoded Neptun hub state to retained MQTT topics.
+
+    Only values that differ from the last published ones are sent, and all
+    changes of a poll cycle go out together. While the broker is down the
+    latest payload of every changed topic is kept in a bounded buffer and
+    flushed on reconnect.
+    """
+
+    def __init__(self, client_config, client_factory=mqtt.Client):
+        """Initialize the MQTT bridge."""
+        self._host = client_config[CONF_HOST]
+        self._port = client_config[CONF_PORT]
+        self._prefix = client_config.get(CONF_TOPIC_PREFIX, DEFAULT_TOPIC_PREFIX)
+        self._buffer_size = client_config.get(
+            CONF_BUFFER_SIZE, DEFAULT_MQTT_BUFFER_SIZE
+        )
+        self._lock = threading.Lock()
+        self._connected = False
+        self._published: dict[str, str] = {}
+        self._pending: OrderedDict[str, str] = OrderedDict()
+        self._dropped = 0
+        self._client = client_factory()
+        self._client.username_pw_set(
+            client_config[CONF_USER], client_config[CONF_PASSWORD]
+        )
+        self._client.max_queued_messages_set(self._buffer_size)
+        self._client.on_connect = self._on_connect
+        self._client.on_disconnect = self._on_disconnect
+        self._client.on_message = self._on_message
+        self._hass = None
+        self._coordinators = {}
+        self._commands = CommandQueue(
+            client_config.get(CONF_COMMAND_QUEUE_SIZE, DEFAULT_COMMAND_QUEUE_SIZE)
+        )
+        self._worker = None
+
+    @property
+    def status_topic(self) -> str:
+        """Return the topic carrying the bridge's own availability."""
+        return "{}/status".format(self._prefix)
+
+    @property
+    def connected(self) -> bool:
+        """Return True while the broker connection is up."""
+        return self._connected
+
+    @property
+    def buffered(self) -> int:
+        """Return the number of topics waiting for the broker."""
+        return len(self._pending)
+
+    @property
+    def dropped(self) -> int:
+        """Return how many buffered updates were dropped while offline."""
+        return self._dropped
+
+    def setup(self):
+        """Connect to the broker in the background."""
+        self._client.will_set(
+            self.status_topic, PAYLOAD_OFFLINE, qos=1, retain=True
+        )
+        self._client.connect_async(self._host, self._port)
+        self._client.loop_start()
+
+    @property
+    def commands(self) -> CommandQueue:
+        """Return the queue of commands received over MQTT."""
+        return self._commands
+
+    def close(self):
+        """Disconnect from the broker."""
+        if self._worker is not None:
+            self._hass.loop.call_soon_threadsafe(self._worker.cancel)
+        if self._connected:
+            self._client.publish(
+                self.status_topic, PAYLOAD_OFFLINE, qos=1, retain=True
+            )
+        self._client.disconnect()
+        self._client.loop_stop()
+
+    def attach(self, coordinator):
+        """Publish every snapshot of a hub coordinator and accept commands."""
+        self._coordinators[coordinator.name] = coordinator
+        if self._worker is None:
+            self._hass = coordinator.hass
+            self._worker = self._hass.loop.create_task(self._async_run_commands())
+
+        @callback
+        def publish_snapshot() -> None:
+            self.publish_hub_state(coordinator.name, decode_hub_state(coordinator))
+
+        return coordinator.async_add_listener(publish_snapshot)
+
+    def publish_hub_state(self, hub_name, state: dict[str, str]):
+        """Publish the values of a hub that changed since the last cycle."""
+        batch = [
+            ("{}/{}/{}".format(self._prefix, hub_name, suffix), payload)
+            for suffix, payload in state.items()
+        ]
+        self._publish_batch(batch)
+
+    def _publish_batch(self, batch):
+        """Publish a batch of retained messages, buffering while offline."""
+        with self._lock:
+            changed = [
+                (topic, payload)
+                for topic, payload in batch
+                if self._published.get(topic) != payload
+            ]
+            if not changed:
+                return
+            for topic, payload in changed:
+                self._published[topic] = payload
+                if not self._connected or not self._send(topic, payload):
+                    self._buffer(topic, payload)
+
+    def _send(self, topic, payload) -> bool:
+        """Hand a retained message to paho, returns False if it was refused."""
+        info = self._client.publish(topic, payload, qos=1, retain=True)
+        return info.rc == mqtt.MQTT_ERR_SUCCESS
+
+    def _buffer(self, topic, payload):
+        """Keep the latest payload of a topic until the broker is back."""
+        self._pending[topic] = payload
+        self._pending.move_to_end(topic)
+        while len(self._pending) > self._buffer_size:
+            dropped_topic, _ = self._pending.popitem(last=False)
+            # forget it was published so the next cycle sends it again
+            self._published.pop(dropped_topic, None)
+            self._dropped += 1
+
+    def _on_connect(self, client, userdata, flags, rc):
+        if rc != mqtt.CONNACK_ACCEPTED:
+            _LOGGER.error(
+                "MQTT connection refused: {}".format(mqtt.connack_string(rc))
+            )
+            return
+        _LOGGER.info(
+            "MQTT client connected to {}:{}".format(self._host, self._port)
+        )
+        client.publish(self.status_topic, PAYLOAD_ONLINE, qos=1, retain=True)
+        self._subscribe(client)
+        with self._lock:
+            self._connected = True
+            pending, self._pending = self._pending, OrderedDict()
+            for topic, payload in pending.items():
+                if not self._send(topic, payload):
+                    self._buffer(topic, payload)
+
+    def _subscribe(self, client):
+        """Subscribe to the command topics of all hubs."""
+        client.subscribe(
+            [
+                ("{}/+/valve/+/set".format(self._prefix), 1),
+                ("{}/+/valves/set".format(self._prefix), 1),
+                ("{}/+/config/+/set".format(self._prefix), 1),
+            ]
+        )
+
+    def _on_message(self, client, userdata, message):
+        received = time.monotonic()
+        if message.retain:
+            # a retained command is stale, never replay it on (re)connect
+            _LOGGER.debug("Ignoring retained command on {}".format(message.topic))
+            return
+        command = self._parse_command(message.topic, message.payload)
+        if command is None:
+            return
+        self._hass.loop.call_soon_threadsafe(self._commands.put, *command, received)
+
+    def _parse_command(self, topic, payload):
+        """Parse a command topic and payload into (hub, target, value)."""
+        parts = topic[len(self._prefix) + 1 :].split("/")
+        hub_name = parts[0]
+        try:
+            value = cv.boolean(payload.decode())
+        except (vol.Invalid, UnicodeDecodeError):
+            _LOGGER.warning("Invalid MQTT command payload on {}".format(topic))
+            return None
+        if hub_name not in self._coordinators:
+            _LOGGER.warning("MQTT command for unknown hub: {}".format(hub_name))
+            return None
+        if parts[1] == "valves":
+            return hub_name, ("valves",), value
+        if parts[1] == "valve" and parts[2] in ("1", "2"):
+            return hub_name, ("valve", int(parts[2])), value
+        if parts[1] == "config" and parts[2] in CONFIG_ATTRIBUTES:
+            return hub_name, ("config", parts[2]), value
+        _LOGGER.warning("Unsupported MQTT command topic: {}".format(topic))
+        return None
+
+    @staticmethod
+    def _target_mask(target) -> int:
+        """Return the status register bits a command target controls."""
+        if target[0] == "valves":
+            return STATUS.mask(*FIELD_VALVES)
+        if target[0] == "valve":
+            return STATUS.mask(FIELD_VALVES[target[1] - 1])
+        return STATUS.mask(target[1])
+
+    async def _async_run_commands(self):
+        """Feed queued commands to their hubs one at a time."""
+        while True:
+            hub_name, target, value, received = await self._commands.get()
+            coordinator = self._coordinators[hub_name]
+            hub = coordinator.hub
+            mask = self._target_mask(target)
+            age = hub.status_age
+            if age is not None and age <= STATUS_MIRROR_MAX_AGE:
+                if (hub.status & mask) == (mask if value else 0):
+                    # the module is already in the requested state
+                    self._commands.record(received)
+                    continue
+            try:
+                if target[0] == "valves":
+                    if value:
+                        result = await hub.async_open_all_valves()
+                    else:
+                        result = await hub.async_close_all_valves()
+                elif target[0] == "valve":
+                    if value:
+                        result = await hub.async_open_valve(target[1])
+                    else:
+                        result = await hub.async_close_valve(target[1])
+                else:
+                    result = await hub.async_set_config_attribute(target[1], value)
+            except Exception:  # pylint: disable=broad-except
+                _LOGGER.exception(
+                    "MQTT command {} for {} failed".format(target, hub_name)
+                )
+                continue
+            if result:
+                self._commands.record(received)
+                coordinator.async_command_sent()
+            self._publish_measurements()
+
+    def _publish_measurements(self):
+        """Publish the command queue depth and latency of the bridge."""
+        latency = self._commands.last_latency
+        self._publish_batch(
+            [
+                (
+                    "{}/bridge/queue_depth".format(self._prefix),
+                    str(len(self._commands)),
+                ),
+                (
+                    "{}/bridge/command_latency".format(self._prefix),
+                    "{:.3f}".format(latency) if latency is not None else "",
+                ),
+            ]
+        )
+
+    def _on_disconnect(self, client, userdata, rc):
+        with self._lock:
+            self._connected = False
+        if rc != mqtt.MQTT_ERR_SUCCESS:
+            _LOGGER.warning("MQTT client disconnected unexpectedly, reconnecting")
@@ -0,0 +1,529 @@
+"""Shared Modbus bus for Neptun hubs."""
+from __future__ import annotations
+
+import asyncio
+from collections import deque
+import logging
+import socket
+import time
+
+from pymodbus.client.serial import AsyncModbusSerialClient
+from pymodbus.client.tcp import AsyncModbusTcpClient
+from pymodbus.exceptions import ConnectionException, ModbusException
+from pymodbus.transaction import ModbusRtuFramer, ModbusSocketFramer
+
+from homeassistant.const import (
+    CONF_HOST,
+    CONF_PORT,
+    CONF_TIMEOUT,
+    CONF_TYPE,
+)
+
+from const import (
+    CONF_BAUDRATE,
+    CONF_BYTESIZE,
+    CONF_KEEPALIVE,
+    CONF_PARITY,
+    CONF_STOPBITS,
+    DEFAULT_KEEPALIVE,
+    NETWORK_TYPES,
+    PRIORITY_NAMES,
+    PRIORITY_POLL,
+)
+from metrics import RTU_OVERHEAD, SOCKET_OVERHEAD, BusMetrics
+
+_LOGGER = logging.getLogger(__name__)
+
+# RTU frames must be separated by at least 3.5 character times of silence
+RTU_FRAME_GAP_CHARS = 3.5
+RTU_MIN_FRAME_GAP = 0.00175
+
+# unanswered keepalive probes before the gateway connection is dropped
+KEEPALIVE_PROBES = 3
+
+# consecutive failed transactions that take a unit off the bus
+BREAKER_THRESHOLD = 3
+# seconds before the first probe of an unreachable unit, doubled on every
+# failed probe up to the maximum
+BREAKER_RETRY_DELAY = 5
+BREAKER_MAX_RETRY_DELAY = 300
+
+
+class RequestExpired(ModbusException):
+    """A request waited in the queue past its deadline and was dropped."""
+
+
+class CircuitOpen(ConnectionException):
+    """A request was refused because its unit is unreachable."""
+
+
+class CircuitBreaker:
+    """Keeps an unreachable unit from using the bus.
+
+    After BREAKER_THRESHOLD consecutive failures the breaker opens and
+    requests fail at once, including those already queued. When the retry
+    delay has passed a single probe request is let through: its success
+    closes the breaker, its failure opens it again for twice as long.
+    """
+
+    def __init__(self):
+        """Initialize a closed breaker."""
+        self.failures = 0
+        self.delay = BREAKER_RETRY_DELAY
+        self.retry_at: float | None = None
+        self._probe = None
+
+    @property
+    def is_open(self) -> bool:
+        """Return True while requests are refused."""
+        return self.retry_at is not None
+
+    def allow(self, request) -> bool:
+        """Return True if a request may be queued for the bus."""
+        if self.retry_at is None:
+            return True
+        if self._probe is not None or time.monotonic() < self.retry_at:
+            return False
+        self._probe = request
+        return True
+
+    def may_send(self, request) -> bool:
+        """Return True if a dequeued request may go on the wire."""
+        return self.retry_at is None or request is self._probe
+
+    def cancel(self, request):
+        """Forget a request that was never sent."""
+        if request is self._probe:
+            self._probe = None
+
+    def record_success(self) -> bool:
+        """Close the breaker, returns True if it was open."""
+        was_open = self.retry_at is not None
+        self.failures = 0
+        self.delay = BREAKER_RETRY_DELAY
+        self.retry_at = None
+        self._probe = None
+        return was_open
+
+    def record_failure(self) -> bool:
+        """Count a failure, returns True if the breaker has just opened."""
+        self.failures += 1
+        if self._probe is not None:
+            self._probe = None
+            self.delay = min(self.delay * 2, BREAKER_MAX_RETRY_DELAY)
+            self.retry_at = time.monotonic() + self.delay
+            return False
+        if self.retry_at is None and self.failures >= BREAKER_THRESHOLD:
+            self.retry_at = time.monotonic() + self.delay
+            return True
+        return False
+
+
+class NeptunBus:
+    """One Modbus client shared by every Neptun hub on the same port.
+
+    Requests are served by a single worker task, so modules chained on one
+    RS-485 line take turns on the wire instead of colliding or fighting
+    over the serial port. Every request has a priority: the worker always
+    serves the most urgent queued request (valve closing first, routine
+    polls last) and units take turns round-robin within a priority. A
+    request can carry a deadline after which it is dropped unsent, so a
+    saturated bus sheds stale polls instead of delaying commands.
+
+    Each unit has a circuit breaker, so a dead module does not cost the
+    others a timeout on every poll. When the port itself looks dead, it
+    is closed and opened again with a new client by the next request.
+    """
+
+    def __init__(self, conn_config):
+        """Initialize the bus."""
+        self._client = None
+        self._users = 0
+        # per priority: the queue of every unit and the units taking turns
+        self._queues: list[dict[int, deque]] = [{} for _ in PRIORITY_NAMES]
+        self._ready: list[deque[int]] = [deque() for _ in PRIORITY_NAMES]
+        self._breakers: dict[int, CircuitBreaker] = {}
+        self._wakeup: asyncio.Event | None = None
+        self._worker: asyncio.Task | None = None
+        self._loop = None
+        self._current = None
+        # future of the request on the wire, failed if the bus is closed
+        self._in_flight = None
+        self._opened = False
+        self._config_type = conn_config[CONF_TYPE]
+        self._config_port = conn_config[CONF_PORT]
+        self._config_timeout = conn_config[CONF_TIMEOUT]
+        if self._config_type in NETWORK_TYPES:
+            # network configuration, the gateway takes care of line timing
+            self._config_host = conn_config[CONF_HOST]
+            self._config_keepalive = conn_config.get(
+                CONF_KEEPALIVE, DEFAULT_KEEPALIVE
+            )
+            self._frame_gap = 0
+        elif self._config_type == "serial":
+            # serial configuration
+            self._config_method = "rtu"  # client_config[CONF_METHOD]
+            self._config_baudrate = conn_config.get(CONF_BAUDRATE, 9600)
+            self._config_stopbits = conn_config.get(CONF_STOPBITS, 1)
+            self._config_bytesize = conn_config.get(CONF_BYTESIZE, 8)
+            self._config_parity = conn_config.get(CONF_PARITY, "N")
+            char_bits = (
+                1
+                + self._config_bytesize
+                + (0 if self._config_parity == "N" else 1)
+                + self._config_stopbits
+            )
+            self._frame_gap = max(
+                RTU_MIN_FRAME_GAP,
+                RTU_FRAME_GAP_CHARS * char_bits / self._config_baudrate,
+            )
+        else:
+            raise Exception(
+                "Unsupported connection type: {}".format(self._config_type)
+            )
+        self._overhead = SOCKET_OVERHEAD if self._config_type == "tcp" else RTU_OVERHEAD
+        self.metrics = BusMetrics(self.name)
+
+    @staticmethod
+    def key(conn_config):
+        """Return the key identifying the physical bus of a connection.
+
+        All hubs behind the same gateway share one connection, whatever
+        framing they use.
+        """
+        if conn_config[CONF_TYPE] in NETWORK_TYPES:
+            return ("network", conn_config[CONF_HOST], conn_config[CONF_PORT])
+        return (conn_config[CONF_TYPE], conn_config[CONF_PORT])
+
+    @property
+    def name(self):
+        """Return the name of the port this bus runs on."""
+        if self._config_type in NETWORK_TYPES:
+            return "{}:{}".format(self._config_host, self._config_port)
+        return self._config_port
+
+    @property
+    def loop(self):
+        """Return the event loop the bus is bound to."""
+        return self._loop
+
+    def matches(self, conn_config) -> bool:
+        """Return True if a connection config uses the same bus settings."""
+        if conn_config[CONF_TYPE] != self._config_type:
+            return False
+        if self._config_type in NETWORK_TYPES:
+            return True
+        return (
+            conn_config.get(CONF_BAUDRATE, 9600) == self._config_baudrate
+            and conn_config.get(CONF_STOPBITS, 1) == self._config_stopbits
+            and conn_config.get(CONF_BYTESIZE, 8) == self._config_bytesize
+            and conn_config.get(CONF_PARITY, "N") == self._config_parity
+        )
+
+    def acquire(self):
+        """Register a hub using this bus."""
+        self._users += 1
+
+    def _bind_loop(self):
+        """Bind the bus to the running event loop on first use."""
+        if self._loop is None:
+            self._loop = asyncio.get_running_loop()
+            self._wakeup = asyncio.Event()
+
+    def breaker(self, unit) -> CircuitBreaker:
+        """Return the circuit breaker of a unit, created on first use."""
+        breaker = self._breakers.get(unit)
+        if breaker is None:
+            breaker = self._breakers[unit] = CircuitBreaker()
+        return breaker
+
+    def _start(self):
+        """Start the worker, the port opens on first use."""
+        self._bind_loop()
+        if self._users <= 0:
+            raise ConnectionException("Bus {} is closed".format(self.name))
+        if self._worker is None:
+            self._worker = self._loop.create_task(self._async_run())
+
+    async def async_connect(self) -> bool:
+        """Start the bus and open the port."""
+        try:
+            self._start()
+            return await self._async_open()
+        except ModbusException as exception_error:
+            _LOGGER.error("Neptun: " + str(exception_error))
+            return False
+
+    def _create_client(self):
+        """Create the pymodbus client for the configured connection type."""
+        client = self._create_modbus_client()
+        # the framer silently drops responses failing their CRC or frame
+        # check, count them against the unit being served
+        check_frame = client.framer.checkFrame
+
+        def counting_check_frame():
+            if check_frame():
+                return True
+            if self._current is not None:
+                self.metrics.unit(self._current).frame_errors += 1
+            return False
+
+        client.framer.checkFrame = counting_check_frame
+        return client
+
+    def _create_modbus_client(self):
+        if self._config_type == "serial":
+            _LOGGER.info("*** Setting up the serial Modbus client...")
+            client = AsyncModbusSerialClient(
+                port=self._config_port,
+                framer=ModbusRtuFramer,
+                baudrate=self._config_baudrate,
+                stopbits=self._config_stopbits,
+                bytesize=self._config_bytesize,
+                parity=self._config_parity,
+                timeout=self._config_timeout,
+                retry_on_empty=True,
+            )
+            _LOGGER.info("*** Serial Modbus client created.")
+            return client
+        _LOGGER.info(
+            "*** Setting up the {} Modbus client...".format(self._config_type)
+        )
+        # the bus reopens the connection itself on the next request, so the
+        # background reconnect of pymodbus is disabled
+        client = AsyncModbusTcpClient(
+            host=self._config_host,
+            port=self._config_port,
+            framer=(
+                ModbusRtuFramer
+                if self._config_type == "rtuovertcp"
+                else ModbusSocketFramer
+            ),
+            timeout=self._config_timeout,
+            retry_on_empty=True,
+            reconnect_delay=0,
+        )
+        _LOGGER.info("*** {} Modbus client created.".format(self._config_type))
+        return client
+
+    async def _async_open(self) -> bool:
+        """Create the client if needed and open the port if it is not open."""
+        if self._client is None:
+            self._client = self._create_client()
+        if self._client.connected:
+            return True
+        if self._opened:
+            self.metrics.reconnects += 1
+        try:
+            connected = bool(await self._client.connect())
+        except ModbusException as exception_error:
+            _LOGGER.error("Neptun: " + str(exception_error))
+            return False
+        if connected:
+            _LOGGER.info("*** Port {} opened.".format(self.name))
+            self._opened = True
+            if self._config_type in NETWORK_TYPES:
+                self._enable_keepalive()
+        return connected
+
+    def _enable_keepalive(self):
+        """Turn on TCP keepalive so dead gateways are noticed while idle."""
+        transport = getattr(self._client.protocol, "transport", None)
+        sock = transport.get_extra_info("socket") if transport else None
+        if sock is None:
+            return
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        if hasattr(socket, "TCP_KEEPIDLE"):
+            sock.setsockopt(
+                socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, self._config_keepalive
+            )
+            sock.setsockopt(
+                socket.IPPROTO_TCP,
+                socket.TCP_KEEPINTVL,
+                max(1, self._config_keepalive // KEEPALIVE_PROBES),
+            )
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, KEEPALIVE_PROBES)
+
+    async def async_release(self):
+        """Unregister a hub, closes the bus when its last hub is gone."""
+        self._users -= 1
+        if self._users <= 0:
+            await self.async_close()
+
+    async def async_close(self):
+        """Stop the worker and close the port."""
+        if self._worker is not None:
+            self._worker.cancel()
+            self._worker = None
+        if self._in_flight is not None:
+            if not self._in_flight.done():
+                self._in_flight.set_exception(ConnectionException("Bus closed"))
+            self._in_flight = None
+        for queues in self._queues:
+            for queue in queues.values():
+                for request in queue:
+                    if not request[0].done():
+                        request[0].set_exception(ConnectionException("Bus closed"))
+                queue.clear()
+        for ready in self._ready:
+            ready.clear()
+        self.metrics.queue_depth = 0
+        await self._async_drop_client()
+
+    async def _async_drop_client(self):
+        """Close the port, the next request opens it with a new client."""
+        if self._client is not None:
+            client, self._client = self._client, None
+            try:
+                await client.close()
+            except (ModbusException, OSError) as exception_error:
+                _LOGGER.error("Neptun: " + str(exception_error))
+
+    async def async_execute(
+        self, unit, method, *args, priority=PRIORITY_POLL, max_wait=None
+    ):
+        """Queue a client call for a unit and wait for its response.
+
+        A request still queued ``max_wait`` seconds later is dropped and
+        raises RequestExpired.
+        """
+        if self._worker is None:
+            self._start()
+        future = self._loop.create_future()
+        if not self.breaker(unit).allow(future):
+            raise CircuitOpen(
+                "Unit {} on {} is unreachable, retrying later".format(unit, self.name)
+            )
+        queued = time.perf_counter()
+        deadline = queued + max_wait if max_wait is not None else None
+        queue = self._queues[priority].setdefault(unit, deque())
+        if not queue:
+            self._ready[priority].append(unit)
+        queue.append((future, method, args, queued, deadline))
+        self.metrics.queue_depth += 1
+        self._wakeup.set()
+        return await future
+
+    def _next_request(self):
+        """Dequeue the most urgent request, round-robin across units."""
+        for priority, ready in enumerate(self._ready):
+            if ready:
+                unit = ready.popleft()
+                queue = self._queues[priority][unit]
+                request = queue.popleft()
+                if queue:
+                    ready.append(unit)
+                self.metrics.queue_depth -= 1
+                return priority, unit, request
+        return None
+
+    async def _async_run(self):
+        """Serve queued requests one at a time, most urgent first."""
+        while True:
+            next_request = self._next_request()
+            if next_request is None:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            priority, unit, (future, method, args, queued, deadline) = next_request
+            breaker = self.breaker(unit)
+            if future.done():
+                # the caller gave up while waiting in the queue
+                breaker.cancel(future)
+                continue
+            if not breaker.may_send(future):
+                # the breaker opened while the request was queued
+                future.set_exception(
+                    CircuitOpen(
+                        "Unit {} on {} is unreachable, retrying later".format(
+                            unit, self.name
+                        )
+                    )
+                )
+                continue
+            metrics = self.metrics.unit(unit)
+            start = time.perf_counter()
+            metrics.queue_wait.observe(start - queued)
+            self.metrics.queue_wait[priority].observe(start - queued)
+            if deadline is not None and start > deadline:
+                metrics.expired += 1
+                breaker.cancel(future)
+                future.set_exception(
+                    RequestExpired(
+                        "{} for unit {} expired in the queue".format(method, unit)
+                    )
+                )
+                continue
+            self._current = unit
+            self._in_flight = future
+            try:
+                if not await self._async_open():
+                    raise ConnectionException(
+                        "Port {} is not connected".format(self.name)
+                    )
+                start = time.perf_counter()
+                metrics.requests += 1
+                metrics.bytes_sent += self._overhead + _request_size(method, args)
+                result = await getattr(self._client, method)(*args, unit)
+            except asyncio.TimeoutError as exception_error:
+                metrics.timeouts += 1
+                await self._async_failed(unit, lost=False)
+                if not future.done():
+                    future.set_exception(exception_error)
+            except Exception as exception_error:  # pylint: disable=broad-except
+                metrics.failures += 1
+                await self._async_failed(unit, lost=True)
+                if not future.done():
+                    future.set_exception(exception_error)
+            else:
+                metrics.bytes_received += self._overhead + _response_size(result)
+                if result.isError():
+                    metrics.exceptions += 1
+                if breaker.record_success():
+                    _LOGGER.warning(
+                        "Unit {} on {} is reachable again".format(unit, self.name)
+                    )
+                if not future.done():
+                    future.set_result(result)
+            self._current = None
+            self._in_flight = None
+            elapsed = time.perf_counter() - start
+            metrics.latency.observe(elapsed)
+            self.metrics.busy += elapsed
+            await asyncio.sleep(self._frame_gap)
+
+    async def _async_failed(self, unit, lost):
+        """Count a failed transaction against the breaker of its unit.
+
+        ``lost`` is True when the port or connection failed rather than the
+        unit not answering in time.
+        """
+        breaker = self.breaker(unit)
+        if breaker.record_failure():
+            self.metrics.unit(unit).breaker_trips += 1
+            _LOGGER.warning(
+                "Unit {} on {} is unreachable, retrying in {}s".format(
+                    unit, self.name, breaker.delay
+                )
+            )
+        # when no unit answers the port itself is likely dead: reopen it
+        if lost or all(breaker.is_open for breaker in self._breakers.values()):
+            await self._async_drop_client()
+
+
+def _request_size(method, args) -> int:
+    """Return the PDU size of a request."""
+    if method == "write_registers":
+        return 6 + 2 * len(args[1])
+    # read_holding_registers and write_register: function, address, value
+    return 5
+
+
+def _response_size(result) -> int:
+    """Return the PDU size of a response."""
+    registers = getattr(result, "registers", None)
+    if registers is not None:
+        return 2 + 2 * len(registers)
+    if result.isError():
+        return 2
+    return 5
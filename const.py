@@ -12,8 +12,18 @@ CONF_STOPBITS = "stopbits"
 CONF_USER = "user"
 CONF_PASSWORD = "password"
 CONF_VALVES = "valves"
+CONF_WIRELESS_SENSORS = "wireless_sensors"
+CONF_METERS = "meters"
+CONF_CLOSE_ON_ALARM = "close_on_alarm"
+CONF_UNIT = "unit"
+CONF_KEEPALIVE = "keepalive"
+CONF_FAST_SCAN_INTERVAL = "fast_scan_interval"
+CONF_TOPIC_PREFIX = "topic_prefix"
+CONF_BUFFER_SIZE = "buffer_size"
+CONF_COMMAND_QUEUE_SIZE = "command_queue_size"
 CONF_BINARY_SENSOR = "binary_sensor"
 CONF_SWITCH = "switch"
+CONF_SENSOR = "sensor"
 CONF_INPUTS = ""
 CONF_WRITE_TYPE = ""
 CONF_COMMAND_MASK = "mask"
@@ -34,6 +44,26 @@ SERVICE_CLOSE_VALVE = "close_valve"
 SERVICE_OPEN_ALL_VALVES = "open_all_valves"
 SERVICE_CLOSE_ALL_VALVES = "close_all_valves"
 SERVICE_SET_CONFIG_ATTRIBUTE = "set_config_attribute"
+SERVICE_SET_METER_COUNTERS = "set_meter_counters"
+SERVICE_DISCOVER = "discover"
+ATTR_COUNTERS = "counters"
+ATTR_PORT = "port"
+ATTR_BAUDRATES = "baudrates"
+ATTR_UNITS = "units"
+ATTR_SCAN = "scan"
+
+# registers carried by one FC16 write and one FC3 read at most
+MAX_WRITE_REGISTERS = 123
+MAX_READ_REGISTERS = 125
+
+# connection types reaching the modules through an Ethernet gateway
+NETWORK_TYPES = ("tcp", "rtuovertcp")
+DEFAULT_KEEPALIVE = 30
+
+# MQTT bridge defaults
+DEFAULT_TOPIC_PREFIX = "neptun"
+DEFAULT_MQTT_BUFFER_SIZE = 1000
+DEFAULT_COMMAND_QUEUE_SIZE = 64
 
 # integration names
 NEPTUN_DOMAIN = "neptun"
@@ -45,14 +75,37 @@ DATA_MQTT_CLIENT = "_neptun_mqtt_"
 REGISTER_STATUS = 0
 NEPTUN_UNIT = 240
 
+REGISTER_WIRELESS_COUNT = 6
+REGISTER_WIRELESS_STATUS = 57
+WIRELESS_SLOTS = 50
+
+# 32-bit meter counters in litres, high word first
+REGISTER_METER_COUNTERS = 107
+METER_SLOTS = 8
+
+# bus request priorities, lower values are served first
+PRIORITY_SAFETY = 0
+PRIORITY_ALARM = 1
+PRIORITY_COMMAND = 2
+PRIORITY_POLL = 3
+PRIORITY_DIAGNOSTIC = 4
+PRIORITY_NAMES = ("safety", "alarm", "command", "poll", "diagnostic")
+
+# seconds a polled status value may be written back without reading it
+# again, well under one poll cycle since the module changes it on a leak
+STATUS_MIRROR_MAX_AGE = 0.5
+# seconds a valve motor needs to open or close, polled fast meanwhile
+VALVE_TRAVEL_TIME = 30
+
 # hub sensor attributes
 ATTR_KEYBOARD_LOCKED = "keyboard_locked"
-MASK_KEYBOARD_LOCKED = 0b1000000000000
 ATTR_PESSIMISTIC_WIRELESS_SENSOR = "pessimistic_wireless_sensor"
-MASK_PESSIMISTIC_WIRELESS_SENSOR = 0b0100000000000
 ATTR_VALVE_TWO_GROUPS = "two_valve_groups"
-MASK_VALVE_TWO_GROUPS = 0b0010000000000
 ATTR_WIRELESS_PAIRING = "wireless_pairing"
-MASK_WIRELESS_PAIRING = 0b0000010000000
 ATTR_FLOOR_WASHING = "floor_washing"
-MASK_FLOOR_WASHING = 0b0000000000001
+
+# wireless sensor attributes
+ATTR_BATTERY_LOW = "battery_low"
+
+# valve attributes
+ATTR_VALVE_STATE = "valve_state"
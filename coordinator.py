@@ -0,0 +1,339 @@
+"""Shared polling coordinator for a Neptun hub."""
+from __future__ import annotations
+
+from datetime import timedelta
+import datetime
+import logging
+import time
+from typing import Callable, Mapping
+
+from homeassistant.core import CALLBACK_TYPE, HomeAssistant, callback
+from homeassistant.helpers.event import async_call_later
+
+from bus import RequestExpired
+from const import PRIORITY_ALARM, PRIORITY_POLL, REGISTER_STATUS, VALVE_TRAVEL_TIME
+from registerlog import RegisterLog
+from registers import FIELD_ALARM, FIELD_VALVES, STATUS, RegisterMap
+
+_LOGGER = logging.getLogger(__name__)
+
+DEFAULT_SCAN_INTERVAL = timedelta(seconds=10)
+DEFAULT_FAST_SCAN_INTERVAL = timedelta(seconds=1)
+# the interval grows by this factor on every poll that changes nothing
+BACKOFF_FACTOR = 2
+# upper bound of the interval while the hub keeps failing
+MAX_ERROR_SCAN_INTERVAL = timedelta(minutes=5)
+# seconds a snapshot may be old to serve a refresh requested by an entity
+REQUESTED_REFRESH_MAX_AGE = 0.5
+
+
+class NeptunCoordinator:
+    """Polls a Neptun hub once per cycle and pushes the snapshot to entities.
+
+    Every entity of a hub subscribes to the coordinator instead of reading
+    the bus on its own, so one Modbus transaction serves all of them and they
+    all see the same register values at the same moment.
+
+    The poll interval adapts to the hub: it drops to the fast rate right
+    after a command, while an alarm is raised and whenever the status word
+    changes, then doubles on every unchanged poll up to the slow rate.
+    Failed polls back off exponentially as well.
+
+    Polls of a hub in alarm go ahead of routine polls on a busy bus, and a
+    poll still queued when the next one is due is dropped instead of
+    delivering stale data late.
+
+    Valves listed in ``close_on_alarm`` are closed as soon as a poll sees
+    the alarm appear, without waiting for an automation.
+
+    A coordinator can start from a snapshot cached before a restart. It is
+    stale until the first poll, which then only pushes what changed.
+
+    Every register change is kept with its raw value in ``log``, so what
+    the module did around an incident can be reconstructed afterwards.
+    """
+
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        hub,
+        scan_interval=DEFAULT_SCAN_INTERVAL,
+        fast_scan_interval=DEFAULT_FAST_SCAN_INTERVAL,
+        register_map: RegisterMap | None = None,
+        close_on_alarm=(),
+    ):
+        """Initialize the coordinator."""
+        self.hass = hass
+        self.hub = hub
+        self.data: list[int] | None = None
+        self.changed: frozenset[int] = frozenset()
+        self.register_map = register_map or RegisterMap()
+        self.values: dict[int, Mapping[str, int | bool]] = {}
+        # incremented on every snapshot change, with the time of the change
+        self.version = 0
+        self.updated: float | None = None
+        self.stale = False
+        self.log = RegisterLog()
+        self._close_on_alarm = STATUS.mask(
+            *(FIELD_VALVES[valve - 1] for valve in close_on_alarm)
+        )
+        self.last_update_success = False
+        self._slow_interval = scan_interval.total_seconds()
+        self._fast_interval = min(
+            fast_scan_interval.total_seconds(), self._slow_interval
+        )
+        self._interval = self._fast_interval
+        self._errors = 0
+        self._fast_until = 0.0
+        self._listeners: list[tuple[Callable[[], None], frozenset | None]] = []
+        self._unsub_refresh: CALLBACK_TYPE | None = None
+        self._closed = False
+
+    @property
+    def name(self):
+        """Return the name of the coordinated hub."""
+        return self.hub.name
+
+    @property
+    def status(self) -> int | None:
+        """Return the last polled status register value."""
+        return self.register(REGISTER_STATUS)
+
+    def snapshot(self) -> dict:
+        """Return the current snapshot, as persisted across restarts."""
+        return {
+            "registers": self.data,
+            "time": self.updated,
+            "version": self.version,
+        }
+
+    def restore(self, snapshot) -> bool:
+        """Start from a persisted snapshot, returns False if it does not fit.
+
+        The restored values are stale until the first successful poll.
+        """
+        registers = snapshot.get("registers")
+        if (
+            self.data is not None
+            or not registers
+            or len(registers) != self.register_map.register_count
+        ):
+            return False
+        self.data = list(registers)
+        self.values = self.register_map.decode(self.data)
+        self.version = snapshot.get("version", 0)
+        self.updated = snapshot.get("time")
+        self.last_update_success = True
+        self.stale = True
+        return True
+
+    def register(self, address) -> int | None:
+        """Return the last polled value of a register."""
+        if self.data is None:
+            return None
+        return self.data[address - REGISTER_STATUS]
+
+    def decoded(self, address) -> Mapping[str, int | bool] | None:
+        """Return the decoded fields of a register of the register map."""
+        return self.values.get(address)
+
+    @property
+    def alarm(self) -> bool:
+        """Return True if the last snapshot has an alarm bit set."""
+        status = self.values.get(REGISTER_STATUS)
+        return status is not None and status[FIELD_ALARM]
+
+    @property
+    def interval(self) -> float:
+        """Return the delay in seconds before the next scheduled poll."""
+        if self._errors:
+            return min(
+                self._interval * BACKOFF_FACTOR**self._errors,
+                max(MAX_ERROR_SCAN_INTERVAL.total_seconds(), self._slow_interval),
+            )
+        return self._interval
+
+    @callback
+    def async_add_listener(
+        self, update_callback: Callable[[], None], registers=None
+    ) -> CALLBACK_TYPE:
+        """Subscribe to snapshot updates, returns a function to unsubscribe.
+
+        A listener given register addresses is only called when one of
+        those registers changed or the hub availability changed.
+        """
+        first_listener = not self._listeners
+        listener = (
+            update_callback,
+            frozenset(registers) if registers is not None else None,
+        )
+        self._listeners.append(listener)
+        if first_listener:
+            self.hass.async_create_task(self.async_refresh())
+
+        @callback
+        def remove_listener() -> None:
+            self._listeners.remove(listener)
+            if not self._listeners:
+                self._unschedule_refresh()
+
+        return remove_listener
+
+    @callback
+    def async_update_listeners(self, changed=None) -> None:
+        """Push the current snapshot to the entities it concerns.
+
+        ``changed`` holds the addresses of the registers that changed,
+        None means every listener is updated.
+        """
+        for update_callback, registers in list(self._listeners):
+            if changed is None or registers is None or not registers.isdisjoint(
+                changed
+            ):
+                update_callback()
+
+    @callback
+    def _unschedule_refresh(self) -> None:
+        if self._unsub_refresh:
+            self._unsub_refresh()
+            self._unsub_refresh = None
+
+    @callback
+    def _schedule_refresh(self) -> None:
+        """Schedule the next poll according to the current interval."""
+        self._unschedule_refresh()
+        if self._closed or not self._listeners:
+            return
+        self._unsub_refresh = async_call_later(
+            self.hass, self.interval, self._async_refresh_by_timer
+        )
+
+    @callback
+    def async_command_sent(self) -> None:
+        """Switch to fast polling while the module carries out a command."""
+        self._fast_until = time.monotonic() + VALVE_TRAVEL_TIME
+        self._interval = self._fast_interval
+        self._schedule_refresh()
+
+    async def _async_refresh_by_timer(self, now: datetime | None = None) -> None:
+        self._unsub_refresh = None
+        if self._closed:
+            return
+        await self.async_refresh()
+
+    async def async_request_refresh(self) -> None:
+        """Refresh on behalf of an entity, a very recent read will do."""
+        await self.async_refresh(REQUESTED_REFRESH_MAX_AGE)
+
+    async def async_refresh(self, max_age=None) -> None:
+        """Read the status block once and update all listeners."""
+        _LOGGER.debug(">>> Polling hub: {}".format(self.name))
+        try:
+            result = await self.hub.async_read_holding_registers(
+                REGISTER_STATUS,
+                self.register_map.register_count,
+                priority=PRIORITY_ALARM if self.alarm else PRIORITY_POLL,
+                max_wait=self.interval,
+                max_age=max_age,
+            )
+        except RequestExpired:
+            # the bus is saturated, keep the last snapshot and try again
+            _LOGGER.debug("*** Poll of {} expired in the queue".format(self.name))
+            self.changed = frozenset()
+            self._schedule_refresh()
+            return
+        detected = time.perf_counter()
+        was_available = self.last_update_success
+        was_stale = self.stale
+        # a cached alarm is not trusted, its valves may have been reopened
+        was_alarm = self.alarm and not self.stale
+        if result is None:
+            self.last_update_success = False
+            self._errors += 1
+            self.changed = frozenset()
+            _LOGGER.warning(
+                "*** Cannot read current register values for {}!".format(self.name)
+            )
+        else:
+            data = list(result.registers)
+            if self.data is None or len(self.data) != len(data):
+                self.changed = frozenset(
+                    range(REGISTER_STATUS, REGISTER_STATUS + len(data))
+                )
+                self.values = self.register_map.decode(data)
+            else:
+                self.changed = frozenset(
+                    REGISTER_STATUS + index
+                    for index, (old, new) in enumerate(zip(self.data, data))
+                    if old != new
+                )
+                # only the registers that changed are decoded again
+                self.values.update(self.register_map.decode(data, self.changed))
+            now = time.monotonic()
+            for address in sorted(self.changed):
+                self.log.append(now, address, data[address - REGISTER_STATUS])
+            self.data = data
+            self.last_update_success = True
+            self.stale = False
+            self._errors = 0
+            if self.changed:
+                self.version += 1
+                self.updated = time.time()
+            if self.alarm and not was_alarm and self._close_on_alarm:
+                self.hass.async_create_task(
+                    self._async_close_on_alarm(self.status, detected)
+                )
+            # meter counters and wireless signal words change all the time,
+            # only the status word means the module is doing something
+            if (
+                REGISTER_STATUS in self.changed
+                or self.alarm
+                or time.monotonic() < self._fast_until
+            ):
+                self._interval = self._fast_interval
+            else:
+                self._interval = min(
+                    self._interval * BACKOFF_FACTOR, self._slow_interval
+                )
+            _LOGGER.debug("*** Received registers: {}".format(self.data))
+        self._schedule_refresh()
+        if self.last_update_success != was_available or (
+            was_stale and not self.stale
+        ):
+            self.async_update_listeners()
+        else:
+            self.async_update_listeners(self.changed)
+        _LOGGER.debug(
+            "<<< Hub {} polled, next poll in {:.1f}s".format(self.name, self.interval)
+        )
+
+    async def _async_close_on_alarm(self, status, detected) -> None:
+        """Close the protected valves of a hub that has just raised an alarm.
+
+        The write is computed from the ``status`` read by the poll that saw
+        the alarm, so closing takes a single write queued at the safety
+        priority. Only the writes sent are recorded in the ``alarm_response``
+        metric.
+        """
+        bits = status & self._close_on_alarm
+        if not bits:
+            # the module usually closes its valves by itself on a leak
+            _LOGGER.warning("*** Alarm on {}, valves already closed".format(self.name))
+            return
+        _LOGGER.warning("*** Alarm on {}, closing valves".format(self.name))
+        if not await self.hub.async_clear_bits(bits, status):
+            _LOGGER.error("Cannot close the valves of {}!".format(self.name))
+            return
+        self.async_command_sent()
+        elapsed = time.perf_counter() - detected
+        self.hub.metrics.alarm_response.observe(elapsed)
+        _LOGGER.warning(
+            "*** Valves of {} closed {:.3f}s after the alarm was detected".format(
+                self.name, elapsed
+            )
+        )
+
+    def close(self):
+        """Stop polling and disconnect the hub."""
+        self._closed = True
+        self.hub.close()
@@ -0,0 +1,153 @@
+"""Discovery of Neptun modules on a serial port."""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+
+from pymodbus.client.serial import AsyncModbusSerialClient
+from pymodbus.exceptions import ModbusException
+from pymodbus.transaction import ModbusRtuFramer
+
+from const import NEPTUN_UNIT, REGISTER_STATUS
+
+_LOGGER = logging.getLogger(__name__)
+
+# candidate line settings, fastest first so the first match is the fastest
+DISCOVERY_BAUDRATES = (115200, 57600, 38400, 19200, 9600, 4800, 2400, 1200)
+DISCOVERY_PARITIES = ("N", "E", "O")
+# unit ids probed at every candidate setting, the full range is only
+# scanned at the setting that answered
+DISCOVERY_PROBE_UNITS = (NEPTUN_UNIT,)
+DISCOVERY_UNITS = range(1, 248)
+# seconds a module may take to answer, on top of the time on the wire
+DISCOVERY_RESPONSE_TIME = 0.05
+# bytes of a status register request and of its response, RTU framed
+PROBE_FRAME_SIZE = 8 + 7
+# bits per character: start, 8 data bits, optional parity, 1 stop bit
+CHAR_BITS = 10
+
+
+class DiscoveryResult:
+    """Line settings of a port and the units answering on it."""
+
+    def __init__(self, port, baudrate, parity, units, elapsed):
+        """Initialize the result."""
+        self.port = port
+        self.baudrate = baudrate
+        self.parity = parity
+        self.units = units
+        self.elapsed = elapsed
+
+    def as_dict(self) -> dict:
+        """Return the result as a connection config plus the units found.
+
+        Only the baud rate and parity are detected, the byte size and stop
+        bits are the ones probed with and listed under ``assumed``.
+        """
+        return {
+            "port": self.port,
+            "baudrate": self.baudrate,
+            "bytesize": 8,
+            "parity": self.parity,
+            "stopbits": 1,
+            "assumed": ["bytesize", "stopbits"],
+            "units": self.units,
+            "elapsed": round(self.elapsed, 3),
+        }
+
+
+def probe_timeout(baudrate, parity) -> float:
+    """Return the seconds to wait for a status response at a line setting."""
+    char_bits = CHAR_BITS + (0 if parity == "N" else 1)
+    return DISCOVERY_RESPONSE_TIME + PROBE_FRAME_SIZE * char_bits / baudrate
+
+
+async def _async_probe(client, unit) -> bool:
+    """Return True if a unit answers a read of its status register."""
+    try:
+        result = await client.read_holding_registers(REGISTER_STATUS, 1, unit)
+    except (ModbusException, asyncio.TimeoutError):
+        return False
+    return result is not None and not result.isError()
+
+
+async def _async_scan(port, baudrate, parity, units) -> list[int] | None:
+    """Return the units answering at a line setting, None if the port fails."""
+    # stop bits are not probed: frames go out with one, and as most UARTs
+    # only check the first stop bit, modules set to two usually answer too
+    client = AsyncModbusSerialClient(
+        port=port,
+        framer=ModbusRtuFramer,
+        baudrate=baudrate,
+        bytesize=8,
+        parity=parity,
+        stopbits=1,
+        timeout=probe_timeout(baudrate, parity),
+        retries=0,
+        retry_on_empty=False,
+        reconnect_delay=0,
+    )
+    try:
+        if not await client.connect():
+            return None
+        found = []
+        for unit in units:
+            if await _async_probe(client, unit):
+                found.append(unit)
+        return found
+    finally:
+        await client.close()
+
+
+async def async_discover(
+    port,
+    baudrates=DISCOVERY_BAUDRATES,
+    parities=DISCOVERY_PARITIES,
+    probe_units=DISCOVERY_PROBE_UNITS,
+    units=DISCOVERY_UNITS,
+) -> DiscoveryResult | None:
+    """Find the line setting of a port and the Neptun modules on it.
+
+    Every setting is tried fastest first with a read of the status register
+    of the ``probe_units``, and the sweep stops at the first valid response.
+    All modules of a bus share its setting, so ``units`` are then scanned
+    at that setting only. Returns None when nothing answers.
+
+    Probing a unit that is not there costs a timeout at every setting, so
+    ``probe_units`` should hold the ids the modules most likely use.
+    """
+    started = time.monotonic()
+    opened = False
+    for baudrate in baudrates:
+        for parity in parities:
+            _LOGGER.debug(
+                ">>> Probing {} at {} baud, parity {}".format(port, baudrate, parity)
+            )
+            found = await _async_scan(port, baudrate, parity, probe_units)
+            # adapters refuse the settings they do not support
+            opened = opened or found is not None
+            if not found:
+                continue
+            rest = [unit for unit in units if unit not in found]
+            if rest:
+                found = sorted(
+                    found + (await _async_scan(port, baudrate, parity, rest) or [])
+                )
+            result = DiscoveryResult(
+                port, baudrate, parity, found, time.monotonic() - started
+            )
+            _LOGGER.info(
+                "<<< Found Neptun units {} on {} at {} baud, parity {} "
+                "in {:.1f}s".format(found, port, baudrate, parity, result.elapsed)
+            )
+            return result
+    if not opened:
+        _LOGGER.error("Neptun: cannot open {}".format(port))
+        return None
+    _LOGGER.warning(
+        "<<< No Neptun module answers on {} after {:.1f}s".format(
+            port, time.monotonic() - started
+        )
+    )
+    return None
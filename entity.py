@@ -0,0 +1,51 @@
+"""Base class of the entities following a Neptun hub coordinator."""
+from __future__ import annotations
+
+from homeassistant.core import callback
+
+
+class NeptunEntity:
+    """Mixin writing the state of a coordinator entity only when it changed.
+
+    Values restored from a cached snapshot are shown as assumed until the
+    first live read of the hub.
+
+    Most polls change nothing, or nothing a given entity shows, so the
+    state, availability and attributes last written are kept and compared
+    with the new ones before building a new state object. Skipped writes
+    are counted in the ``suppressed_writes`` metric of the hub.
+
+    Goes before the Home Assistant entity class in the bases and expects
+    the coordinator in ``_coordinator``.
+    """
+
+    _published: tuple | None = None
+
+    @property
+    def assumed_state(self) -> bool:
+        """Return True while the hub state comes from a cached snapshot."""
+        return self._coordinator.stale
+
+    def _state_key(self) -> tuple:
+        """Return what the state machine shows of this entity."""
+        attributes = self.extra_state_attributes
+        return (
+            self.available,
+            self.assumed_state,
+            self.state,
+            None if attributes is None else dict(attributes),
+        )
+
+    @callback
+    def async_write_ha_state(self) -> None:
+        """Write the state and remember it."""
+        self._published = self._state_key()
+        super().async_write_ha_state()
+
+    @callback
+    def async_write_changed_state(self) -> None:
+        """Write the state unless it is the one last written."""
+        if self._published is not None and self._state_key() == self._published:
+            self._coordinator.hub.metrics.suppressed_writes += 1
+            return
+        self.async_write_ha_state()
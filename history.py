@@ -0,0 +1,203 @@
+"""Meter consumption history and long-term statistics import for Neptun."""
+from __future__ import annotations
+
+from array import array
+from datetime import datetime, timedelta, timezone
+import logging
+
+from homeassistant.const import EVENT_HOMEASSISTANT_STOP, UnitOfVolume
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.event import async_track_time_interval
+from homeassistant.util import slugify
+
+from .const import NEPTUN_DOMAIN
+from .registers import FIELD_VALUE, meter_register
+
+_LOGGER = logging.getLogger(__name__)
+
+# samples kept per meter between two flushes
+METER_HISTORY_SIZE = 1024
+# how often buffered consumption is written to the long-term statistics
+METER_FLUSH_INTERVAL = timedelta(minutes=15)
+LITRES_PER_CUBIC_METER = 1000
+HOUR = 3600
+
+
+class MeterHistory:
+    """Fixed-size ring buffer of (timestamp, delta) consumption samples.
+
+    Both columns live in preallocated arrays, so the memory used does not
+    depend on the uptime. When the buffer is full the oldest sample is
+    folded into the next one: its litres are kept, only their timestamp
+    moves forward.
+    """
+
+    def __init__(self, size=METER_HISTORY_SIZE):
+        """Initialize the buffer."""
+        self._times = array("d", bytes(8 * size))
+        self._deltas = array("Q", bytes(8 * size))
+        self._size = size
+        self._head = 0
+        self._count = 0
+
+    def __len__(self):
+        """Return the number of buffered samples."""
+        return self._count
+
+    @property
+    def total(self) -> int:
+        """Return the litres held in the buffer."""
+        return sum(self._deltas[self._index(i)] for i in range(self._count))
+
+    def _index(self, position):
+        return (self._head + position) % self._size
+
+    def append(self, timestamp: float, delta: int):
+        """Add a sample, folding the oldest one if the buffer is full."""
+        if self._count == self._size:
+            oldest = self._head
+            self._head = self._index(1)
+            self._count -= 1
+            if self._count:
+                self._deltas[self._head] += self._deltas[oldest]
+            else:
+                delta += self._deltas[oldest]
+        tail = self._index(self._count)
+        self._times[tail] = timestamp
+        self._deltas[tail] = delta
+        self._count += 1
+
+    def drain(self):
+        """Yield the buffered samples oldest first and empty the buffer."""
+        for position in range(self._count):
+            index = self._index(position)
+            yield self._times[index], self._deltas[index]
+        self._head = 0
+        self._count = 0
+
+
+class NeptunMeterStatistics:
+    """Feeds the consumption of one meter into Home Assistant statistics.
+
+    Every poll that moves the counter adds one delta to the history
+    buffer. The buffer is flushed periodically as hourly external
+    statistics, so neither long uptimes nor catching up after a reconnect
+    produce a state write per poll.
+    """
+
+    def __init__(self, hass: HomeAssistant, coordinator, meterName: str, slot: int):
+        """Initialize the meter statistics."""
+        self.hass = hass
+        self._coordinator = coordinator
+        self._name = meterName
+        self._register = meter_register(slot)
+        self._history = MeterHistory()
+        self._reading: int | None = None
+        self._sum: float | None = None
+        self._last_start = 0.0
+        self._unsubs = []
+        self.statistic_id = "{}:{}".format(NEPTUN_DOMAIN, slugify(meterName))
+
+    async def async_start(self):
+        """Restore the running sum and start collecting deltas."""
+        # imported lazily, the recorder is an optional dependency
+        from homeassistant.components.recorder import get_instance
+        from homeassistant.components.recorder.statistics import get_last_statistics
+
+        last = await get_instance(self.hass).async_add_executor_job(
+            get_last_statistics, self.hass, 1, self.statistic_id, True, {"sum"}
+        )
+        if last.get(self.statistic_id):
+            row = last[self.statistic_id][0]
+            self._sum = row["sum"] * LITRES_PER_CUBIC_METER
+            self._last_start = row["start"]
+        else:
+            self._sum = 0.0
+        self._unsubs.append(
+            self._coordinator.async_add_listener(
+                self._handle_coordinator_update,
+                (self._register, self._register + 1),
+            )
+        )
+        self._unsubs.append(
+            async_track_time_interval(
+                self.hass, self._async_flush_by_timer, METER_FLUSH_INTERVAL
+            )
+        )
+        self._unsubs.append(
+            self.hass.bus.async_listen_once(
+                EVENT_HOMEASSISTANT_STOP, self._async_stop
+            )
+        )
+        self._handle_coordinator_update()
+
+    @callback
+    def _handle_coordinator_update(self) -> None:
+        """Buffer the counter movement since the previous poll."""
+        if not self._coordinator.last_update_success:
+            return
+        counter = self._coordinator.decoded(self._register)
+        if counter is None:
+            return
+        reading = counter[FIELD_VALUE]
+        if self._reading is not None and reading != self._reading:
+            # a counter going backwards was reset or replaced
+            delta = reading - self._reading if reading > self._reading else reading
+            self._history.append(datetime.now(timezone.utc).timestamp(), delta)
+        self._reading = reading
+
+    async def _async_flush_by_timer(self, now=None):
+        self.async_flush()
+
+    async def _async_stop(self, event=None):
+        # the stop listener is the last one added and has already fired
+        self._unsubs.pop()
+        self.async_flush()
+        self.async_close()
+
+    @callback
+    def async_flush(self):
+        """Write the buffered deltas as hourly statistics in one batch."""
+        if not len(self._history):
+            return
+        from homeassistant.components.recorder.statistics import (
+            async_add_external_statistics,
+        )
+
+        # the counter reading before the oldest buffered sample
+        state = self._reading - self._history.total
+        hours = {}
+        for timestamp, delta in self._history.drain():
+            state += delta
+            self._sum += delta
+            start = max(timestamp - timestamp % HOUR, self._last_start)
+            hours[start] = (state, self._sum)
+        statistics = [
+            {
+                "start": datetime.fromtimestamp(start, timezone.utc),
+                "state": state / LITRES_PER_CUBIC_METER,
+                "sum": total / LITRES_PER_CUBIC_METER,
+            }
+            for start, (state, total) in hours.items()
+        ]
+        self._last_start = max(hours)
+        metadata = {
+            "has_mean": False,
+            "has_sum": True,
+            "name": self._name,
+            "source": NEPTUN_DOMAIN,
+            "statistic_id": self.statistic_id,
+            "unit_of_measurement": UnitOfVolume.CUBIC_METERS,
+        }
+        _LOGGER.debug(
+            "*** Importing {} hourly statistics for {}".format(
+                len(statistics), self.statistic_id
+            )
+        )
+        async_add_external_statistics(self.hass, metadata, statistics)
+
+    @callback
+    def async_close(self):
+        """Stop collecting deltas."""
+        while self._unsubs:
+            self._unsubs.pop()()
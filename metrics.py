@@ -0,0 +1,192 @@
+"""Transport metrics of Neptun buses and hubs."""
+from __future__ import annotations
+
+from bisect import bisect_left
+import time
+
+from const import PRIORITY_NAMES
+
+# upper bounds in seconds of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+# bytes added to every PDU by the framing: unit id and CRC, or MBAP header
+RTU_OVERHEAD = 3
+SOCKET_OVERHEAD = 7
+
+
+class Histogram:
+    """Cumulative histogram with fixed buckets, cheap enough for every sample."""
+
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        """Initialize the histogram."""
+        self.bounds = bounds
+        # the last bucket collects everything above the highest bound
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        """Record a sample."""
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class TransportMetrics:
+    """Counters and histograms of the transactions of one hub."""
+
+    __slots__ = (
+        "hub",
+        "requests",
+        "timeouts",
+        "exceptions",
+        "frame_errors",
+        "failures",
+        "expired",
+        "breaker_trips",
+        "suppressed_writes",
+        "bytes_sent",
+        "bytes_received",
+        "latency",
+        "queue_wait",
+        "alarm_response",
+    )
+
+    def __init__(self, hub=""):
+        """Initialize the metrics."""
+        self.hub = hub
+        self.requests = 0
+        self.timeouts = 0
+        self.exceptions = 0
+        self.frame_errors = 0
+        self.failures = 0
+        self.expired = 0
+        self.breaker_trips = 0
+        # entity state writes skipped because nothing shown had changed
+        self.suppressed_writes = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.latency = Histogram()
+        self.queue_wait = Histogram()
+        # time from alarm detection to the valves closed by the integration
+        self.alarm_response = Histogram()
+
+    @property
+    def errors(self) -> int:
+        """Return the number of transactions that did not succeed."""
+        return self.timeouts + self.exceptions + self.failures
+
+
+class BusMetrics:
+    """Port level metrics of a bus, plus the metrics of its hubs."""
+
+    def __init__(self, port):
+        """Initialize the metrics."""
+        self.port = port
+        self.started = time.monotonic()
+        self.busy = 0.0
+        self.reconnects = 0
+        self.queue_depth = 0
+        # queueing delay of every request priority
+        self.queue_wait = [Histogram() for _ in PRIORITY_NAMES]
+        self.units: dict[int, TransportMetrics] = {}
+
+    def unit(self, unit) -> TransportMetrics:
+        """Return the metrics of a unit, created on first use."""
+        metrics = self.units.get(unit)
+        if metrics is None:
+            metrics = self.units[unit] = TransportMetrics()
+        return metrics
+
+    @property
+    def busy_ratio(self) -> float:
+        """Return the share of time the port spent in transactions."""
+        elapsed = time.monotonic() - self.started
+        return self.busy / elapsed if elapsed > 0 else 0.0
+
+
+def _labels(**labels) -> str:
+    return ",".join(
+        '{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+        for name, value in labels.items()
+    )
+
+
+# port level metrics: name, type, help
+BUS_METRICS = (
+    ("busy_ratio", "gauge", "Share of time the port spent in transactions."),
+    ("queue_depth", "gauge", "Transactions waiting for the port."),
+    ("reconnects", "counter", "Times the port had to be reopened."),
+)
+# hub level counters: name, help
+UNIT_COUNTERS = (
+    ("requests", "Modbus transactions sent."),
+    ("timeouts", "Transactions without a response in time."),
+    ("exceptions", "Modbus exception responses."),
+    ("frame_errors", "Responses dropped for a bad CRC or frame."),
+    ("failures", "Transactions failed for other reasons."),
+    ("expired", "Requests dropped unsent after their deadline."),
+    ("breaker_trips", "Times the hub was taken off the bus as unreachable."),
+    ("suppressed_writes", "Entity state writes skipped as unchanged."),
+    ("bytes_sent", "Bytes written to the wire."),
+    ("bytes_received", "Bytes read from the wire."),
+)
+# hub level histograms: name, help
+UNIT_HISTOGRAMS = (
+    ("latency", "Transaction latency in seconds."),
+    ("queue_wait", "Time spent waiting for the port in seconds."),
+    ("alarm_response", "Time from alarm detection to valves closed in seconds."),
+)
+
+
+def render_prometheus(buses) -> str:
+    """Render bus metrics in the Prometheus text exposition format."""
+    lines = []
+    for name, kind, help_text in BUS_METRICS:
+        metric = "neptun_bus_{}{}".format(name, "_total" if kind == "counter" else "")
+        lines.append("# HELP {} {}".format(metric, help_text))
+        lines.append("# TYPE {} {}".format(metric, kind))
+        for bus in buses:
+            lines.append(
+                "{}{{{}}} {}".format(metric, _labels(port=bus.port), getattr(bus, name))
+            )
+    units = [
+        (_labels(port=bus.port, hub=metrics.hub, unit=unit), metrics)
+        for bus in buses
+        for unit, metrics in bus.units.items()
+    ]
+    for name, help_text in UNIT_COUNTERS:
+        metric = "neptun_{}_total".format(name)
+        lines.append("# HELP {} {}".format(metric, help_text))
+        lines.append("# TYPE {} counter".format(metric))
+        for labels, metrics in units:
+            lines.append("{}{{{}}} {}".format(metric, labels, getattr(metrics, name)))
+    for name, help_text in UNIT_HISTOGRAMS:
+        metric = "neptun_{}_seconds".format(name)
+        lines.append("# HELP {} {}".format(metric, help_text))
+        lines.append("# TYPE {} histogram".format(metric))
+        for labels, metrics in units:
+            _render_histogram(lines, metric, labels, getattr(metrics, name))
+    metric = "neptun_bus_queue_wait_seconds"
+    lines.append(
+        "# HELP {} Time spent waiting for the port by priority.".format(metric)
+    )
+    lines.append("# TYPE {} histogram".format(metric))
+    for bus in buses:
+        for priority, histogram in zip(PRIORITY_NAMES, bus.queue_wait):
+            labels = _labels(port=bus.port, priority=priority)
+            _render_histogram(lines, metric, labels, histogram)
+    return "\n".join(lines) + "\n"
+
+
+def _render_histogram(lines, metric, labels, histogram):
+    cumulative = 0
+    for bound, count in zip(histogram.bounds + ("+Inf",), histogram.counts):
+        cumulative += count
+        lines.append(
+            '{}_bucket{{{},le="{}"}} {}'.format(metric, labels, bound, cumulative)
+        )
+    lines.append("{}_sum{{{}}} {}".format(metric, labels, histogram.sum))
+    lines.append("{}_count{{{}}} {}".format(metric, labels, histogram.count))
@@ -1,43 +1,57 @@
 """Support for Neptun."""
 from homeassistant.helpers.config_validation import boolean
 from homeassistant.components import switch
+import asyncio
 import logging
-import threading
+import time
 
-from pymodbus.client.serial import ModbusSerialClient as ModbusClient
-from pymodbus.constants import Defaults
 from pymodbus.exceptions import ModbusException
-from pymodbus.transaction import ModbusRtuFramer
-
-import paho.mqtt.client as mqtt
+from pymodbus.register_read_message import ReadHoldingRegistersResponse
 
 from homeassistant.const import (
     ATTR_NAME,
     CONF_NAME,
-    CONF_PORT,
-    CONF_TIMEOUT,
-    CONF_TYPE,
+    CONF_SCAN_INTERVAL,
     EVENT_HOMEASSISTANT_STOP,
 )
+from homeassistant.core import SupportsResponse
+from homeassistant.exceptions import HomeAssistantError
 from homeassistant.helpers.discovery import async_load_platform
 
+from bridge import MqttClient
+from bus import NeptunBus, RequestExpired
+from coordinator import NeptunCoordinator
+from discovery import DISCOVERY_PROBE_UNITS, DISCOVERY_UNITS, async_discover
+from metrics import TransportMetrics
+from registers import (
+    CONFIG_ATTRIBUTES,
+    FIELD_ALARM,
+    FIELD_VALVES,
+    METER_COUNTER,
+    STATUS,
+    RegisterMap,
+    meter_register,
+)
+from snapshot import SnapshotCache
 from const import (
-    ATTR_FLOOR_WASHING,
     ATTR_HUB,
-    ATTR_KEYBOARD_LOCKED,
-    ATTR_PESSIMISTIC_WIRELESS_SENSOR,
     ATTR_VALUE,
     ATTR_VALVE,
     ATTR_VALVE_TWO_GROUPS,
-    ATTR_WIRELESS_PAIRING,
     CONF_BINARY_SENSOR,
     CONF_SWITCH,
+    CONF_SENSOR,
     CONF_CONNECTION,
-    MASK_FLOOR_WASHING,
-    MASK_KEYBOARD_LOCKED,
-    MASK_PESSIMISTIC_WIRELESS_SENSOR,
-    MASK_VALVE_TWO_GROUPS,
-    MASK_WIRELESS_PAIRING,
+    CONF_UNIT,
+    CONF_FAST_SCAN_INTERVAL,
+    CONF_WIRELESS_SENSORS,
+    CONF_METERS,
+    CONF_CLOSE_ON_ALARM,
+    MAX_READ_REGISTERS,
+    MAX_WRITE_REGISTERS,
+    PRIORITY_COMMAND,
+    PRIORITY_POLL,
+    PRIORITY_SAFETY,
     NEPTUN_DOMAIN as DOMAIN,
     SERVICE_OPEN_VALVE,
     SERVICE_CLOSE_VALVE,
@@ -45,14 +59,18 @@ from const import (
     SERVICE_CLOSE_ALL_VALVES,
     CONF_HUBS,
     CONF_MQTT,
-    CONF_PARITY,
-    CONF_STOPBITS,
-    CONF_BYTESIZE,
-    CONF_BAUDRATE,
     DATA_MQTT_CLIENT,
     REGISTER_STATUS,
     NEPTUN_UNIT,
+    STATUS_MIRROR_MAX_AGE,
     SERVICE_SET_CONFIG_ATTRIBUTE,
+    SERVICE_SET_METER_COUNTERS,
+    SERVICE_DISCOVER,
+    ATTR_BAUDRATES,
+    ATTR_COUNTERS,
+    ATTR_PORT,
+    ATTR_SCAN,
+    ATTR_UNITS,
 )
 
 _LOGGER = logging.getLogger(__name__)
@@ -68,6 +86,8 @@ async def async_neptun_setup(
     service_one_valve_schema,
     service_all_valves_schema,
     service_set_attr_schema,
+    service_set_meters_schema,
+    service_discover_schema,
 ):
     """Set up Neptun component."""
 
@@ -75,23 +95,82 @@ async def async_neptun_setup(
 
     hass.data[DOMAIN] = neptunData = {}
     neptunCfg = config[DOMAIN]
+    buses = {}
+    hubs = []
+    # entities start from the snapshots cached before the last restart
+    snapshots = SnapshotCache(hass)
+    await snapshots.async_load()
     if CONF_HUBS in neptunCfg:
         for conf_hub in neptunCfg[CONF_HUBS]:
-            neptunHub = NeptunHub(conf_hub)
-            # modbus needs to be activated before components are loaded
-            # to avoid a racing problem
-            neptunHub.setup()
-            neptunData[neptunHub.name] = neptunHub
+            # hubs on the same port share one bus
+            conn_config = conf_hub[CONF_CONNECTION]
+            bus_key = NeptunBus.key(conn_config)
+            bus = buses.get(bus_key)
+            if bus is None:
+                bus = buses[bus_key] = NeptunBus(conn_config)
+            elif not bus.matches(conn_config):
+                _LOGGER.warning(
+                    "Hub {} uses different settings for {}, "
+                    "the settings of the first hub on that port are used".format(
+                        conf_hub[CONF_NAME], bus.name
+                    )
+                )
+            units = [
+                coordinator.hub.unit
+                for coordinator in neptunData.values()
+                if coordinator.hub.bus is bus
+            ]
+            if conf_hub[CONF_UNIT] in units:
+                _LOGGER.error(
+                    "Hub {} is skipped: unit {} is already used on {}".format(
+                        conf_hub[CONF_NAME], conf_hub[CONF_UNIT], bus.name
+                    )
+                )
+                continue
+            # the port is opened by the bus worker on the first request, so
+            # a missing adapter or gateway does not hold up the startup
+            neptunHub = NeptunHub(conf_hub, bus)
+            # one block read covers the status word, all wireless slots
+            # and all meter counters
+            register_map = RegisterMap(
+                len(conf_hub.get(CONF_WIRELESS_SENSORS, [])),
+                len(conf_hub.get(CONF_METERS, [])),
+            )
+            coordinator = neptunData[neptunHub.name] = NeptunCoordinator(
+                hass,
+                neptunHub,
+                conf_hub[CONF_SCAN_INTERVAL],
+                conf_hub[CONF_FAST_SCAN_INTERVAL],
+                register_map,
+                conf_hub.get(CONF_CLOSE_ON_ALARM, ()),
+            )
+            snapshots.attach(coordinator)
+            hubs.append(conf_hub)
+
+        # load platforms of all hubs at once
+        await asyncio.gather(
+            *(
+                async_load_platform(hass, component, DOMAIN, conf_hub, config)
+                for conf_hub in hubs
+                for component in (CONF_BINARY_SENSOR, CONF_SENSOR, CONF_SWITCH)
+            )
+        )
+
+    # Serve the transport metrics and register logs when the HTTP API is
+    # available
+    if "http" in hass.config.components:
+        from api import NeptunMetricsView, NeptunRegisterLogView
 
-            # load platforms
-            for component in (CONF_BINARY_SENSOR, CONF_SWITCH):
-                await async_load_platform(hass, component, DOMAIN, conf_hub, config)
+        hass.http.register_view(NeptunMetricsView(list(buses.values())))
+        hass.http.register_view(NeptunRegisterLogView(dict(neptunData)))
 
     # Setup MQTT connection
     if CONF_MQTT in neptunCfg:
         mqttClient = MqttClient(neptunCfg[CONF_MQTT])
         mqttClient.setup()
         _LOGGER.info("MQTT client started")
+        for coordinator in neptunData.values():
+            mqttClient.attach(coordinator)
         neptunData[DATA_MQTT_CLIENT] = mqttClient
 
     def stop_neptun(event):
@@ -100,34 +179,66 @@ async def async_neptun_setup(
             closeable.close()
             del closeable
 
-    def open_valve(service):
+    async def async_open_valve(service):
         """Open a valve on a Neptun hub"""
         hub = service.data[ATTR_HUB]
         valve = int(float(service.data[ATTR_VALVE]))
-        neptunData[hub].open_valve(valve)
+        await neptunData[hub].hub.async_open_valve(valve)
+        neptunData[hub].async_command_sent()
 
-    def open_all_valves(service):
+    async def async_open_all_valves(service):
         """Open all valves on a Neptun hub"""
         hub = service.data[ATTR_HUB]
-        neptunData[hub].open_all_valves()
+        await neptunData[hub].hub.async_open_all_valves()
+        neptunData[hub].async_command_sent()
 
-    def close_valve(service):
+    async def async_close_valve(service):
         """Close a valve on a Neptun hub"""
         hub = service.data[ATTR_HUB]
         valve = int(float(service.data[ATTR_VALVE]))
-        neptunData[hub].close_valve(valve)
+        await neptunData[hub].hub.async_close_valve(valve)
+        neptunData[hub].async_command_sent()
 
-    def close_all_valves(service):
+    async def async_close_all_valves(service):
         """Close all valves on a Neptun hub"""
         hub = service.data[ATTR_HUB]
-        neptunData[hub].close_all_valves()
+        await neptunData[hub].hub.async_close_all_valves()
+        neptunData[hub].async_command_sent()
 
-    def set_config_attribute(service):
+    async def async_set_config_attribute(service):
         """Sets Neptun config's attribute"""
         hub = service.data[ATTR_HUB]
         name = service.data[ATTR_NAME]
         value = service.data[ATTR_VALUE]
-        neptunData[hub].set_config_attribute(name, value)
+        await neptunData[hub].hub.async_set_config_attribute(name, value)
+        neptunData[hub].async_command_sent()
+
+    async def async_set_meter_counters(service):
+        """Set meter counters of a Neptun hub"""
+        hub = service.data[ATTR_HUB]
+        counters = {
+            meter - 1: litres for meter, litres in service.data[ATTR_COUNTERS].items()
+        }
+        await neptunData[hub].hub.async_set_meter_counters(counters)
+        neptunData[hub].async_command_sent()
+
+    async def async_discover_bus(service):
+        """Find the line setting and the Neptun modules of a serial port"""
+        port = service.data[ATTR_PORT]
+        if ("serial", port) in buses:
+            raise HomeAssistantError(
+                "{} is in use by a configured Neptun hub".format(port)
+            )
+        probe_units = service.data.get(ATTR_UNITS, DISCOVERY_PROBE_UNITS)
+        result = await async_discover(
+            port,
+            service.data[ATTR_BAUDRATES],
+            probe_units=probe_units,
+            units=DISCOVERY_UNITS if service.data[ATTR_SCAN] else (),
+        )
+        if result is None:
+            raise HomeAssistantError("No Neptun module answers on {}".format(port))
+        return result.as_dict()
 
     # register function to gracefully stop Neptun
     hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, stop_neptun)
@@ -136,281 +247,545 @@ async def async_neptun_setup(
     hass.services.async_register(
         DOMAIN,
         SERVICE_OPEN_VALVE,
-        open_valve,
+        async_open_valve,
         schema=service_one_valve_schema,
     )
     hass.services.async_register(
         DOMAIN,
         SERVICE_OPEN_ALL_VALVES,
-        open_all_valves,
+        async_open_all_valves,
         schema=service_all_valves_schema,
     )
     hass.services.async_register(
         DOMAIN,
         SERVICE_CLOSE_VALVE,
-        close_valve,
+        async_close_valve,
         schema=service_one_valve_schema,
     )
     hass.services.async_register(
         DOMAIN,
         SERVICE_CLOSE_ALL_VALVES,
-        close_all_valves,
+        async_close_all_valves,
         schema=service_all_valves_schema,
     )
     hass.services.async_register(
         DOMAIN,
         SERVICE_SET_CONFIG_ATTRIBUTE,
-        set_config_attribute,
+        async_set_config_attribute,
         schema=service_set_attr_schema,
     )
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_SET_METER_COUNTERS,
+        async_set_meter_counters,
+        schema=service_set_meters_schema,
+    )
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_DISCOVER,
+        async_discover_bus,
+        schema=service_discover_schema,
+        supports_response=SupportsResponse.ONLY,
+    )
     _LOGGER.debug("<< The Neptun integration has been set up successfully.")
     return True
 
 
 class NeptunHub:
-    """Thread safe wrapper class for pymodbus with Neptun features."""
+    """Asyncio wrapper for one Neptun module on a shared Modbus bus.
 
-    def __init__(self, client_config):
+    All bus access goes through the ``async_*`` methods which queue their
+    transactions on the hub's ``NeptunBus``. The synchronous methods are thin
+    wrappers for code running outside of the event loop (executor jobs,
+    ``local-test.py``).
+    """
+
+    def __init__(self, client_config, bus: NeptunBus | None = None):
         """Initialize the Neptun hub."""
 
         # generic configuration
-        self._client = None
         self._in_error = False
-        self._lock = threading.Lock()
+        self._sync_loop = None
         self._config_name = client_config[CONF_NAME]
-        if CONF_CONNECTION in client_config:
-            conn_config = client_config[CONF_CONNECTION]
-            self._config_type = conn_config[CONF_TYPE]
-            self._config_port = conn_config[CONF_PORT]
-            self._config_timeout = conn_config[CONF_TIMEOUT]
-            # self._config_delay = 0
-            Defaults.Timeout = 10
-            if self._config_type == "serial":
-                # serial configuration
-                self._config_method = "rtu"  # client_config[CONF_METHOD]
-                self._config_baudrate = conn_config.get(CONF_BAUDRATE, 9600)
-                self._config_stopbits = conn_config.get(CONF_STOPBITS, 1)
-                self._config_bytesize = conn_config.get(CONF_BYTESIZE, 8)
-                self._config_parity = conn_config.get(CONF_PARITY, "N")
-            else:
-                # network configuration
-                raise Exception("Only serial connection types are supported!")
+        self._config_unit = client_config.get(CONF_UNIT, NEPTUN_UNIT)
+        if bus is None:
+            bus = NeptunBus(client_config[CONF_CONNECTION])
+        self._bus = bus
+        self._bus.acquire()
+        self._metrics = bus.metrics.unit(self._config_unit)
+        self._metrics.hub = self._config_name
+
+        # in-memory mirror of the status register, kept by polls and writes
+        self._status = None
+        self._status_version = 0
+        self._status_time = None
+        self._status_polled = False
+        self._status_lock = None
+
+        # reads in flight that later reads of the same range can join, and
+        # the last result of every range with the time it was read
+        self._reads: dict[tuple[int, int], tuple[int, asyncio.Task]] = {}
+        self._recent: dict[tuple[int, int], tuple[float, list[int]]] = {}
+
     @property
     def name(self):
         """Return the name of this hub."""
         return self._config_name
 
-    def _log_error(self, exception_error: ModbusException, error_state=True):
-        log_text = "Neptun: " + str(exception_error)
+    @property
+    def unit(self):
+        """Return the Modbus unit id of this hub."""
+        return self._config_unit
+
+    @property
+    def bus(self) -> NeptunBus:
+        """Return the bus this hub is attached to."""
+        return self._bus
+
+    @property
+    def metrics(self) -> TransportMetrics:
+        """Return the transport metrics of this hub."""
+        return self._metrics
+
+    @property
+    def status(self) -> int | None:
+        """Return the mirrored status register value."""
+        return self._status
+
+    @property
+    def status_version(self) -> int:
+        """Return a counter incremented on every mirror update."""
+        return self._status_version
+
+    @property
+    def status_age(self) -> float | None:
+        """Return the age of the mirrored status register in seconds."""
+        if self._status_time is None:
+            return None
+        return time.monotonic() - self._status_time
+
+    def _update_status(self, status, polled):
+        """Store a status register value confirmed by the module."""
+        self._status = status
+        self._status_version += 1
+        self._status_time = time.monotonic()
+        self._status_polled = polled
+
+    def _log_error(self, operation, exception_error, error_state=True):
+        if isinstance(exception_error, asyncio.TimeoutError):
+            reason = "no response in time"
+        else:
+            reason = str(exception_error) or type(exception_error).__name__
+        log_text = "Neptun: {} failed on hub {} (unit {} on {}): {}".format(
+            operation, self.name, self.unit, self._bus.name, reason
+        )
         if self._in_error:
             _LOGGER.debug(log_text)
         else:
             _LOGGER.error(log_text)
             self._in_error = error_state
 
-    def setup(self):
-        """Set up pymodbus client."""
+    def _run_sync(self, coro):
+        """Run a hub coroutine to completion from synchronous code."""
         try:
-            if self._config_type == "serial":
-                _LOGGER.info("*** Setting up the serial Modbus client...")
-                self._client = ModbusClient(
-                    method=self._config_method,
-                    port=self._config_port,
-                    baudrate=self._config_baudrate,
-                    stopbits=self._config_stopbits,
-                    bytesize=self._config_bytesize,
-                    parity=self._config_parity,
-                    timeout=self._config_timeout,
-                    retry_on_empty=True,
+            asyncio.get_running_loop()
+        except RuntimeError:
+            pass
+        else:
+            coro.close()
+            raise RuntimeError("Use the async API of NeptunHub in the event loop")
+        loop = self._bus.loop
+        if loop is not None and loop.is_running():
+            return asyncio.run_coroutine_threadsafe(coro, loop).result()
+        if self._sync_loop is None:
+            self._sync_loop = loop or asyncio.new_event_loop()
+        return self._sync_loop.run_until_complete(coro)
+
+    async def async_setup(self):
+        """Connect the hub's bus."""
+        if await self._bus.async_connect():
+            _LOGGER.info(
+                "*** Neptun hub {} connected on {} (unit {}).".format(
+                    self.name, self._bus.name, self.unit
                 )
-                _LOGGER.info("*** Serial Modbus client created.")
-            # elif self._config_type == "rtuovertcp":
-            #     self._client = ModbusTcpClient(
-            #         host=self._config_host,
-            #         port=self._config_port,
-            #         framer=ModbusRtuFramer,
-            #         timeout=self._config_timeout,
-            #     )
-            # elif self._config_type == "tcp":
-            #     self._client = ModbusTcpClient(
-            #         host=self._config_host,
-            #         port=self._config_port,
-            #         timeout=self._config_timeout,
-            #     )
-            # elif self._config_type == "udp":
-            #     self._client = ModbusUdpClient(
-            #         host=self._config_host,
-            #         port=self._config_port,
-            #         timeout=self._config_timeout,
-            #     )
-        except ModbusException as exception_error:
-            self._log_error(exception_error, error_state=False)
-            return
-
-        # Connect device
-        self.connect()
-        _LOGGER.info("*** Serial Modbus client connected.")
+            )
+
+    def setup(self):
+        """Connect the hub's bus."""
+        return self._run_sync(self.async_setup())
+
+    async def async_close(self):
+        """Detach from the bus, the last hub closes the port."""
+        await self._bus.async_release()
 
     def close(self):
-        """Disconnect client."""
-        with self._lock:
-            try:
-                if self._client:
-                    self._client.close()
-                    self._client = None
-            except ModbusException as exception_error:
-                self._log_error(exception_error)
-                return
+        """Detach from the bus, the last hub closes the port."""
+        return self._run_sync(self.async_close())
+
+    async def async_connect(self):
+        """Connect client."""
+        await self._bus.async_connect()
 
     def connect(self):
         """Connect client."""
-        with self._lock:
-            try:
-                self._client.connect()
-            except ModbusException as exception_error:
-                self._log_error(exception_error, error_state=False)
-                return
-
-    def setBits(self, bits):
-        result = self.read_holding_registers(REGISTER_STATUS)
-        if result is ModbusException:
-            _LOGGER.error(
-                "open_valve: Cannot read holding registers: {}".format(result)
+        return self._run_sync(self.async_connect())
+
+    def _mirror_writable(self, targets) -> bool:
+        """Return True if the mirror can be written back besides ``targets``.
+
+        A value read less than STATUS_MIRROR_MAX_AGE ago is trusted while
+        it shows no alarm. After a write the valves may still be moving and
+        during an alarm the module closes them by itself, so then the mirror
+        is only trusted if writing it back cannot reopen a valve or clear an
+        alarm bit the command does not target.
+        """
+        age = self.status_age
+        if age is None or age > STATUS_MIRROR_MAX_AGE:
+            return False
+        alarm = STATUS.mask(FIELD_ALARM)
+        if self._status_polled and not self._status & alarm:
+            return True
+        untargeted = ~targets
+        valves = STATUS.mask(*FIELD_VALVES) & untargeted
+        alarm &= untargeted
+        return not (self._status & valves) and (self._status & alarm) == alarm
+
+    async def _async_modify_status(
+        self, modify, targets, priority=PRIORITY_COMMAND, status=None
+    ) -> bool:
+        """Write the status register computed from its mirrored value.
+
+        ``targets`` are the bits the command changes. The register is read
+        first unless the caller passes the ``status`` it has just read or
+        the mirror can be written back, see ``_mirror_writable``.
+        """
+        if self._status_lock is None:
+            self._status_lock = asyncio.Lock()
+        async with self._status_lock:
+            if status is None:
+                if not self._mirror_writable(targets):
+                    result = await self.async_read_holding_registers(
+                        REGISTER_STATUS, priority=priority
+                    )
+                    if result is None:
+                        _LOGGER.error(
+                            "Cannot read the status register of {}".format(
+                                self.name
+                            )
+                        )
+                        return False
+                status = self._status
+            _LOGGER.debug(
+                "Register value mirrored: {0:d} ({0:b}) <-- REG".format(status)
             )
-        else:
-            status = result.registers[0]
-            print("Register value read: {0:d} ({0:b}) <-- REG".format(status))
-            status = status | bits
-            print("Writing value to register: {0:d} ({0:b}) --> REG".format(status))
-            self.write_register(REGISTER_STATUS, status)
-
-    def clearBits(self, bits):
-        result = self.read_holding_registers(REGISTER_STATUS)
-        if result is ModbusException:
-            _LOGGER.error(
-                "open_valve: Cannot read holding registers: {}".format(result)
+            status = modify(status) & STATUS.write_mask
+            _LOGGER.debug(
+                "Writing value to register: {0:d} ({0:b}) --> REG".format(status)
             )
-        else:
-            status = result.registers[0]
-            print("Register value read: {0:d} ({0:b}) <-- REG".format(status))
-            status = status & bit_not(bits)
-            print("Writing value to register: {0:d} ({0:b}) --> REG".format(status))
-            self.write_register(REGISTER_STATUS, status)
+            return await self.async_write_register(REGISTER_STATUS, status, priority)
 
-    def useGrouping(self, use: bool):
+    async def async_set_bits(self, bits) -> bool:
+        return await self._async_modify_status(lambda status: status | bits, bits)
+
+    def setBits(self, bits) -> bool:
+        return self._run_sync(self.async_set_bits(bits))
+
+    async def async_clear_bits(self, bits, status=None) -> bool:
+        # closing valves goes ahead of everything else waiting for the bus
+        priority = (
+            PRIORITY_SAFETY if bits & STATUS.mask(*FIELD_VALVES) else PRIORITY_COMMAND
+        )
+        return await self._async_modify_status(
+            lambda status: status & bit_not(bits), bits, priority, status
+        )
+
+    def clearBits(self, bits) -> bool:
+        return self._run_sync(self.async_clear_bits(bits))
+
+    async def async_use_grouping(self, use: bool):
         if use:
-            self.setBits(1 << 10)
+            return await self.async_set_bits(STATUS.mask(ATTR_VALVE_TWO_GROUPS))
         else:
-            self.clearBits(1 << 10)
+            return await self.async_clear_bits(STATUS.mask(ATTR_VALVE_TWO_GROUPS))
 
-    def open_valve(self, valve):
-        if valve == 1:
-            self.setBits(1 << 8)
-        elif valve == 2:
-            self.setBits(1 << 9)
-        else:
+    def useGrouping(self, use: bool):
+        return self._run_sync(self.async_use_grouping(use))
+
+    @staticmethod
+    def valve_mask(valve) -> int:
+        """Return the status register bit of a valve numbered from 1."""
+        if not 1 <= valve <= len(FIELD_VALVES):
             raise Exception("Unsupported valve number: {}".format(valve))
+        return STATUS.mask(FIELD_VALVES[valve - 1])
+
+    async def async_open_valve(self, valve):
+        return await self.async_set_bits(self.valve_mask(valve))
+
+    def open_valve(self, valve):
+        return self._run_sync(self.async_open_valve(valve))
+
+    async def async_open_all_valves(self):
+        return await self.async_set_bits(STATUS.mask(*FIELD_VALVES))
 
     def open_all_valves(self):
-        self.setBits(0b11 << 8)
+        return self._run_sync(self.async_open_all_valves())
+
+    async def async_close_valve(self, valve):
+        return await self.async_clear_bits(self.valve_mask(valve))
 
     def close_valve(self, valve):
-        if valve == 1:
-            self.clearBits(1 << 8)
-        elif valve == 2:
-            self.clearBits(1 << 9)
-        else:
-            raise Exception("Unsupported valve number: ${valve}")
+        return self._run_sync(self.async_close_valve(valve))
+
+    async def async_close_all_valves(self):
+        return await self.async_clear_bits(STATUS.mask(*FIELD_VALVES))
 
     def close_all_valves(self):
-        self.clearBits(0b11 << 8)
+        return self._run_sync(self.async_close_all_valves())
 
-    def do_set_bool_attribute(self, status, value, mask) -> int:
-        if value == True or (isinstance(value, str) and value.lower()) == "true":
-            return status | mask
-        else:
-            return status & ~mask
+    async def async_set_config_attribute(self, attr_name, attr_value) -> bool:
+        """Sets config attribute"""
+        if attr_name not in CONFIG_ATTRIBUTES:
+            _LOGGER.error("Unsupported config attribute: {}".format(attr_name))
+            return False
+        value = attr_value == True or (
+            isinstance(attr_value, str) and attr_value.lower() == "true"
+        )
+        return await self._async_modify_status(
+            lambda status: STATUS.encode(status, **{attr_name: value}),
+            STATUS.mask(attr_name),
+        )
 
     def set_config_attribute(self, attr_name, attr_value):
         """Sets config attribute"""
-        result = self.read_holding_registers(REGISTER_STATUS)
-        if result is ModbusException:
-            _LOGGER.error(
-                "close_all_valves: Cannot read holding registers: {}".format(result)
-            )
-        else:
-            status = result.registers[0]
-            if attr_name == ATTR_KEYBOARD_LOCKED:
-                status = self.do_set_bool_attribute(
-                    status, attr_value, MASK_KEYBOARD_LOCKED
-                )
-            elif attr_name == ATTR_PESSIMISTIC_WIRELESS_SENSOR:
-                status = self.do_set_bool_attribute(
-                    status, attr_value, MASK_PESSIMISTIC_WIRELESS_SENSOR
-                )
-            elif attr_name == ATTR_VALVE_TWO_GROUPS:
-                status = self.do_set_bool_attribute(
-                    status, attr_value, MASK_VALVE_TWO_GROUPS
-                )
-            elif attr_name == ATTR_WIRELESS_PAIRING:
-                status = self.do_set_bool_attribute(
-                    status, attr_value, MASK_WIRELESS_PAIRING
-                )
-            elif attr_name == ATTR_FLOOR_WASHING:
-                status = self.do_set_bool_attribute(
-                    status, attr_value, MASK_FLOOR_WASHING
+        return self._run_sync(self.async_set_config_attribute(attr_name, attr_value))
+
+    async def async_read_holding_registers(
+        self, address, count=1, priority=PRIORITY_POLL, max_wait=None, max_age=None
+    ):
+        """Read holding registers.
+
+        A read joins a read of a range covering it that is already in
+        flight at the same or a more urgent priority, instead of sending its
+        own request. With ``max_age`` a result read that many seconds ago at
+        most is returned without using the bus at all.
+
+        Raises RequestExpired when the read waited longer than ``max_wait``
+        for the bus and was dropped unsent.
+        """
+        end = address + count
+        if max_age is not None:
+            now = time.monotonic()
+            for (first, last), (read_time, registers) in self._recent.items():
+                if first <= address and end <= last and now - read_time <= max_age:
+                    return ReadHoldingRegistersResponse(
+                        registers[address - first : end - first]
+                    )
+        for (first, last), (read_priority, task) in list(self._reads.items()):
+            if first <= address and end <= last and read_priority <= priority:
+                try:
+                    result = await asyncio.shield(task)
+                except RequestExpired:
+                    if max_wait is not None:
+                        raise
+                    break
+                if result is None or (first, last) == (address, end):
+                    return result
+                return ReadHoldingRegistersResponse(
+                    result.registers[address - first : end - first]
                 )
-            self.write_register(REGISTER_STATUS, status)
+        task = asyncio.get_running_loop().create_task(
+            self._async_read_holding_registers(address, count, priority, max_wait)
+        )
+        self._reads[(address, end)] = (priority, task)
+        try:
+            return await asyncio.shield(task)
+        finally:
+            if self._reads.get((address, end), (None, None))[1] is task:
+                del self._reads[(address, end)]
+
+    async def _async_read_holding_registers(self, address, count, priority, max_wait):
+        try:
+            result = await self._bus.async_execute(
+                self.unit,
+                "read_holding_registers",
+                address,
+                count,
+                priority=priority,
+                max_wait=max_wait,
+            )
+        except RequestExpired:
+            raise
+        except (ModbusException, asyncio.TimeoutError) as exception_error:
+            result = exception_error
+        if not hasattr(result, "registers"):
+            self._log_error(
+                "Reading {} registers at {}".format(count, address), result
+            )
+            return None
+        self._in_error = False
+        self._recent[(address, address + count)] = (
+            time.monotonic(),
+            result.registers,
+        )
+        if address <= REGISTER_STATUS < address + count:
+            self._update_status(result.registers[REGISTER_STATUS - address], True)
+        return result
+
+    def _invalidate_reads(self):
+        """Keep reads started before a write from serving later callers."""
+        self._reads.clear()
+        self._recent.clear()
 
     def read_holding_registers(self, address, count=1):
         """Read holding registers."""
-        with self._lock:
-            try:
-                result = self._client.read_holding_registers(address, count, NEPTUN_UNIT)
-            except ModbusException as exception_error:
-                result = exception_error
-            if not hasattr(result, "registers"):
-                self._log_error(result)
-                return None
-            self._in_error = False
-            return result
+        return self._run_sync(self.async_read_holding_registers(address, count))
 
-    def write_register(self, address, value) -> bool:
+    async def async_write_register(
+        self, address, value, priority=PRIORITY_COMMAND
+    ) -> bool:
         """Write register."""
-        with self._lock:
-            try:
-                result = self._client.write_register(address, value, NEPTUN_UNIT)
-                _LOGGER.debug(
-                    "*** WriteRegister result: {}, func code={}".format(
-                        result, result.function_code
-                    )
+        try:
+            result = await self._bus.async_execute(
+                self.unit, "write_register", address, value, priority=priority
+            )
+            _LOGGER.debug(
+                "*** WriteRegister result: {}, func code={}".format(
+                    result, result.function_code
                 )
-            except ModbusException as exception_error:
-                result = exception_error
-            if not hasattr(result, "function_code") or result.function_code > 0x80:
-                self._log_error(result)
-                return False
-            self._in_error = False
-            return True
+            )
+        except (ModbusException, asyncio.TimeoutError) as exception_error:
+            result = exception_error
+        if not hasattr(result, "function_code") or result.function_code > 0x80:
+            self._log_error("Writing register {}".format(address), result)
+            return False
+        self._in_error = False
+        self._invalidate_reads()
+        if address == REGISTER_STATUS:
+            self._update_status(value, False)
+        return True
 
-    # def write_registers(self, unit, address, values) -> bool:
-    #     """Write registers."""
-    #     with self._lock:
-    #         kwargs = {"unit": unit} if unit else {}
-    #         try:
-    #             result = self._client.write_registers(address, values, **kwargs)
-    #         except ModbusException as exception_error:
-    #             result = exception_error
-    #         if not hasattr(result, "registers"):
-    #             self._log_error(result)
-    #             return False
-    #         self._in_error = False
-    #         return True
-
-
-class MqttClient:
-    def __init__(self, client_config):
-        return
+    def write_register(self, address, value) -> bool:
+        """Write register."""
+        return self._run_sync(self.async_write_register(address, value))
 
-    def setup(self):
-        return
+    async def async_write_registers(
+        self, address, values, priority=PRIORITY_COMMAND
+    ) -> bool:
+        """Write consecutive registers with a single FC16 transaction."""
+        try:
+            result = await self._bus.async_execute(
+                self.unit, "write_registers", address, values, priority=priority
+            )
+        except (ModbusException, asyncio.TimeoutError) as exception_error:
+            result = exception_error
+        if not hasattr(result, "function_code") or result.function_code > 0x80:
+            self._log_error(
+                "Writing {} registers at {}".format(len(values), address), result
+            )
+            return False
+        self._in_error = False
+        self._invalidate_reads()
+        if address <= REGISTER_STATUS < address + len(values):
+            self._update_status(values[REGISTER_STATUS - address], False)
+        return True
+
+    def write_registers(self, address, values) -> bool:
+        """Write consecutive registers with a single FC16 transaction."""
+        return self._run_sync(self.async_write_registers(address, values))
+
+    def transaction(self) -> "RegisterTransaction":
+        """Return a new transaction collecting register writes."""
+        return RegisterTransaction(self)
+
+    async def async_set_meter_counters(self, counters) -> bool:
+        """Set meter counters, in litres, keyed by slot numbered from 0."""
+        transaction = self.transaction()
+        for slot, litres in counters.items():
+            transaction.write_many(meter_register(slot), METER_COUNTER.words(litres))
+        return await transaction.async_commit()
+
+
+class RegisterTransaction:
+    """Register writes of a hub committed together.
+
+    Writes are collected first, then adjacent registers are merged into as
+    few FC16 frames as possible and everything written is checked with one
+    block read. ``verify_mask`` leaves out bits the module changes by
+    itself, such as the valve bits while the motors move.
+    """
+
+    def __init__(self, hub: NeptunHub):
+        """Initialize an empty transaction."""
+        self._hub = hub
+        self._writes: dict[int, tuple[int, int]] = {}
+
+    def write(self, address, value, verify_mask=0xFFFF):
+        """Add a register write, replacing any earlier one to that address."""
+        self._writes[address] = (value & 0xFFFF, verify_mask)
+
+    def write_many(self, address, values, verify_mask=0xFFFF):
+        """Add writes to consecutive registers."""
+        for offset, value in enumerate(values):
+            self.write(address + offset, value, verify_mask)
+
+    @staticmethod
+    def _runs(addresses, limit):
+        """Split sorted addresses into runs of adjacent registers."""
+        run = []
+        for address in addresses:
+            if run and (address != run[-1] + 1 or len(run) == limit):
+                yield run
+                run = []
+            run.append(address)
+        if run:
+            yield run
+
+    @staticmethod
+    def _spans(addresses, limit):
+        """Split sorted addresses into blocks read with one request each."""
+        span = []
+        for address in addresses:
+            if span and address - span[0] >= limit:
+                yield span
+                span = []
+            span.append(address)
+        if span:
+            yield span
+
+    async def async_commit(self, priority=PRIORITY_COMMAND) -> bool:
+        """Write the collected registers and read them back.
+
+        Returns False if a write failed or a register reads back a value
+        other than the one written.
+        """
+        if not self._writes:
+            return True
+        addresses = sorted(self._writes)
+        hub = self._hub
+        for run in self._runs(addresses, MAX_WRITE_REGISTERS):
+            values = [self._writes[address][0] for address in run]
+            if len(run) == 1:
+                written = await hub.async_write_register(run[0], values[0], priority)
+            else:
+                written = await hub.async_write_registers(run[0], values, priority)
+            if not written:
+                return False
+        for span in self._spans(addresses, MAX_READ_REGISTERS):
+            first = span[0]
+            result = await hub.async_read_holding_registers(
+                first, span[-1] - first + 1, priority=priority
+            )
+            if result is None:
+                return False
+            for address in span:
+                value, verify_mask = self._writes[address]
+                read = result.registers[address - first]
+                if (read ^ value) & verify_mask:
+                    _LOGGER.error(
+                        "Register {} of {} reads {} after writing {}".format(
+                            address, hub.name, read, value
+                        )
+                    )
+                    return False
+        self._writes.clear()
+        return True
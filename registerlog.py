@@ -0,0 +1,79 @@
+"""Raw register change log of Neptun hubs."""
+from __future__ import annotations
+
+from array import array
+import time
+
+# register changes kept per hub, 12 bytes each
+REGISTER_LOG_SIZE = 8192
+
+
+class RegisterLog:
+    """Fixed-size ring buffer of (timestamp, address, word) register changes.
+
+    The columns live in preallocated arrays, so the memory used does not
+    depend on the uptime or on how busy the hub is. Timestamps are
+    monotonic, they are converted to wall clock time when exported. When
+    the buffer is full the oldest change is overwritten.
+    """
+
+    def __init__(self, size=REGISTER_LOG_SIZE):
+        """Initialize the log."""
+        self._times = array("d", bytes(8 * size))
+        self._addresses = array("H", bytes(2 * size))
+        self._words = array("H", bytes(2 * size))
+        self._size = size
+        self._head = 0
+        self._count = 0
+
+    def __len__(self):
+        """Return the number of logged changes."""
+        return self._count
+
+    def _index(self, position):
+        return (self._head + position) % self._size
+
+    def append(self, timestamp: float, address: int, word: int):
+        """Log a register taking a new value."""
+        if self._count == self._size:
+            tail = self._head
+            self._head = self._index(1)
+        else:
+            tail = self._index(self._count)
+            self._count += 1
+        self._times[tail] = timestamp
+        self._addresses[tail] = address
+        self._words[tail] = word
+
+    def _bisect(self, timestamp) -> int:
+        """Return the position of the first change logged at or after a time."""
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            if self._times[self._index(middle)] < timestamp:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def query(self, start=None, end=None):
+        """Yield the changes logged between two monotonic times, oldest first."""
+        first = 0 if start is None else self._bisect(start)
+        last = self._count if end is None else self._bisect(end)
+        for position in range(first, last):
+            index = self._index(position)
+            yield self._times[index], self._addresses[index], self._words[index]
+
+    def export(self, start=None, end=None) -> list[tuple[float, int, int]]:
+        """Return the changes between two wall clock times.
+
+        Timestamps are converted to seconds since the epoch.
+        """
+        offset = time.time() - time.monotonic()
+        return [
+            (timestamp + offset, address, word)
+            for timestamp, address, word in self.query(
+                None if start is None else start - offset,
+                None if end is None else end - offset,
+            )
+        ]
@@ -0,0 +1,221 @@
+"""Declarative map of the Neptun module registers."""
+from __future__ import annotations
+
+from types import MappingProxyType
+from typing import Mapping, NamedTuple
+
+from const import (
+    ATTR_BATTERY_LOW,
+    ATTR_FLOOR_WASHING,
+    ATTR_KEYBOARD_LOCKED,
+    ATTR_PESSIMISTIC_WIRELESS_SENSOR,
+    ATTR_VALVE_TWO_GROUPS,
+    ATTR_WIRELESS_PAIRING,
+    REGISTER_METER_COUNTERS,
+    REGISTER_STATUS,
+    REGISTER_WIRELESS_COUNT,
+    REGISTER_WIRELESS_STATUS,
+)
+
+# decoded values of bit-field layouts are cached, such a register rarely
+# takes many values
+DECODE_CACHE_SIZE = 4096
+
+# field names
+FIELD_ALARM = "alarm"
+FIELD_VALVES = ("valve_1", "valve_2")
+FIELD_LEAK = "leak"
+FIELD_LOST = "lost"
+FIELD_SIGNAL = "signal"
+FIELD_BATTERY = "battery"
+FIELD_VALUE = "value"
+
+
+class Field(NamedTuple):
+    """A bit field of a register.
+
+    Flags decode to True when any of their bits is set, other fields to
+    the integer stored in their bits.
+    """
+
+    name: str
+    mask: int
+    flag: bool = True
+
+    @property
+    def shift(self) -> int:
+        """Return the position of the lowest bit of the field."""
+        return (self.mask & -self.mask).bit_length() - 1
+
+
+class Layout:
+    """Bit layout shared by all registers of one kind.
+
+    The field extractors are precomputed once. Layouts with flags are bit
+    fields whose decoded words are cached, so decoding them costs a dict
+    lookup whatever number of fields they have. Plain values such as
+    counters keep growing and never repeat, they are decoded directly.
+    """
+
+    def __init__(self, name, fields, width=1, write_mask=None):
+        """Initialize the layout."""
+        self.name = name
+        self.width = width
+        self.fields = {field.name: field for field in fields}
+        self.write_mask = (
+            write_mask if write_mask is not None else (1 << 16 * width) - 1
+        )
+        self._extractors = tuple(
+            (field.name, field.mask, field.shift, field.flag) for field in fields
+        )
+        self._cache: dict[int, Mapping[str, int | bool]] | None = (
+            {} if any(field.flag for field in fields) else None
+        )
+
+    def mask(self, *names) -> int:
+        """Return the bits of the named fields."""
+        mask = 0
+        for name in names:
+            mask |= self.fields[name].mask
+        return mask
+
+    def decode(self, word) -> Mapping[str, int | bool]:
+        """Return the read-only values of all fields of a word."""
+        if self._cache is None:
+            return self._decode(word)
+        values = self._cache.get(word)
+        if values is None:
+            values = self._decode(word)
+            if len(self._cache) < DECODE_CACHE_SIZE:
+                self._cache[word] = values
+        return values
+
+    def _decode(self, word) -> Mapping[str, int | bool]:
+        return MappingProxyType(
+            {
+                name: (word & mask) != 0 if flag else (word & mask) >> shift
+                for name, mask, shift, flag in self._extractors
+            }
+        )
+
+    def words(self, word) -> tuple[int, ...]:
+        """Split a value into its 16-bit registers, high word first."""
+        return tuple(
+            (word >> 16 * (self.width - 1 - offset)) & 0xFFFF
+            for offset in range(self.width)
+        )
+
+    def encode(self, word, **values) -> int:
+        """Return a word with the given fields replaced, ready to be written."""
+        for name, value in values.items():
+            field = self.fields[name]
+            if field.flag:
+                word = word | field.mask if value else word & ~field.mask
+            else:
+                word = (word & ~field.mask) | ((value << field.shift) & field.mask)
+        return word & self.write_mask
+
+
+STATUS = Layout(
+    "status",
+    (
+        Field(ATTR_FLOOR_WASHING, 0b0000000000001),
+        Field(FIELD_ALARM, 0b0000000000110),
+        Field(ATTR_WIRELESS_PAIRING, 0b0000010000000),
+        Field(FIELD_VALVES[0], 0b0000100000000),
+        Field(FIELD_VALVES[1], 0b0001000000000),
+        Field(ATTR_VALVE_TWO_GROUPS, 0b0010000000000),
+        Field(ATTR_PESSIMISTIC_WIRELESS_SENSOR, 0b0100000000000),
+        Field(ATTR_KEYBOARD_LOCKED, 0b1000000000000),
+    ),
+    # only meaningful bits of the status register are written back
+    write_mask=0x1FFF,
+)
+
+# status fields that can be changed with the set_config_attribute service
+CONFIG_ATTRIBUTES = (
+    ATTR_KEYBOARD_LOCKED,
+    ATTR_PESSIMISTIC_WIRELESS_SENSOR,
+    ATTR_VALVE_TWO_GROUPS,
+    ATTR_WIRELESS_PAIRING,
+    ATTR_FLOOR_WASHING,
+)
+
+COUNT = Layout("count", (Field(FIELD_VALUE, 0xFFFF, flag=False),))
+
+WIRELESS_SENSOR = Layout(
+    "wireless_sensor",
+    (
+        Field(FIELD_LEAK, 0b0000000000000001),
+        Field(ATTR_BATTERY_LOW, 0b0000000000000010),
+        Field(FIELD_LOST, 0b0000000000000100),
+        Field(FIELD_SIGNAL, 0b0000000011100000, flag=False),
+        Field(FIELD_BATTERY, 0b1111111100000000, flag=False),
+    ),
+)
+
+# 32-bit counter in litres, high word first
+METER_COUNTER = Layout(
+    "meter_counter", (Field(FIELD_VALUE, 0xFFFFFFFF, flag=False),), width=2
+)
+
+
+def wireless_sensor_register(slot) -> int:
+    """Return the status register of a wireless sensor slot."""
+    return REGISTER_WIRELESS_STATUS + slot
+
+
+def meter_register(slot) -> int:
+    """Return the first counter register of a meter slot."""
+    return REGISTER_METER_COUNTERS + 2 * slot
+
+
+class RegisterMap:
+    """The registers polled from one hub and their layouts.
+
+    The map covers one contiguous block starting at the status register,
+    so a hub is polled with a single read whatever it is configured with.
+    """
+
+    def __init__(self, wireless_sensors=0, meters=0):
+        """Initialize the map for the configured sensors and meters."""
+        registers = {REGISTER_STATUS: STATUS}
+        if wireless_sensors:
+            registers[REGISTER_WIRELESS_COUNT] = COUNT
+            for slot in range(wireless_sensors):
+                registers[wireless_sensor_register(slot)] = WIRELESS_SENSOR
+        for slot in range(meters):
+            registers[meter_register(slot)] = METER_COUNTER
+        self._registers = registers
+        # every polled address points to the register it is a part of
+        self._owners = {
+            address + offset: address
+            for address, layout in registers.items()
+            for offset in range(layout.width)
+        }
+        self.register_count = (
+            max(address + layout.width for address, layout in registers.items())
+            - REGISTER_STATUS
+        )
+
+    def decode(self, data, changed=None) -> dict[int, Mapping[str, int | bool]]:
+        """Decode a register block, only the registers touched by ``changed``.
+
+        ``changed`` holds the addresses of the words that changed, None
+        decodes every register of the map.
+        """
+        if changed is None:
+            addresses = self._registers
+        else:
+            addresses = {
+                self._owners[address] for address in changed if address in self._owners
+            }
+        values = {}
+        for address in addresses:
+            layout = self._registers[address]
+            index = address - REGISTER_STATUS
+            word = data[index]
+            for offset in range(1, layout.width):
+                word = (word << 16) | data[index + offset]
+            values[address] = layout.decode(word)
+        return values
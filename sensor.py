@@ -0,0 +1,393 @@
+"""Support for Neptun wireless sensor measurements."""
+from __future__ import annotations
+
+import logging
+import time
+from typing import Any, Mapping
+
+from homeassistant.components.sensor import (
+    SensorDeviceClass,
+    SensorEntity,
+    SensorStateClass,
+)
+from homeassistant.const import (
+    CONF_NAME,
+    PERCENTAGE,
+    UnitOfTime,
+    UnitOfVolume,
+)
+from homeassistant.core import CALLBACK_TYPE, HomeAssistant, callback
+from homeassistant.helpers.entity import EntityCategory
+from homeassistant.helpers.event import async_call_later
+from homeassistant.helpers.typing import ConfigType, DiscoveryInfoType
+
+from .const import (
+    CONF_METERS,
+    CONF_WIRELESS_SENSORS,
+    NEPTUN_DOMAIN,
+    REGISTER_WIRELESS_COUNT,
+)
+from .coordinator import NeptunCoordinator
+from .entity import NeptunEntity
+from .history import (
+    LITRES_PER_CUBIC_METER,
+    METER_FLUSH_INTERVAL,
+    NeptunMeterStatistics,
+)
+from .registers import (
+    FIELD_BATTERY,
+    FIELD_LOST,
+    FIELD_SIGNAL,
+    FIELD_VALUE,
+    meter_register,
+    wireless_sensor_register,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+
+async def async_setup_platform(
+    hass: HomeAssistant,
+    config: ConfigType,
+    async_add_entities,
+    discovery_info: DiscoveryInfoType | None = None,
+):
+    """Set up the Neptun sensors."""
+    sensors = []
+
+    coordinator: NeptunCoordinator = hass.data[NEPTUN_DOMAIN][discovery_info[CONF_NAME]]
+    wireless = discovery_info.get(CONF_WIRELESS_SENSORS, [])
+    for slot, sensorName in enumerate(wireless):
+        sensors.append(NeptunWirelessBatterySensor(coordinator, sensorName, slot))
+        sensors.append(NeptunWirelessSignalSensor(coordinator, sensorName, slot))
+    for sensor_class in TRANSPORT_SENSORS:
+        sensors.append(sensor_class(coordinator))
+    for slot, meterName in enumerate(discovery_info.get(CONF_METERS, [])):
+        sensors.append(NeptunMeterSensor(coordinator, meterName, slot))
+        if "recorder" in hass.config.components:
+            # consumption goes to the long-term statistics in hourly batches
+            statistics = NeptunMeterStatistics(hass, coordinator, meterName, slot)
+            await statistics.async_start()
+    _LOGGER.debug("*** Adding sensors: {}".format(sensors))
+    async_add_entities(sensors)
+
+
+class NeptunWirelessSlotSensor(NeptunEntity, SensorEntity):
+    """Base class for a value decoded from a wireless sensor slot."""
+
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+    _attr_state_class = SensorStateClass.MEASUREMENT
+    _field = ""
+
+    def __init__(self, coordinator: NeptunCoordinator, sensorName: str, slot: int):
+        """Initialize the sensor."""
+        self._coordinator = coordinator
+        self._name = "{}.{}".format(sensorName, self._field)
+        self._slot = slot
+        self._register = wireless_sensor_register(slot)
+        self._value = None
+        self._available = False
+
+    async def async_added_to_hass(self):
+        """Handle entity which will be added."""
+        # only pushed when this slot's word or the sensor count changes
+        self.async_on_remove(
+            self._coordinator.async_add_listener(
+                self._handle_coordinator_update,
+                (REGISTER_WIRELESS_COUNT, self._register),
+            )
+        )
+        if self._coordinator.data is not None:
+            self._handle_coordinator_update()
+
+    @property
+    def name(self):
+        """Return the name of the sensor."""
+        return self._name
+
+    @property
+    def native_value(self):
+        """Return the decoded value."""
+        return self._value
+
+    @property
+    def should_poll(self):
+        """Return False, the hub coordinator pushes the state."""
+        return False
+
+    @property
+    def available(self) -> bool:
+        """Return True if the wireless sensor is paired and reachable."""
+        return self._available
+
+    @callback
+    def _handle_coordinator_update(self) -> None:
+        """Decode the slot's status word from the hub snapshot."""
+        if not self._coordinator.last_update_success:
+            self._available = False
+        else:
+            count = self._coordinator.decoded(REGISTER_WIRELESS_COUNT)[FIELD_VALUE]
+            sensor = self._coordinator.decoded(self._register)
+            self._available = self._slot < count and not sensor[FIELD_LOST]
+            self._value = sensor[self._field]
+        self.async_write_changed_state()
+
+
+class NeptunWirelessBatterySensor(NeptunWirelessSlotSensor):
+    """Battery level of a wireless sensor."""
+
+    _attr_device_class = SensorDeviceClass.BATTERY
+    _attr_native_unit_of_measurement = PERCENTAGE
+    _field = FIELD_BATTERY
+
+
+class NeptunWirelessSignalSensor(NeptunWirelessSlotSensor):
+    """Radio signal level (0-4) of a wireless sensor."""
+
+    _attr_icon = "mdi:signal"
+    _field = FIELD_SIGNAL
+
+
+class NeptunMeterSensor(NeptunEntity, SensorEntity):
+    """Reading of a water meter connected to the hub.
+
+    The counter moves on every poll while water flows, so a new reading is
+    written at most once per METER_FLUSH_INTERVAL, along with the imported
+    statistics. Availability changes are written at once.
+    """
+
+    _attr_device_class = SensorDeviceClass.WATER
+    _attr_native_unit_of_measurement = UnitOfVolume.CUBIC_METERS
+    _attr_icon = "mdi:counter"
+
+    def __init__(self, coordinator: NeptunCoordinator, meterName: str, slot: int):
+        """Initialize the sensor."""
+        self._coordinator = coordinator
+        self._name = meterName
+        self._register = meter_register(slot)
+        self._value = None
+        self._available = False
+        self._shown: tuple | None = None
+        self._next_write = 0.0
+        self._unsub_write: CALLBACK_TYPE | None = None
+
+    async def async_added_to_hass(self):
+        """Handle entity which will be added."""
+        # only pushed when the counter moves, not on every poll
+        self.async_on_remove(
+            self._coordinator.async_add_listener(
+                self._handle_coordinator_update,
+                (self._register, self._register + 1),
+            )
+        )
+        self.async_on_remove(self._cancel_write)
+        if self._coordinator.data is not None:
+            self._handle_coordinator_update()
+
+    @property
+    def name(self):
+        """Return the name of the meter."""
+        return self._name
+
+    @property
+    def native_value(self):
+        """Return the meter reading."""
+        return self._value
+
+    @property
+    def should_poll(self):
+        """Return False, the hub coordinator pushes the state."""
+        return False
+
+    @property
+    def available(self) -> bool:
+        """Return True if the hub is reachable."""
+        return self._available
+
+    @callback
+    def _handle_coordinator_update(self) -> None:
+        """Decode the counter from the hub snapshot."""
+        self._available = self._coordinator.last_update_success
+        if self._available:
+            self._value = (
+                self._coordinator.decoded(self._register)[FIELD_VALUE]
+                / LITRES_PER_CUBIC_METER
+            )
+        delay = self._next_write - time.monotonic()
+        if delay > 0 and (self._available, self.assumed_state) == self._shown:
+            # only the reading moved, written when the interval is over
+            if self._unsub_write is None:
+                self._unsub_write = async_call_later(
+                    self.hass, delay, self._write_by_timer
+                )
+            return
+        self._write_meter_state()
+
+    @callback
+    def _write_by_timer(self, now=None) -> None:
+        self._unsub_write = None
+        self._write_meter_state()
+
+    @callback
+    def _write_meter_state(self) -> None:
+        """Write the state and start a new write interval."""
+        self._cancel_write()
+        self._shown = (self._available, self.assumed_state)
+        self._next_write = time.monotonic() + METER_FLUSH_INTERVAL.total_seconds()
+        self.async_write_changed_state()
+
+    @callback
+    def _cancel_write(self) -> None:
+        if self._unsub_write:
+            self._unsub_write()
+            self._unsub_write = None
+
+
+class NeptunTransportSensor(SensorEntity):
+    """Base class for a transport metric of a hub.
+
+    The metrics are plain counters in memory, so these sensors are polled
+    on the Home Assistant scan interval instead of following every poll.
+    """
+
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+    _metric = ""
+
+    def __init__(self, coordinator: NeptunCoordinator):
+        """Initialize the sensor."""
+        self._hub = coordinator.hub
+        self._name = "{}.{}.{}".format(NEPTUN_DOMAIN, coordinator.name, self._metric)
+        self._value = None
+        self._attributes = {}
+
+    @property
+    def name(self):
+        """Return the name of the sensor."""
+        return self._name
+
+    @property
+    def native_value(self):
+        """Return the metric value."""
+        return self._value
+
+    @property
+    def extra_state_attributes(self) -> Mapping[str, Any] | None:
+        return self._attributes
+
+    async def async_update(self):
+        """Read the metric from the transport counters."""
+        self._value = self._measure(self._hub.metrics, self._hub.bus.metrics)
+
+    def _measure(self, metrics, bus_metrics):
+        raise NotImplementedError
+
+
+class NeptunIntervalMeanSensor(NeptunTransportSensor):
+    """Mean of a histogram over the last update interval, in milliseconds."""
+
+    _attr_native_unit_of_measurement = UnitOfTime.MILLISECONDS
+    _attr_state_class = SensorStateClass.MEASUREMENT
+    _histogram = ""
+
+    def __init__(self, coordinator: NeptunCoordinator):
+        """Initialize the sensor."""
+        super().__init__(coordinator)
+        self._last_sum = 0.0
+        self._last_count = 0
+
+    def _measure(self, metrics, bus_metrics):
+        histogram = getattr(metrics, self._histogram)
+        count = histogram.count - self._last_count
+        mean = (histogram.sum - self._last_sum) / count if count else None
+        self._last_sum = histogram.sum
+        self._last_count = histogram.count
+        return None if mean is None else round(mean * 1000, 2)
+
+
+class NeptunLatencySensor(NeptunIntervalMeanSensor):
+    """Mean transaction latency of a hub."""
+
+    _attr_icon = "mdi:timer-outline"
+    _metric = "latency"
+    _histogram = "latency"
+
+    def _measure(self, metrics, bus_metrics):
+        self._attributes = {
+            "requests": metrics.requests,
+            "bytes_sent": metrics.bytes_sent,
+            "bytes_received": metrics.bytes_received,
+        }
+        return super()._measure(metrics, bus_metrics)
+
+
+class NeptunQueueWaitSensor(NeptunIntervalMeanSensor):
+    """Mean time the transactions of a hub waited for the port."""
+
+    _attr_icon = "mdi:timer-sand"
+    _metric = "queue_wait"
+    _histogram = "queue_wait"
+
+
+class NeptunTimeoutsSensor(NeptunTransportSensor):
+    """Transactions of a hub that were not answered in time."""
+
+    _attr_icon = "mdi:timer-alert-outline"
+    _attr_state_class = SensorStateClass.TOTAL_INCREASING
+    _metric = "timeouts"
+
+    def _measure(self, metrics, bus_metrics):
+        return metrics.timeouts
+
+
+class NeptunErrorsSensor(NeptunTransportSensor):
+    """Failed transactions of a hub."""
+
+    _attr_icon = "mdi:alert-circle-outline"
+    _attr_state_class = SensorStateClass.TOTAL_INCREASING
+    _metric = "errors"
+
+    def _measure(self, metrics, bus_metrics):
+        self._attributes = {
+            "timeouts": metrics.timeouts,
+            "exceptions": metrics.exceptions,
+            "frame_errors": metrics.frame_errors,
+            "failures": metrics.failures,
+        }
+        return metrics.errors
+
+
+class NeptunBusBusySensor(NeptunTransportSensor):
+    """Share of the last update interval the hub's port was busy."""
+
+    _attr_icon = "mdi:transit-connection-variant"
+    _attr_native_unit_of_measurement = PERCENTAGE
+    _attr_state_class = SensorStateClass.MEASUREMENT
+    _metric = "bus_busy"
+
+    def __init__(self, coordinator: NeptunCoordinator):
+        """Initialize the sensor."""
+        super().__init__(coordinator)
+        self._last_busy = None
+        self._last_time = None
+
+    def _measure(self, metrics, bus_metrics):
+        self._attributes = {
+            "port": bus_metrics.port,
+            "queue_depth": bus_metrics.queue_depth,
+            "reconnects": bus_metrics.reconnects,
+        }
+        now = time.monotonic()
+        last_busy, last_time = self._last_busy, self._last_time
+        self._last_busy, self._last_time = bus_metrics.busy, now
+        if last_time is None or now <= last_time:
+            return round(100 * bus_metrics.busy_ratio, 1)
+        return round(100 * (bus_metrics.busy - last_busy) / (now - last_time), 1)
+
+
+TRANSPORT_SENSORS = (
+    NeptunLatencySensor,
+    NeptunQueueWaitSensor,
+    NeptunTimeoutsSensor,
+    NeptunErrorsSensor,
+    NeptunBusBusySensor,
+)
@@ -0,0 +1,403 @@
+"""Simulated Neptun module for running the integration without hardware.
+
+The simulator answers Modbus requests like a Neptun module: it keeps the
+status register with its valve bits and config flags, wireless sensor
+slots and meter counters. It is reachable over a pty pair (RTU framing)
+and over TCP (Modbus TCP or RTU over TCP framing), and can add response
+latency, serial line timing, dropped and garbled frames and slow valve
+motors.
+
+    python simulator.py --pty --wireless 4 --valve-time 5
+    python simulator.py --tcp 5020 --framing rtu --latency 0.02 --drop 0.01
+
+Point a hub at the printed pty path (connection type serial) or at the TCP
+port (connection type tcp or rtuovertcp).
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+import os
+import random
+import struct
+import termios
+import tty
+
+from const import (
+    NEPTUN_UNIT,
+    REGISTER_STATUS,
+    REGISTER_WIRELESS_COUNT,
+)
+from registers import (
+    FIELD_ALARM,
+    FIELD_LEAK,
+    FIELD_VALVES,
+    STATUS,
+    WIRELESS_SENSOR,
+    meter_register,
+    wireless_sensor_register,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+REGISTER_COUNT = 200
+
+FUNCTION_READ_HOLDING_REGISTERS = 0x03
+FUNCTION_WRITE_REGISTER = 0x06
+FUNCTION_WRITE_REGISTERS = 0x10
+EXCEPTION_ILLEGAL_FUNCTION = 0x01
+EXCEPTION_ILLEGAL_ADDRESS = 0x02
+
+# request length by function code, FC16 frames carry their byte count
+RTU_REQUEST_SIZE = {FUNCTION_READ_HOLDING_REGISTERS: 8, FUNCTION_WRITE_REGISTER: 8}
+RTU_WRITE_REGISTERS_HEADER = 7
+CRC_SIZE = 2
+
+VALVES_MASK = STATUS.mask(*FIELD_VALVES)
+LEAK_ALARM_MASK = STATUS.mask(FIELD_ALARM)
+
+
+def crc16(data: bytes) -> bytes:
+    """Return the Modbus RTU CRC of a frame, low byte first."""
+    crc = 0xFFFF
+    for byte in data:
+        crc ^= byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0xA001 if crc & 1 else crc >> 1
+    return struct.pack("<H", crc)
+
+
+class SimulatedModule:
+    """Register model of one Neptun module.
+
+    Valve bits written to the status register only show up once the
+    simulated motor has finished its travel. A leak reported by a wireless
+    sensor raises the alarm and closes the valves, as the module does.
+    """
+
+    def __init__(
+        self, unit=NEPTUN_UNIT, wireless_sensors=0, meters=0, valve_time=0.0
+    ):
+        """Initialize the module."""
+        self.unit = unit
+        self.registers = [0] * REGISTER_COUNT
+        self.valve_time = valve_time
+        self.reads = 0
+        self.writes = 0
+        self._motor = None
+        self.registers[REGISTER_WIRELESS_COUNT] = wireless_sensors
+        for slot in range(wireless_sensors):
+            self.set_wireless(slot, battery=100, signal=4)
+        self._meters = meters
+
+    @property
+    def status(self) -> int:
+        """Return the status register value."""
+        return self.registers[REGISTER_STATUS]
+
+    def execute(self, pdu: bytes) -> bytes:
+        """Execute a request PDU and return the response PDU."""
+        function = pdu[0]
+        if function == FUNCTION_READ_HOLDING_REGISTERS:
+            address, count = struct.unpack(">HH", pdu[1:5])
+            if address + count > REGISTER_COUNT:
+                return bytes([function | 0x80, EXCEPTION_ILLEGAL_ADDRESS])
+            self.reads += 1
+            values = self.registers[address : address + count]
+            return struct.pack(">BB{}H".format(count), function, 2 * count, *values)
+        if function == FUNCTION_WRITE_REGISTER:
+            address, value = struct.unpack(">HH", pdu[1:5])
+            if address >= REGISTER_COUNT:
+                return bytes([function | 0x80, EXCEPTION_ILLEGAL_ADDRESS])
+            self._write(address, value)
+            return pdu[:5]
+        if function == FUNCTION_WRITE_REGISTERS:
+            address, count = struct.unpack(">HH", pdu[1:5])
+            if address + count > REGISTER_COUNT:
+                return bytes([function | 0x80, EXCEPTION_ILLEGAL_ADDRESS])
+            values = struct.unpack(">{}H".format(count), pdu[6 : 6 + 2 * count])
+            for offset, value in enumerate(values):
+                self._write(address + offset, value)
+            return pdu[:5]
+        return bytes([function | 0x80, EXCEPTION_ILLEGAL_FUNCTION])
+
+    def _write(self, address, value):
+        self.writes += 1
+        if address != REGISTER_STATUS:
+            self.registers[address] = value
+            return
+        value &= STATUS.write_mask
+        # everything but the valves takes effect at once
+        self.registers[REGISTER_STATUS] = (value & ~VALVES_MASK) | (
+            self.status & VALVES_MASK
+        )
+        self._move_valves(value & VALVES_MASK)
+
+    def _move_valves(self, valves):
+        """Drive the valves to a new position, taking valve_time to travel."""
+        if self._motor is not None:
+            self._motor.cancel()
+            self._motor = None
+        if (self.status & VALVES_MASK) == valves:
+            return
+        if self.valve_time <= 0:
+            self._set_valves(valves)
+        else:
+            self._motor = asyncio.get_running_loop().call_later(
+                self.valve_time, self._set_valves, valves
+            )
+
+    def _set_valves(self, valves):
+        self._motor = None
+        self.registers[REGISTER_STATUS] = (self.status & ~VALVES_MASK) | valves
+
+    def set_wireless(self, slot, **fields):
+        """Change fields (leak, battery, signal...) of a wireless sensor slot."""
+        register = wireless_sensor_register(slot)
+        self.registers[register] = WIRELESS_SENSOR.encode(
+            self.registers[register], **fields
+        )
+        if fields.get(FIELD_LEAK):
+            self.raise_alarm()
+
+    def raise_alarm(self):
+        """Report a leak: raise the alarm and close the valves."""
+        self.registers[REGISTER_STATUS] |= LEAK_ALARM_MASK
+        self._move_valves(0)
+
+    def add_consumption(self, slot, litres):
+        """Advance a meter counter."""
+        if slot >= self._meters:
+            raise ValueError("Meter {} is not simulated".format(slot))
+        register = meter_register(slot)
+        value = (self.registers[register] << 16) | self.registers[register + 1]
+        value = (value + litres) & 0xFFFFFFFF
+        self.registers[register] = value >> 16
+        self.registers[register + 1] = value & 0xFFFF
+
+
+class Simulator:
+    """Modules on one simulated bus plus the faults injected on it.
+
+    ``latency`` delays every response, ``baudrate`` adds the time frames
+    take on a serial line and, on a pty, makes requests sent at another
+    baud rate go unanswered. ``drop_rate`` and ``garble_rate`` are the
+    probabilities of a request going unanswered or of a corrupted
+    response.
+    """
+
+    def __init__(
+        self,
+        modules,
+        latency=0.0,
+        baudrate=None,
+        drop_rate=0.0,
+        garble_rate=0.0,
+        seed=None,
+    ):
+        """Initialize the simulator."""
+        self.modules = {module.unit: module for module in modules}
+        self.latency = latency
+        self.baudrate = baudrate
+        self.drop_rate = drop_rate
+        self.garble_rate = garble_rate
+        self.requests = 0
+        self.dropped = 0
+        self.garbled = 0
+        self._random = random.Random(seed)
+        self._pty_task = None
+        self._pty_slave = None
+        # one transaction at a time, like a half-duplex RS-485 line
+        self._line = asyncio.Lock()
+
+    def wire_time(self, size) -> float:
+        """Return the seconds a frame of ``size`` bytes spends on the line."""
+        if not self.baudrate:
+            return 0.0
+        return size * 10 / self.baudrate
+
+    async def async_transact(self, unit, pdu: bytes, frame_size) -> bytes | None:
+        """Answer a request PDU, None when no response is sent."""
+        async with self._line:
+            self.requests += 1
+            await asyncio.sleep(self.wire_time(frame_size))
+            module = self.modules.get(unit)
+            if module is None:
+                return None
+            if self._random.random() < self.drop_rate:
+                self.dropped += 1
+                _LOGGER.debug("Dropping request for unit {}".format(unit))
+                return None
+            response = module.execute(pdu)
+            await asyncio.sleep(
+                self.latency + self.wire_time(len(response) + frame_size - len(pdu))
+            )
+            return response
+
+    def garble(self, frame: bytes) -> bytes:
+        """Corrupt a response frame with the configured probability."""
+        if self._random.random() >= self.garble_rate:
+            return frame
+        self.garbled += 1
+        frame = bytearray(frame)
+        frame[self._random.randrange(1, len(frame))] ^= 1 << self._random.randrange(8)
+        return bytes(frame)
+
+    async def async_handle_rtu(self, buffer: bytearray):
+        """Consume complete RTU requests from a buffer, yields response frames."""
+        while len(buffer) >= RTU_REQUEST_SIZE[FUNCTION_READ_HOLDING_REGISTERS]:
+            function = buffer[1]
+            if function == FUNCTION_WRITE_REGISTERS:
+                size = RTU_WRITE_REGISTERS_HEADER + buffer[6] + CRC_SIZE
+            else:
+                size = RTU_REQUEST_SIZE.get(function)
+            if size is None:
+                # unknown framing, resynchronise on the next request
+                buffer.clear()
+                return
+            if len(buffer) < size:
+                return
+            frame = bytes(buffer[:size])
+            del buffer[:size]
+            if crc16(frame[:-CRC_SIZE]) != frame[-CRC_SIZE:]:
+                _LOGGER.debug("Ignoring request with a bad CRC")
+                continue
+            response = await self.async_transact(frame[0], frame[1:-CRC_SIZE], size)
+            if response is not None:
+                body = bytes([frame[0]]) + response
+                yield self.garble(body + crc16(body))
+
+    def line_matches(self, fd) -> bool:
+        """Return True if the other end of a pty runs at the simulated speed.
+
+        Ptys carry no parity, so only the baud rate is checked.
+        """
+        if not self.baudrate:
+            return True
+        speed = termios.tcgetattr(fd)[4]
+        return speed == getattr(termios, "B{}".format(self.baudrate), None)
+
+    async def async_serve_pty(self) -> str:
+        """Serve RTU requests on a new pty pair, returns the device path."""
+        loop = asyncio.get_running_loop()
+        master, slave = os.openpty()
+        tty.setraw(master)
+        tty.setraw(slave)
+        os.set_blocking(master, False)
+        buffer = bytearray()
+        data_received = asyncio.Event()
+
+        def on_readable():
+            try:
+                buffer.extend(os.read(master, 1024))
+            except BlockingIOError:
+                return
+            data_received.set()
+
+        async def run():
+            while True:
+                await data_received.wait()
+                data_received.clear()
+                if not self.line_matches(master):
+                    # the modules only see framing errors
+                    buffer.clear()
+                    continue
+                async for response in self.async_handle_rtu(buffer):
+                    os.write(master, response)
+
+        loop.add_reader(master, on_readable)
+        self._pty_task = loop.create_task(run())
+        # keep the slave end open so the pty survives client reconnects
+        self._pty_slave = slave
+        return os.ttyname(slave)
+
+    async def async_serve_tcp(self, host="127.0.0.1", port=5020, framing="socket"):
+        """Serve Modbus TCP (``socket``) or RTU over TCP (``rtu``) requests."""
+
+        async def handle_socket(reader, writer):
+            try:
+                while True:
+                    header = await reader.readexactly(7)
+                    transaction, protocol, length, unit = struct.unpack(">HHHB", header)
+                    pdu = await reader.readexactly(length - 1)
+                    response = await self.async_transact(unit, pdu, len(pdu) + 7)
+                    if response is None:
+                        continue
+                    frame = struct.pack(
+                        ">HHHB", transaction, protocol, len(response) + 1, unit
+                    )
+                    writer.write(frame + self.garble(response))
+                    await writer.drain()
+            except (asyncio.IncompleteReadError, ConnectionError):
+                pass
+            finally:
+                writer.close()
+
+        async def handle_rtu(reader, writer):
+            buffer = bytearray()
+            try:
+                while data := await reader.read(1024):
+                    buffer.extend(data)
+                    async for response in self.async_handle_rtu(buffer):
+                        writer.write(response)
+                    await writer.drain()
+            except ConnectionError:
+                pass
+            finally:
+                writer.close()
+
+        return await asyncio.start_server(
+            handle_rtu if framing == "rtu" else handle_socket, host, port
+        )
+
+
+async def async_main(args):
+    """Run the simulator until interrupted."""
+    modules = [
+        SimulatedModule(unit, args.wireless, args.meters, args.valve_time)
+        for unit in args.unit or [NEPTUN_UNIT]
+    ]
+    simulator = Simulator(
+        modules,
+        latency=args.latency,
+        baudrate=args.baudrate,
+        drop_rate=args.drop,
+        garble_rate=args.garble,
+        seed=args.seed,
+    )
+    if args.pty:
+        print("Serial port: {}".format(await simulator.async_serve_pty()))
+    if args.tcp:
+        await simulator.async_serve_tcp(args.host, args.tcp, args.framing)
+        print("TCP port: {}:{} ({})".format(args.host, args.tcp, args.framing))
+    await asyncio.Event().wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pty", action="store_true", help="serve on a pty pair")
+    parser.add_argument("--tcp", type=int, metavar="PORT", help="serve on a TCP port")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--framing", choices=("socket", "rtu"), default="socket")
+    parser.add_argument("--unit", type=int, action="append", help="module unit id")
+    parser.add_argument("--wireless", type=int, default=0, help="wireless sensors")
+    parser.add_argument("--meters", type=int, default=0, help="meter counters")
+    parser.add_argument("--valve-time", type=float, default=0.0, help="seconds")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds")
+    parser.add_argument("--baudrate", type=int, help="simulate serial timing")
+    parser.add_argument("--drop", type=float, default=0.0, help="drop rate")
+    parser.add_argument("--garble", type=float, default=0.0, help="garble rate")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+    if not args.pty and not args.tcp:
+        parser.error("use --pty and/or --tcp")
+    logging.basicConfig(level=logging.INFO)
+    try:
+        asyncio.run(async_main(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""Register snapshots of Neptun hubs persisted across restarts."""
+from __future__ import annotations
+
+import logging
+
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.storage import Store
+
+from const import NEPTUN_DOMAIN
+
+_LOGGER = logging.getLogger(__name__)
+
+SNAPSHOT_STORAGE_KEY = NEPTUN_DOMAIN + ".snapshots"
+SNAPSHOT_STORAGE_VERSION = 1
+# seconds a changed snapshot may wait before it is written to disk
+SNAPSHOT_SAVE_DELAY = 30
+
+
+class SnapshotCache:
+    """Keeps the last register snapshot of every hub in HA storage.
+
+    Coordinators start from the cached snapshot, so entities have their
+    last known values right after a restart instead of being unknown until
+    the first poll. Changed snapshots are written at most once per
+    SNAPSHOT_SAVE_DELAY and on shutdown.
+    """
+
+    def __init__(self, hass: HomeAssistant):
+        """Initialize the cache."""
+        self._store = Store(hass, SNAPSHOT_STORAGE_VERSION, SNAPSHOT_STORAGE_KEY)
+        self._coordinators = {}
+        self._cached: dict = {}
+        self._save_pending = False
+
+    async def async_load(self):
+        """Read the cached snapshots."""
+        try:
+            self._cached = await self._store.async_load() or {}
+        except Exception as exception_error:  # pylint: disable=broad-except
+            _LOGGER.error(
+                "Cannot load the Neptun snapshots: {}".format(exception_error)
+            )
+            self._cached = {}
+
+    def attach(self, coordinator):
+        """Start a coordinator from its cached snapshot and keep it cached."""
+        self._coordinators[coordinator.name] = coordinator
+        cached = self._cached.get(coordinator.name)
+        if cached is not None and coordinator.restore(cached):
+            _LOGGER.debug(
+                "*** Hub {} restored from snapshot {}".format(
+                    coordinator.name, cached["version"]
+                )
+            )
+
+        @callback
+        def snapshot_updated() -> None:
+            if coordinator.changed and not self._save_pending:
+                self._save_pending = True
+                self._store.async_delay_save(self._data_to_save, SNAPSHOT_SAVE_DELAY)
+
+        return coordinator.async_add_listener(snapshot_updated)
+
+    @callback
+    def _data_to_save(self) -> dict:
+        self._save_pending = False
+        for name, coordinator in self._coordinators.items():
+            if coordinator.data is not None and not coordinator.stale:
+                self._cached[name] = coordinator.snapshot()
+        return self._cached
@@ -1,28 +1,33 @@
 """Support for Neptun valves."""
 from __future__ import annotations
-import asyncio
 
-from datetime import timedelta
-import datetime
 import logging
-from typing import AsyncContextManager
+import time
+from typing import Any, AsyncContextManager, Mapping
 
 from homeassistant.components.switch import SwitchEntity
 from homeassistant.const import (
     CONF_NAME,
+    STATE_CLOSING,
     STATE_ON,
+    STATE_OPENING,
 )
-from homeassistant.core import HomeAssistant, callback
-from homeassistant.helpers.event import async_track_time_interval
+from homeassistant.core import CALLBACK_TYPE, HomeAssistant, callback
+from homeassistant.helpers.event import async_call_later
 from homeassistant.helpers.restore_state import RestoreEntity
 from homeassistant.helpers.typing import ConfigType
 
 from .const import (
+    ATTR_VALVE_STATE,
     CONF_VALVES,
     NEPTUN_DOMAIN,
     REGISTER_STATUS,
+    VALVE_TRAVEL_TIME,
 )
+from .coordinator import NeptunCoordinator
+from .entity import NeptunEntity
 from .neptun import NeptunHub
+from .registers import FIELD_VALVES, STATUS
 from pymodbus.payload import BinaryPayloadBuilder, BinaryPayloadDecoder
 from pymodbus.constants import Endian
 
@@ -36,39 +41,52 @@ async def async_setup_platform(
     valves = []
 
     _LOGGER.debug("*** Initializing valves...")
-    hub: NeptunHub = hass.data[NEPTUN_DOMAIN][discovery_info[CONF_NAME]]
+    coordinator: NeptunCoordinator = hass.data[NEPTUN_DOMAIN][discovery_info[CONF_NAME]]
     for valveIndex, valveName in enumerate(discovery_info[CONF_VALVES]):
-        valve = NeptunValve(hub, valveName, valveIndex)
+        valve = NeptunValve(coordinator, valveName, valveIndex)
         valves.append(valve)
         _LOGGER.debug("*** Valve discovered: {}".format(valve.name))
     _LOGGER.debug("*** Adding valves: {}".format(valves))
     async_add_entities(valves)
 
 
-valveMasks = {0: 0b000100000000, 1: 0b001000000000}
+class NeptunValve(NeptunEntity, SwitchEntity, RestoreEntity):
+    """Base class representing a Neptun valve as a switch.
 
+    Turning a valve shows the requested state at once, marked as opening
+    or closing, and queues the write without waiting for it. The polls
+    that follow confirm it, and the state only rolls back when the valve
+    still disagrees once the motor had VALVE_TRAVEL_TIME to move.
+    """
 
-class NeptunValve(SwitchEntity, RestoreEntity):
-    """Base class representing a Neptun valve as a switch."""
-
-    def __init__(self, hub: NeptunHub, valveName: str, valveIndex: int):
+    def __init__(
+        self, coordinator: NeptunCoordinator, valveName: str, valveIndex: int
+    ):
         """Initialize the valve."""
-        self._hub: NeptunHub = hub
+        self._coordinator = coordinator
+        self._hub: NeptunHub = coordinator.hub
         self._name = valveName
         self._is_on = None
         self._available = True
-        self._scan_interval = timedelta(seconds=10)
-        self._command_mask = valveMasks[valveIndex]
+        self._field = FIELD_VALVES[valveIndex]
+        self._command_mask = STATUS.mask(self._field)
         self._currentValue = 0
+        # requested state until confirmed by a poll, and its deadline
+        self._pending: bool | None = None
+        self._confirm_by: float | None = None
+        self._unsub_confirm: CALLBACK_TYPE | None = None
 
     async def async_added_to_hass(self):
         """Handle entity which will be added."""
         state = await self.async_get_last_state()
         if state:
             self._is_on = state.state == STATE_ON
-        async_track_time_interval(
-            self.hass, self.async_update_by_timer, self._scan_interval
+        self.async_on_remove(
+            self._coordinator.async_add_listener(self._handle_coordinator_update)
         )
+        self.async_on_remove(self._cancel_confirm)
+        if self._coordinator.data is not None:
+            self._handle_coordinator_update()
 
     @property
     def is_on(self):
@@ -90,61 +108,99 @@ class NeptunValve(SwitchEntity, RestoreEntity):
         """Return True if entity is available."""
         return self._available
 
-    def turn_on(self, **kwargs):
+    @property
+    def assumed_state(self) -> bool:
+        """Return True while the state is not confirmed by the module."""
+        return self._pending is not None or super().assumed_state
+
+    @property
+    def extra_state_attributes(self) -> Mapping[str, Any] | None:
+        if self._pending is None:
+            return None
+        return {ATTR_VALVE_STATE: STATE_OPENING if self._pending else STATE_CLOSING}
+
+    async def async_turn_on(self, **kwargs):
         """Turn valve on."""
-        self.do_turn(True)
+        self._turn(True)
 
-    def turn_off(self, **kwargs):
+    async def async_turn_off(self, **kwargs):
         """Turn valve off."""
-        self.do_turn(False)
+        self._turn(False)
 
-    def do_turn(self, is_on):
-        """Turning a valve."""
+    @callback
+    def _turn(self, is_on):
+        """Show the requested state and queue the write."""
         _LOGGER.debug("*** Turning valve {}...".format(self.name))
-        asyncio.run_coroutine_threadsafe(self.async_update(), self.hass.loop).result()
-        if self._available:
-            if is_on:
-                command = self._currentValue | self._command_mask
-            else:
-                command = self._currentValue & ~self._command_mask
-            command = command & 0x1FFF  # only meaningful bits
-            _LOGGER.debug("*** Start writing value: {}".format(command))
-            # encoder = BinaryPayloadBuilder(byteorder=Endian.Big)
-            # encoder.add_16bit_uint(command)
-            # payload = encoder.to_registers()
-            result = self._hub.write_register(address=REGISTER_STATUS, value=command)
-            _LOGGER.debug("*** Result received: {}".format(result))
-            if result is False:
-                self._available = False
-                self.async_schedule_update_ha_state()
-            else:
-                self._available = True
-                self._is_on = is_on
-                self.async_schedule_update_ha_state()
-        else:
-            _LOGGER.warn(
+        if not self._available:
+            _LOGGER.warning(
                 "Cannot turn a valve {} when it is unavailable!".format(self.name)
             )
+            return
+        self._cancel_confirm()
+        self._pending = self._is_on = is_on
+        self._confirm_by = None
+        self.async_write_ha_state()
+        self.hass.async_create_task(self._async_write(is_on))
+
+    async def _async_write(self, is_on):
+        """Write the valve bit and schedule the read-back confirming it."""
+        # right after a poll the hub writes its register mirror back, a
+        # single transaction, otherwise it reads the status word first
+        if is_on:
+            result = await self._hub.async_set_bits(self._command_mask)
+        else:
+            result = await self._hub.async_clear_bits(self._command_mask)
+        _LOGGER.debug("*** Result received: {}".format(result))
+        if self._pending is not is_on:
+            # superseded by a newer command
+            return
+        if result is False:
+            self._pending = None
+            self._available = False
+            self.async_write_ha_state()
+            return
+        self._coordinator.async_command_sent()
+        self._confirm_by = time.monotonic() + VALVE_TRAVEL_TIME
+        self._unsub_confirm = async_call_later(
+            self.hass, VALVE_TRAVEL_TIME, self._async_read_back
+        )
+
+    async def _async_read_back(self, now=None):
+        """Poll the hub once the motor had the time to move the valve."""
+        self._unsub_confirm = None
+        # this poll decides, even if the timer fired a bit early
+        self._confirm_by = time.monotonic()
+        await self._coordinator.async_refresh()
 
-    async def async_update_by_timer(self, now: datetime | None = None) -> None:
-        await self.async_update()
+    @callback
+    def _cancel_confirm(self) -> None:
+        if self._unsub_confirm:
+            self._unsub_confirm()
+            self._unsub_confirm = None
 
     async def async_update(self):
         """Update the entity state."""
+        await self._coordinator.async_request_refresh()
+
+    @callback
+    def _handle_coordinator_update(self) -> None:
+        """Update the valve state from the hub snapshot."""
         _LOGGER.debug(">>> Updating valve: {}".format(self.name))
-        current = await self.hass.async_add_executor_job(
-            lambda: self._hub.read_holding_registers(REGISTER_STATUS)
-        )
-        if current is not None:
-            _LOGGER.debug("*** Received registers: {}".format(current))
-            # decoder = BinaryPayloadDecoder.fromRegisters(
-            #     current.registers, byteorder=Endian.Big
-            # )
-            # self._currentValue = decoder.decode_16bit_uint()
-            self._currentValue = current.registers[0]
-            self._is_on = (
-                self._currentValue & self._command_mask
-            ) == self._command_mask
+        if self._coordinator.last_update_success:
+            self._currentValue = self._coordinator.status
+            is_on = self._coordinator.decoded(REGISTER_STATUS)[self._field]
+            if self._pending is None or is_on == self._pending:
+                self._pending = None
+                self._cancel_confirm()
+                self._is_on = is_on
+            elif self._confirm_by is not None and time.monotonic() >= self._confirm_by:
+                _LOGGER.warning(
+                    "Valve {} did not turn {}, rolling back".format(
+                        self.name, "on" if self._pending else "off"
+                    )
+                )
+                self._pending = None
+                self._is_on = is_on
             self._available = True
             _LOGGER.debug(
                 "*** Current register value: {}, mask={}, valve '{}'={}".format(
@@ -153,8 +209,5 @@ class NeptunValve(SwitchEntity, RestoreEntity):
             )
         else:
             self._available = False
-            _LOGGER.warn(
-                "*** Cannot read current register value for {}!".format(self.name)
-            )
-        self.async_schedule_update_ha_state()
+        self.async_write_changed_state()
         _LOGGER.debug("<<< Valve {} updated".format(self.name))
@@ -0,0 +1,40 @@
+"""Helpers shared by the Neptun tests."""
+from homeassistant.core import HomeAssistant
+
+from neptun import NeptunHub
+
+
+def make_hass():
+    """Return a bare Home Assistant core running in the current loop."""
+    return HomeAssistant()
+
+
+async def serve(simulator, connection_type):
+    """Serve a simulator, returns the connection config reaching it."""
+    if connection_type == "serial":
+        port = await simulator.async_serve_pty()
+        return {"type": "serial", "port": port, "timeout": 1}
+    server = await simulator.async_serve_tcp(
+        port=0, framing="rtu" if connection_type == "rtuovertcp" else "socket"
+    )
+    return {
+        "type": connection_type,
+        "host": "127.0.0.1",
+        "port": server.sockets[0].getsockname()[1],
+        "timeout": 1,
+    }
+
+
+def make_hub(connection, unit, bus=None, name=None):
+    return NeptunHub(
+        {"name": name or "hub{}".format(unit), "unit": unit, "connection": connection},
+        bus,
+    )
+
+
+async def async_add_entity(hass, entity, entity_id):
+    """Add an entity to Home Assistant without an entity platform."""
+    entity.hass = hass
+    entity.entity_id = entity_id
+    await entity.async_added_to_hass()
+    return entity
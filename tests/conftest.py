@@ -0,0 +1,39 @@
+"""Fixtures shared by the Neptun tests."""
+import asyncio
+import importlib.util
+import inspect
+import os
+import sys
+import types
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# the integration modules import each other by their top-level names
+sys.path.insert(0, ROOT)
+
+# the platforms import their siblings relatively, as Home Assistant loads
+# them from custom_components/neptun
+sys.modules.setdefault("custom_components", types.ModuleType("custom_components"))
+_spec = importlib.util.spec_from_file_location(
+    "custom_components.neptun",
+    os.path.join(ROOT, "__init__.py"),
+    submodule_search_locations=[ROOT],
+)
+_integration = importlib.util.module_from_spec(_spec)
+sys.modules[_spec.name] = _integration
+_spec.loader.exec_module(_integration)
+
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_pyfunc_call(pyfuncitem):
+    """Run coroutine tests in a new event loop."""
+    if not inspect.iscoroutinefunction(pyfuncitem.obj):
+        return None
+    arguments = {
+        name: pyfuncitem.funcargs[name]
+        for name in pyfuncitem._fixtureinfo.argnames
+    }
+    asyncio.run(pyfuncitem.obj(**arguments))
+    return True
@@ -0,0 +1,46 @@
+"""Tests of the Neptun binary sensors fed by the polling coordinator."""
+from custom_components.neptun.binary_sensor import NeptunWirelessLeakSensor
+from custom_components.neptun.coordinator import NeptunCoordinator
+from custom_components.neptun.sensor import NeptunWirelessBatterySensor
+
+from common import async_add_entity, make_hass, make_hub, serve
+from registers import RegisterMap
+from simulator import SimulatedModule, Simulator
+
+
+async def test_wireless_sensors_share_one_read():
+    module = SimulatedModule(1, wireless_sensors=2)
+    connection = await serve(Simulator([module]), "tcp")
+    hass = make_hass()
+    hub = make_hub(connection, 1)
+    coordinator = NeptunCoordinator(
+        hass, hub, register_map=RegisterMap(wireless_sensors=3)
+    )
+    try:
+        for slot in range(3):
+            await async_add_entity(
+                hass,
+                NeptunWirelessLeakSensor(coordinator, "leak", slot),
+                "binary_sensor.leak_{}".format(slot),
+            )
+        battery = await async_add_entity(
+            hass,
+            NeptunWirelessBatterySensor(coordinator, "leak", 1),
+            "sensor.leak_1_battery",
+        )
+        # the first listener starts the polls
+        await hass.async_block_till_done()
+        assert module.reads == 1
+        module.set_wireless(1, leak=True, battery=20)
+        await coordinator.async_refresh()
+        assert module.reads == 2
+        assert [
+            hass.states.get("binary_sensor.leak_{}".format(slot)).state
+            for slot in range(3)
+        ] == ["off", "on", "unavailable"]
+        assert hass.states.get(battery.entity_id).state == "20"
+        module.set_wireless(0, lost=True)
+        await coordinator.async_refresh()
+        assert hass.states.get("binary_sensor.leak_0").state == "unavailable"
+    finally:
+        await hub.async_close()
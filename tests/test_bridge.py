@@ -0,0 +1,146 @@
+"""Tests of the MQTT bridge against a stand-in for the paho client."""
+import asyncio
+from types import SimpleNamespace
+
+import paho.mqtt.client as mqtt
+
+from bridge import PAYLOAD_ONLINE, CommandQueue, MqttClient
+
+CONFIG = {
+    "host": "broker",
+    "port": 1883,
+    "user": "user",
+    "password": "secret",
+    "topic_prefix": "neptun",
+}
+
+
+class FakeClient:
+    """Records what the bridge hands to paho instead of talking to a broker."""
+
+    def __init__(self):
+        """Initialize the client."""
+        self.published = []
+        self.subscriptions = []
+        self.rc = mqtt.MQTT_ERR_SUCCESS
+
+    def username_pw_set(self, username, password):
+        pass
+
+    def max_queued_messages_set(self, size):
+        pass
+
+    def will_set(self, topic, payload, qos=0, retain=False):
+        pass
+
+    def connect_async(self, host, port):
+        pass
+
+    def loop_start(self):
+        pass
+
+    def loop_stop(self):
+        pass
+
+    def disconnect(self):
+        pass
+
+    def subscribe(self, topics):
+        self.subscriptions.extend(topics)
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        if self.rc == mqtt.MQTT_ERR_SUCCESS:
+            self.published.append((topic, payload))
+        return SimpleNamespace(rc=self.rc)
+
+
+def make_bridge(**config):
+    bridge = MqttClient({**CONFIG, **config}, client_factory=FakeClient)
+    return bridge, bridge._client
+
+
+def connect(bridge, client):
+    bridge._on_connect(client, None, {}, mqtt.CONNACK_ACCEPTED)
+
+
+def hub_state(alarm="off", valve="on"):
+    return {"available": PAYLOAD_ONLINE, "alarm": alarm, "valve/1": valve}
+
+
+def test_only_changes_are_published():
+    bridge, client = make_bridge()
+    connect(bridge, client)
+    client.published.clear()
+    bridge.publish_hub_state("kitchen", hub_state())
+    assert len(client.published) == 3
+    client.published.clear()
+    bridge.publish_hub_state("kitchen", hub_state())
+    assert client.published == []
+    bridge.publish_hub_state("kitchen", hub_state(alarm="on"))
+    assert client.published == [("neptun/kitchen/alarm", "on")]
+
+
+def test_offline_buffer_is_bounded_and_flushed():
+    bridge, client = make_bridge(buffer_size=2)
+    bridge.publish_hub_state("kitchen", hub_state())
+    bridge.publish_hub_state("kitchen", {"alarm": "on"})
+    assert client.published == []
+    # the oldest topic was dropped, the alarm keeps its latest payload only
+    assert bridge.buffered == 2
+    assert bridge.dropped == 1
+    connect(bridge, client)
+    assert bridge.buffered == 0
+    assert client.published[-2:] == [
+        ("neptun/kitchen/valve/1", "on"),
+        ("neptun/kitchen/alarm", "on"),
+    ]
+    # the dropped topic is sent again by the next cycle
+    client.published.clear()
+    bridge.publish_hub_state("kitchen", hub_state(alarm="on"))
+    assert client.published == [("neptun/kitchen/available", PAYLOAD_ONLINE)]
+
+
+def test_refused_messages_are_buffered():
+    bridge, client = make_bridge()
+    connect(bridge, client)
+    client.rc = mqtt.MQTT_ERR_QUEUE_SIZE
+    bridge.publish_hub_state("kitchen", hub_state())
+    assert bridge.buffered == 3
+    client.rc = mqtt.MQTT_ERR_SUCCESS
+    connect(bridge, client)
+    assert bridge.buffered == 0
+
+
+async def test_commands_are_collapsed():
+    queue = CommandQueue(maxsize=2)
+    queue.put("kitchen", ("valve", 1), True, 1.0)
+    queue.put("kitchen", ("valve", 1), False, 2.0)
+    assert len(queue) == 1
+    assert queue.collapsed == 1
+    queue.put("kitchen", ("valve", 2), True, 3.0)
+    queue.put("kitchen", ("config", "floor_washing"), True, 4.0)
+    assert queue.rejected == 1
+    # all valves supersede the single valve commands of the hub
+    queue.put("kitchen", ("valves",), False, 5.0)
+    assert len(queue) == 1
+    assert await queue.get() == ("kitchen", ("valves",), False, 5.0)
+
+
+async def test_retained_commands_are_ignored():
+    bridge, client = make_bridge()
+    bridge._coordinators["kitchen"] = None
+    bridge._hass = SimpleNamespace(loop=asyncio.get_running_loop())
+
+    def message(retain):
+        return SimpleNamespace(
+            topic="neptun/kitchen/valve/1/set", payload=b"off", retain=retain
+        )
+
+    bridge._on_message(client, None, message(retain=True))
+    await asyncio.sleep(0)
+    assert len(bridge.commands) == 0
+    bridge._on_message(client, None, message(retain=False))
+    await asyncio.sleep(0)
+    assert len(bridge.commands) == 1
+    hub_name, target, value, _ = await bridge.commands.get()
+    assert (hub_name, target, value) == ("kitchen", ("valve", 1), False)
@@ -0,0 +1,90 @@
+"""Tests of the shared Modbus bus against the simulated modules."""
+import asyncio
+
+import pytest
+
+from bus import BREAKER_THRESHOLD, CircuitOpen, NeptunBus
+from common import make_hub, serve
+from const import PRIORITY_POLL, PRIORITY_SAFETY, REGISTER_STATUS
+from registers import FIELD_VALVES, STATUS
+from simulator import SimulatedModule, Simulator
+
+
+async def test_hubs_share_a_bus():
+    modules = [SimulatedModule(1), SimulatedModule(2)]
+    modules[1].registers[REGISTER_STATUS] = STATUS.mask(FIELD_VALVES[0])
+    connection = await serve(Simulator(modules, latency=0.01), "tcp")
+    bus = NeptunBus(connection)
+    hubs = [make_hub(connection, 1, bus), make_hub(connection, 2, bus)]
+    try:
+        results = await asyncio.gather(
+            *(hub.async_read_holding_registers(REGISTER_STATUS) for hub in hubs)
+        )
+        assert [result.registers for result in results] == [
+            [module.status] for module in modules
+        ]
+        assert bus.metrics.unit(1).requests == bus.metrics.unit(2).requests == 1
+    finally:
+        for hub in hubs:
+            await hub.async_close()
+
+
+async def test_close_fails_the_request_in_flight():
+    connection = await serve(Simulator([SimulatedModule(1)], latency=5), "tcp")
+    connection["timeout"] = 10
+    hub = make_hub(connection, 1)
+    read = asyncio.ensure_future(hub.async_read_holding_registers(REGISTER_STATUS))
+    await asyncio.sleep(0.2)
+    await hub.async_close()
+    assert await asyncio.wait_for(read, 1) is None
+
+
+async def test_safety_requests_go_first():
+    connection = await serve(Simulator([SimulatedModule(1)], latency=0.02), "tcp")
+    bus = NeptunBus(connection)
+    bus.acquire()
+    order = []
+
+    async def execute(label, priority):
+        await bus.async_execute(
+            1, "read_holding_registers", REGISTER_STATUS, 1, priority=priority
+        )
+        order.append(label)
+
+    try:
+        polls = [
+            asyncio.ensure_future(execute("poll", PRIORITY_POLL)) for _ in range(5)
+        ]
+        await asyncio.sleep(0)
+        await execute("safety", PRIORITY_SAFETY)
+        await asyncio.gather(*polls)
+        # only the poll already on the wire is served before the safety request
+        assert order.index("safety") <= 1
+    finally:
+        await bus.async_close()
+
+
+async def test_breaker_fails_queued_requests():
+    connection = await serve(Simulator([SimulatedModule(1)]), "tcp")
+    connection["timeout"] = 0.2
+    bus = NeptunBus(connection)
+    bus.acquire()
+    try:
+        results = await asyncio.gather(
+            *(
+                bus.async_execute(9, "read_holding_registers", REGISTER_STATUS, 1)
+                for _ in range(BREAKER_THRESHOLD + 5)
+            ),
+            return_exceptions=True,
+        )
+        assert bus.metrics.unit(9).timeouts == BREAKER_THRESHOLD
+        assert all(isinstance(result, CircuitOpen) for result in results[-5:])
+        with pytest.raises(CircuitOpen):
+            await bus.async_execute(9, "read_holding_registers", REGISTER_STATUS, 1)
+        # the other units keep using the bus
+        result = await bus.async_execute(
+            1, "read_holding_registers", REGISTER_STATUS, 1
+        )
+        assert not result.isError()
+    finally:
+        await bus.async_close()
@@ -0,0 +1,75 @@
+"""Tests of the polling coordinator against the simulated modules."""
+from datetime import timedelta
+
+from common import make_hass, make_hub, serve
+from const import REGISTER_STATUS
+from coordinator import NeptunCoordinator
+from registers import FIELD_VALVES, STATUS, RegisterMap
+from simulator import SimulatedModule, Simulator
+
+VALVES = STATUS.mask(*FIELD_VALVES)
+# one of the two alarm zones
+ZONE_ALARM = 0b010
+
+
+async def test_alarm_closes_the_valves_with_one_write():
+    module = SimulatedModule(1)
+    module.registers[REGISTER_STATUS] = VALVES
+    connection = await serve(Simulator([module]), "tcp")
+    hass = make_hass()
+    hub = make_hub(connection, 1)
+    coordinator = NeptunCoordinator(hass, hub, close_on_alarm=(1, 2))
+    try:
+        await coordinator.async_refresh()
+        module.registers[REGISTER_STATUS] |= ZONE_ALARM
+        await coordinator.async_refresh()
+        await hass.async_block_till_done()
+        # the poll seeing the alarm and the write closing the valves
+        assert (module.reads, module.writes) == (2, 1)
+        assert module.status == ZONE_ALARM
+        assert hub.metrics.alarm_response.count == 1
+    finally:
+        await hub.async_close()
+
+
+async def test_interval_adapts_to_the_hub():
+    module = SimulatedModule(1, meters=1)
+    connection = await serve(Simulator([module]), "tcp")
+    hub = make_hub(connection, 1)
+    coordinator = NeptunCoordinator(
+        make_hass(),
+        hub,
+        scan_interval=timedelta(seconds=8),
+        register_map=RegisterMap(meters=1),
+    )
+    try:
+        intervals = []
+        for _ in range(5):
+            await coordinator.async_refresh()
+            intervals.append(coordinator.interval)
+        assert intervals == [1, 2, 4, 8, 8]
+        # water flowing moves the meter, not the status word
+        module.add_consumption(0, 10)
+        await coordinator.async_refresh()
+        assert coordinator.interval == 8
+        module.registers[REGISTER_STATUS] = VALVES
+        await coordinator.async_refresh()
+        assert coordinator.interval == 1
+    finally:
+        await hub.async_close()
+
+
+async def test_failed_polls_back_off():
+    connection = await serve(Simulator([SimulatedModule(1)]), "tcp")
+    connection["timeout"] = 0.1
+    hub = make_hub(connection, 9)
+    coordinator = NeptunCoordinator(make_hass(), hub)
+    try:
+        intervals = []
+        for _ in range(3):
+            await coordinator.async_refresh()
+            intervals.append(coordinator.interval)
+        assert intervals == [2, 4, 8]
+        assert not coordinator.last_update_success
+    finally:
+        await hub.async_close()
@@ -0,0 +1,24 @@
+"""Tests of the bus discovery against a simulated serial line."""
+from discovery import async_discover
+from simulator import SimulatedModule, Simulator
+
+
+async def test_discovery_finds_the_line_setting_and_units():
+    simulator = Simulator([SimulatedModule(3), SimulatedModule(17)], baudrate=19200)
+    port = await simulator.async_serve_pty()
+    result = await async_discover(
+        port,
+        baudrates=(38400, 19200, 9600),
+        parities=("N",),
+        probe_units=(3,),
+        units=range(1, 20),
+    )
+    assert (result.baudrate, result.parity, result.units) == (19200, "N", [3, 17])
+    assert result.as_dict()["assumed"] == ["bytesize", "stopbits"]
+
+
+async def test_discovery_without_answer():
+    simulator = Simulator([SimulatedModule(3)], baudrate=19200)
+    port = await simulator.async_serve_pty()
+    assert await async_discover(port, baudrates=(9600,), parities=("N",)) is None
+    assert await async_discover("/dev/does-not-exist", parities=("N",)) is None
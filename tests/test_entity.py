@@ -0,0 +1,34 @@
+"""Tests of the delta-only state writes of the Neptun entities."""
+from custom_components.neptun.binary_sensor import NeptunHubSensor
+from custom_components.neptun.coordinator import NeptunCoordinator
+
+from common import async_add_entity, make_hass, make_hub, serve
+from const import REGISTER_STATUS
+from registers import FIELD_ALARM, STATUS, RegisterMap
+from simulator import SimulatedModule, Simulator
+
+
+async def test_unchanged_state_is_not_written():
+    module = SimulatedModule(1, meters=1)
+    connection = await serve(Simulator([module]), "tcp")
+    hass = make_hass()
+    hub = make_hub(connection, 1)
+    coordinator = NeptunCoordinator(hass, hub, register_map=RegisterMap(meters=1))
+    try:
+        sensor = await async_add_entity(
+            hass, NeptunHubSensor(coordinator), "binary_sensor.hub"
+        )
+        # the first listener starts the polls
+        await hass.async_block_till_done()
+        written = hass.states.get(sensor.entity_id)
+        # the sensor follows every change but shows nothing of the meters
+        module.add_consumption(0, 10)
+        await coordinator.async_refresh()
+        assert hub.metrics.suppressed_writes == 1
+        assert hass.states.get(sensor.entity_id) is written
+        module.registers[REGISTER_STATUS] = STATUS.mask(FIELD_ALARM)
+        await coordinator.async_refresh()
+        assert hub.metrics.suppressed_writes == 1
+        assert hass.states.get(sensor.entity_id).state == "on"
+    finally:
+        await hub.async_close()
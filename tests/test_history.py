@@ -0,0 +1,48 @@
+"""Tests of the meter consumption history."""
+import sys
+from types import SimpleNamespace
+
+from custom_components.neptun.history import MeterHistory, NeptunMeterStatistics
+from registers import FIELD_VALUE
+
+
+def test_full_history_folds_the_oldest_sample():
+    history = MeterHistory(size=3)
+    for second, litres in enumerate((1, 2, 3, 4)):
+        history.append(float(second), litres)
+    assert len(history) == 3
+    assert history.total == 10
+    assert list(history.drain()) == [(1.0, 3), (2.0, 3), (3.0, 4)]
+    assert len(history) == 0
+
+
+def test_flush_imports_the_buffered_consumption(monkeypatch):
+    imported = []
+    # stands in for the recorder, which the flush imports lazily
+    recorder = SimpleNamespace(
+        async_add_external_statistics=lambda hass, metadata, statistics: (
+            imported.append((metadata, statistics))
+        )
+    )
+    monkeypatch.setitem(sys.modules, "homeassistant.components.recorder", recorder)
+    monkeypatch.setitem(
+        sys.modules, "homeassistant.components.recorder.statistics", recorder
+    )
+    readings = {}
+    coordinator = SimpleNamespace(
+        last_update_success=True, decoded=lambda address: readings
+    )
+    meter = NeptunMeterStatistics(None, coordinator, "Cold water", 0)
+    meter._sum = 1000.0
+    # a counter going backwards was replaced and starts from zero
+    for reading in (500, 700, 1200, 300):
+        readings[FIELD_VALUE] = reading
+        meter._handle_coordinator_update()
+    meter.async_flush()
+    (metadata, statistics), = imported
+    assert metadata["statistic_id"] == "neptun:cold_water"
+    assert statistics[-1]["state"] == 0.3
+    assert statistics[-1]["sum"] == 1 + (200 + 500 + 300) / 1000
+    # nothing buffered, nothing imported
+    meter.async_flush()
+    assert len(imported) == 1
@@ -0,0 +1,76 @@
+"""Tests of the Neptun hub commands against the simulated modules."""
+import asyncio
+
+from common import make_hub, serve
+from const import REGISTER_METER_COUNTERS, REGISTER_STATUS
+from registers import FIELD_VALVES, STATUS
+from simulator import SimulatedModule, Simulator
+
+VALVES = STATUS.mask(*FIELD_VALVES)
+
+
+async def test_polled_mirror_saves_the_read():
+    module = SimulatedModule(1)
+    module.registers[REGISTER_STATUS] = VALVES
+    connection = await serve(Simulator([module]), "tcp")
+    hub = make_hub(connection, 1)
+    try:
+        # each command is a single write right after a poll
+        for command in (
+            lambda: hub.async_close_valve(1),
+            lambda: hub.async_set_config_attribute("keyboard_locked", True),
+        ):
+            assert await hub.async_read_holding_registers(REGISTER_STATUS)
+            sent = hub.metrics.requests
+            assert await command()
+            assert hub.metrics.requests == sent + 1
+        assert STATUS.decode(module.status)["keyboard_locked"]
+        assert module.status & VALVES == VALVES & ~hub.valve_mask(1)
+    finally:
+        await hub.async_close()
+
+
+async def test_command_does_not_undo_a_leak():
+    module = SimulatedModule(1)
+    connection = await serve(Simulator([module]), "tcp")
+    hub = make_hub(connection, 1)
+    try:
+        assert await hub.async_open_all_valves()
+        module.raise_alarm()
+        assert await hub.async_set_config_attribute("floor_washing", True)
+        assert module.status & VALVES == 0
+        assert STATUS.decode(module.status)["alarm"]
+    finally:
+        await hub.async_close()
+
+
+async def test_register_transaction():
+    module = SimulatedModule(1, meters=8)
+    connection = await serve(Simulator([module]), "tcp")
+    hub = make_hub(connection, 1)
+    try:
+        counters = {slot: 100000 * slot + 7 for slot in range(8)}
+        assert await hub.async_set_meter_counters(counters)
+        # one FC16 write and one read-back
+        assert hub.metrics.requests == 2
+        for slot, litres in counters.items():
+            register = REGISTER_METER_COUNTERS + 2 * slot
+            high, low = module.registers[register : register + 2]
+            assert (high << 16) | low == litres
+    finally:
+        await hub.async_close()
+
+
+async def test_concurrent_reads_are_coalesced():
+    module = SimulatedModule(1)
+    connection = await serve(Simulator([module], latency=0.02), "tcp")
+    hub = make_hub(connection, 1)
+    try:
+        results = await asyncio.gather(
+            hub.async_read_holding_registers(REGISTER_STATUS, 10),
+            *(hub.async_read_holding_registers(REGISTER_STATUS) for _ in range(5)),
+        )
+        assert module.reads == 1
+        assert all(result.registers[0] == module.status for result in results)
+    finally:
+        await hub.async_close()
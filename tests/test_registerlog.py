@@ -0,0 +1,22 @@
+"""Tests of the register change log."""
+from registerlog import RegisterLog
+
+
+def test_full_log_overwrites_the_oldest_change():
+    log = RegisterLog(size=4)
+    for second in range(6):
+        log.append(float(second), 57, second)
+    assert len(log) == 4
+    assert [word for _, _, word in log.query()] == [2, 3, 4, 5]
+
+
+def test_query_returns_the_changes_in_a_time_range():
+    log = RegisterLog(size=5)
+    # wrapped twice, the oldest change sits in the middle of the arrays
+    for second in range(12):
+        log.append(float(second), 0, second)
+    assert [word for _, _, word in log.query(8.0, 10.0)] == [8, 9]
+    assert [word for _, _, word in log.query(start=9.5)] == [10, 11]
+    assert [word for _, _, word in log.query(end=8.0)] == [7]
+    assert list(log.query(20.0)) == []
+    assert list(RegisterLog().query(0.0, 1.0)) == []
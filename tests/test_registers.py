@@ -0,0 +1,57 @@
+"""Tests of the declarative register map."""
+from const import REGISTER_STATUS, REGISTER_WIRELESS_COUNT
+from registers import (
+    FIELD_ALARM,
+    FIELD_BATTERY,
+    FIELD_LEAK,
+    FIELD_SIGNAL,
+    FIELD_VALUE,
+    FIELD_VALVES,
+    METER_COUNTER,
+    STATUS,
+    WIRELESS_SENSOR,
+    RegisterMap,
+    meter_register,
+    wireless_sensor_register,
+)
+
+
+def test_layout_decode_and_encode():
+    word = WIRELESS_SENSOR.encode(0, leak=True, signal=3, battery=87)
+    values = WIRELESS_SENSOR.decode(word)
+    assert values[FIELD_LEAK] is True
+    assert (values[FIELD_SIGNAL], values[FIELD_BATTERY]) == (3, 87)
+    assert not values["lost"]
+    # decoded bit fields are cached and cannot be changed by a caller
+    assert WIRELESS_SENSOR.decode(word) is values
+    assert WIRELESS_SENSOR.encode(word, leak=False, signal=0) == 87 << 8
+    assert METER_COUNTER.words(0x12345678) == (0x1234, 0x5678)
+
+
+def test_status_encode_replaces_one_field():
+    status = STATUS.mask(FIELD_ALARM, FIELD_VALVES[1])
+    status = STATUS.encode(status, **{FIELD_VALVES[0]: True})
+    assert status == STATUS.mask(FIELD_ALARM, *FIELD_VALVES)
+    assert STATUS.encode(0xFFFF, **{FIELD_VALVES[1]: False}) == (
+        STATUS.write_mask & ~STATUS.mask(FIELD_VALVES[1])
+    )
+
+
+def test_register_map_decodes_only_what_changed():
+    register_map = RegisterMap(wireless_sensors=2, meters=1)
+    data = [0] * register_map.register_count
+    meter = meter_register(0) - REGISTER_STATUS
+    data[meter : meter + 2] = METER_COUNTER.words(70000)
+    values = register_map.decode(data)
+    assert set(values) == {
+        REGISTER_STATUS,
+        REGISTER_WIRELESS_COUNT,
+        wireless_sensor_register(0),
+        wireless_sensor_register(1),
+        meter_register(0),
+    }
+    assert values[meter_register(0)][FIELD_VALUE] == 70000
+    # the low word of a counter maps to the register it is a part of
+    changed = register_map.decode(data, {REGISTER_STATUS + meter + 1})
+    assert set(changed) == {meter_register(0)}
+    assert register_map.decode(data, set()) == {}
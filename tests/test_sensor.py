@@ -0,0 +1,34 @@
+"""Tests of the Neptun sensors fed by the polling coordinator."""
+import asyncio
+from datetime import timedelta
+
+from custom_components.neptun import sensor
+from custom_components.neptun.coordinator import NeptunCoordinator
+
+from common import make_hass, make_hub, serve
+from registers import RegisterMap
+from simulator import SimulatedModule, Simulator
+
+
+async def test_meter_reading_is_written_once_per_interval(monkeypatch):
+    monkeypatch.setattr(sensor, "METER_FLUSH_INTERVAL", timedelta(seconds=0.2))
+    module = SimulatedModule(1, meters=1)
+    connection = await serve(Simulator([module]), "tcp")
+    hass = make_hass()
+    hub = make_hub(connection, 1)
+    coordinator = NeptunCoordinator(hass, hub, register_map=RegisterMap(meters=1))
+    meter = sensor.NeptunMeterSensor(coordinator, "meter", 0)
+    meter.hass = hass
+    meter.entity_id = "sensor.meter"
+    try:
+        await coordinator.async_refresh()
+        await meter.async_added_to_hass()
+        assert hass.states.get("sensor.meter").state == "0.0"
+        for _ in range(3):
+            module.add_consumption(0, 5)
+            await coordinator.async_refresh()
+        assert hass.states.get("sensor.meter").state == "0.0"
+        await asyncio.sleep(0.3)
+        assert hass.states.get("sensor.meter").state == "0.015"
+    finally:
+        await hub.async_close()
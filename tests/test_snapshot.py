@@ -0,0 +1,65 @@
+"""Tests of the warm start from cached register snapshots."""
+import asyncio
+
+from custom_components.neptun.binary_sensor import NeptunHubSensor
+from custom_components.neptun.coordinator import NeptunCoordinator
+
+from common import async_add_entity, make_hass, make_hub, serve
+from const import REGISTER_STATUS
+from registers import FIELD_VALVES, STATUS
+from simulator import SimulatedModule, Simulator
+import snapshot
+
+VALVES = STATUS.mask(*FIELD_VALVES)
+
+
+async def test_restored_snapshot_is_stale_until_polled():
+    module = SimulatedModule(1)
+    module.registers[REGISTER_STATUS] = VALVES
+    connection = await serve(Simulator([module]), "tcp")
+    hass = make_hass()
+    hub = make_hub(connection, 1)
+    coordinator = NeptunCoordinator(hass, hub)
+    try:
+        assert not coordinator.restore({"registers": [VALVES, 0], "version": 3})
+        assert coordinator.restore({"registers": [VALVES], "version": 3})
+        assert coordinator.stale and coordinator.status == VALVES
+        sensor = await async_add_entity(
+            hass, NeptunHubSensor(coordinator), "binary_sensor.hub"
+        )
+        assert hass.states.get(sensor.entity_id).attributes["assumed_state"]
+        # nothing changed, the first poll still clears the assumed state
+        await coordinator.async_refresh()
+        assert not coordinator.stale and not coordinator.changed
+        assert "assumed_state" not in hass.states.get(sensor.entity_id).attributes
+        assert coordinator.version == 3
+    finally:
+        await hub.async_close()
+
+
+async def test_snapshot_survives_a_restart(tmp_path, monkeypatch):
+    monkeypatch.setattr(snapshot, "SNAPSHOT_SAVE_DELAY", 0)
+    module = SimulatedModule(1)
+    module.registers[REGISTER_STATUS] = VALVES
+    connection = await serve(Simulator([module]), "tcp")
+    hass = make_hass()
+    hass.config.config_dir = str(tmp_path)
+    hub = make_hub(connection, 1)
+    try:
+        cache = snapshot.SnapshotCache(hass)
+        await cache.async_load()
+        coordinator = NeptunCoordinator(hass, hub)
+        cache.attach(coordinator)
+        await coordinator.async_refresh()
+        await asyncio.sleep(0.1)
+        await hass.async_block_till_done()
+        # a new cache reads what the first one saved
+        cache = snapshot.SnapshotCache(hass)
+        await cache.async_load()
+        restarted = NeptunCoordinator(hass, hub)
+        cache.attach(restarted)
+        assert restarted.stale
+        assert restarted.data == coordinator.data
+        assert restarted.version == coordinator.version
+    finally:
+        await hub.async_close()
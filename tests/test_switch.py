@@ -0,0 +1,69 @@
+"""Tests of the Neptun valve switches fed by the polling coordinator."""
+import asyncio
+
+from homeassistant.helpers import restore_state
+
+from custom_components.neptun import switch
+from custom_components.neptun.coordinator import NeptunCoordinator
+
+from common import async_add_entity, make_hass, make_hub, serve
+from simulator import SimulatedModule, Simulator
+
+
+async def make_valve(tmp_path, module):
+    """Return a hub polled by a coordinator and the switch of its first valve."""
+    connection = await serve(Simulator([module]), "tcp")
+    hass = make_hass()
+    hass.config.config_dir = str(tmp_path)
+    await restore_state.async_load(hass)
+    hub = make_hub(connection, 1)
+    coordinator = NeptunCoordinator(hass, hub)
+    await coordinator.async_refresh()
+    valve = await async_add_entity(
+        hass, switch.NeptunValve(coordinator, "valve", 0), "switch.valve"
+    )
+    return hub, valve
+
+
+async def test_turning_shows_the_state_until_confirmed(tmp_path):
+    module = SimulatedModule(1, valve_time=0.3)
+    hub, valve = await make_valve(tmp_path, module)
+    hass = valve.hass
+    try:
+        assert hass.states.get("switch.valve").state == "off"
+        await valve.async_turn_on()
+        # shown before the write reached the module
+        state = hass.states.get("switch.valve")
+        assert state.state == "on"
+        assert state.attributes["valve_state"] == "opening"
+        assert state.attributes["assumed_state"]
+        await hass.async_block_till_done()
+        await valve._coordinator.async_refresh()
+        assert hass.states.get("switch.valve").attributes["valve_state"] == "opening"
+        await asyncio.sleep(0.4)
+        await valve._coordinator.async_refresh()
+        state = hass.states.get("switch.valve")
+        assert state.state == "on"
+        assert "valve_state" not in state.attributes
+    finally:
+        await hub.async_close()
+
+
+async def test_valve_that_does_not_move_rolls_back(tmp_path, monkeypatch):
+    monkeypatch.setattr(switch, "VALVE_TRAVEL_TIME", 0.2)
+    # the motor does not get there in time
+    module = SimulatedModule(1, valve_time=10)
+    hub, valve = await make_valve(tmp_path, module)
+    hass = valve.hass
+    try:
+        await valve.async_turn_on()
+        await valve._coordinator.async_refresh()
+        assert hass.states.get("switch.valve").state == "on"
+        # the read-back once the valve had the time to move decides
+        await asyncio.sleep(0.3)
+        await hass.async_block_till_done()
+        state = hass.states.get("switch.valve")
+        assert state.state == "off"
+        assert "valve_state" not in state.attributes
+    finally:
+        await hub.async_close()
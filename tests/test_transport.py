@@ -0,0 +1,24 @@
+"""Tests of the Neptun transports against the simulated modules."""
+import pytest
+
+from common import make_hub, serve
+from const import REGISTER_STATUS
+from registers import FIELD_VALVES, STATUS
+from simulator import SimulatedModule, Simulator
+
+VALVES = STATUS.mask(*FIELD_VALVES)
+
+
+@pytest.mark.parametrize("connection_type", ["serial", "tcp", "rtuovertcp"])
+async def test_read_and_write(connection_type):
+    module = SimulatedModule(1)
+    connection = await serve(Simulator([module]), connection_type)
+    hub = make_hub(connection, 1)
+    try:
+        assert await hub.async_open_all_valves()
+        assert module.status & VALVES == VALVES
+        result = await hub.async_read_holding_registers(REGISTER_STATUS)
+        assert result.registers == [module.status]
+        assert hub.status == module.status
+    finally:
+        await hub.async_close()